@@ -6,3 +6,10 @@ def pytest_collection_modifyitems(items):
     """Allow all tests to use the Django DB."""
     for item in items:
         item.add_marker(pytest.mark.django_db)
+
+
+@pytest.fixture(autouse=True)
+def no_snapshot(monkeypatch):
+    """Build the pages from the test DB, not a snapshot left on disk."""
+    from weather_maniac import settings
+    monkeypatch.setattr(settings, 'WM_SNAPSHOT_PATH', '')
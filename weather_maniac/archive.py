@@ -0,0 +1,159 @@
+"""Weather Maniac packed archive.
+
+Rather than one file per scrape, each archive directory holds one segment
+  per month:  YYYY_MM.pack, the scraped contents gzipped one record after
+  another, and YYYY_MM.idx, a line of 'stamp,offset,length' per record.
+Records are appended, so the index is in time order and a segment only ever
+  grows.  The index line is written after the record, so an interrupted
+  append leaves nothing half-indexed.  The loader and the watcher may append
+  at once, so each append holds an exclusive lock (flock) on the pack file
+  from finding its offset to writing its index line.
+Stamps are the loader's '%Y_%m_%d_%H_%M' strings, which sort by time.
+"""
+
+import collections
+import gzip
+import os
+
+try:
+    import fcntl
+except ImportError:     # No fcntl on Windows; appends are then unlocked
+    fcntl = None
+
+PACK_EXT = '.pack'
+INDEX_EXT = '.idx'
+
+Entry = collections.namedtuple('Entry', ['stamp', 'segment', 'offset',
+                                         'length'])
+
+
+def _get_segment(path, stamp):
+    """Segment file name (without extension) holding the stamp's month.
+
+    >>> _get_segment('/arch', '2016_07_24_10_10')
+    '/arch/2016_07'
+    """
+    return os.path.join(path, stamp[:7])
+
+
+def append_record(path, stamp, contents):
+    """Add one scrape (str or bytes) to its month's segment.
+
+    >>> import tempfile
+    >>> path = tempfile.mkdtemp()
+    >>> append_record(path, '2016_07_24_10_10', '<div>one</div>')
+    >>> append_record(path, '2016_07_25_10_10', b'<div>two</div>')
+    >>> sorted(os.listdir(path))
+    ['2016_07.idx', '2016_07.pack']
+    """
+    if isinstance(contents, str):
+        contents = contents.encode('utf-8')
+    data = gzip.compress(contents)
+    segment = _get_segment(path, stamp)
+    with open(segment + PACK_EXT, 'ab') as pack_file:
+        if fcntl is not None:
+            fcntl.flock(pack_file, fcntl.LOCK_EX)
+        offset = pack_file.seek(0, os.SEEK_END)
+        pack_file.write(data)
+        pack_file.flush()
+        with open(segment + INDEX_EXT, 'a') as index_file:
+            index_file.write('{},{},{}\n'.format(stamp, offset, len(data)))
+
+
+def read_index(segment):
+    """List the Entries of one segment, skipping any torn index line."""
+    entries = []
+    with open(segment + INDEX_EXT) as index_file:
+        for line in index_file:
+            fields = line.rstrip('\n').split(',')
+            if len(fields) == 3 and fields[1].isdigit() and \
+                    fields[2].isdigit():
+                entries.append(Entry(fields[0], segment, int(fields[1]),
+                                     int(fields[2])))
+    return entries
+
+
+def get_segments(path):
+    """List the segments in a directory, oldest first."""
+    if not os.path.isdir(path):
+        return []
+    return [os.path.join(path, f[:-len(INDEX_EXT)])
+            for f in sorted(os.listdir(path)) if f.endswith(INDEX_EXT)]
+
+
+def iter_entries(path, start=None, end=None):
+    """Yield the Entries with start <= stamp <= end, in time order.
+
+    Only the segments for the months in range are read.
+
+    >>> import tempfile
+    >>> path = tempfile.mkdtemp()
+    >>> for stamp in ['2016_06_30_10_10', '2016_07_01_10_10',
+    ...               '2016_07_02_10_10']:
+    ...   append_record(path, stamp, stamp)
+    >>> [entry.stamp for entry in iter_entries(path, '2016_07')]
+    ['2016_07_01_10_10', '2016_07_02_10_10']
+    >>> [entry.stamp for entry in iter_entries(path, end='2016_07_01_99')]
+    ['2016_06_30_10_10', '2016_07_01_10_10']
+    """
+    for segment in get_segments(path):
+        month = os.path.basename(segment)
+        if (start and month < start[:7]) or (end and month > end[:7]):
+            continue
+        for entry in sorted(read_index(segment)):
+            if (start and entry.stamp < start) or (end and entry.stamp > end):
+                continue
+            yield entry
+
+
+def read_entry(entry):
+    """Return the contents (bytes) of one record."""
+    with open(entry.segment + PACK_EXT, 'rb') as pack_file:
+        pack_file.seek(entry.offset)
+        return gzip.decompress(pack_file.read(entry.length))
+
+
+def iter_records(path, start=None, end=None):
+    """Stream (stamp, contents) for the records in range, in time order."""
+    for entry in iter_entries(path, start, end):
+        yield entry.stamp, read_entry(entry)
+
+
+def get_record(path, stamp):
+    """Return the contents of the record with the stamp (the latest, if it
+          was stored twice).
+
+    >>> import tempfile
+    >>> path = tempfile.mkdtemp()
+    >>> append_record(path, '2016_07_24_10_10', '<div>one</div>')
+    >>> append_record(path, '2016_07_25_10_10', '<div>two</div>')
+    >>> get_record(path, '2016_07_24_10_10')
+    b'<div>one</div>'
+    >>> get_record(path, '2016_08_01_10_10')
+    Traceback (most recent call last):
+    ...
+    KeyError: '2016_08_01_10_10'
+    """
+    segment = _get_segment(path, stamp)
+    if not os.path.exists(segment + INDEX_EXT):
+        raise KeyError(stamp)
+    entries = [entry for entry in read_index(segment) if entry.stamp == stamp]
+    if not entries:
+        raise KeyError(stamp)
+    return read_entry(entries[-1])
+
+
+def pack_files(path, files, remove=False):
+    """Append loose (stamp, file name) scrapes to the packed archive in path,
+          oldest first.  Returns the number packed.
+
+    With remove, each file is deleted once it is in the archive.
+    """
+    packed = 0
+    for stamp, file_name in sorted(files):
+        with open(file_name, 'rb') as loose_file:
+            append_record(path, stamp, loose_file.read())
+        if remove:
+            os.remove(file_name)
+        packed += 1
+    return packed
@@ -0,0 +1,130 @@
+"""Weather Maniac forecast and actual batches.
+
+The parsers hand their temperature points to logic.save_forecasts() and
+  logic.save_actuals() as batches:  a typed array per field (dates kept as
+  ordinals), in a __slots__ object, rather than a tuple or model instance
+  per point.  A backfill of many scrapes then holds a few compact arrays,
+  which are qualified a column at a time (see logic._qualify_batch()) and
+  pickle cheaply between processes.
+"""
+
+import array
+import datetime
+
+
+class ForecastBatch:
+    """(date, day_in_advance, source, max_temp, min_temp) forecast points.
+
+    >>> batch = ForecastBatch.from_days({0: (83, 59), 1: (82, 61)},
+    ...                                 datetime.date(2016, 7, 24), 'html')
+    >>> batch.append(datetime.date(2016, 7, 24), 0, 'api', 80, 60)
+    >>> len(batch)
+    3
+    >>> for point in batch:
+    ...   print(point)
+    (datetime.date(2016, 7, 24), 0, 'html', 83, 59)
+    (datetime.date(2016, 7, 25), 1, 'html', 82, 61)
+    (datetime.date(2016, 7, 24), 0, 'api', 80, 60)
+    >>> import pickle
+    >>> list(pickle.loads(pickle.dumps(batch))) == list(batch)
+    True
+    """
+    __slots__ = ('ordinals', 'days_in_advance', 'sources', 'max_temps',
+                 'min_temps')
+
+    def __init__(self):
+        self.ordinals = array.array('l')
+        self.days_in_advance = array.array('h')
+        self.sources = []
+        self.max_temps = array.array('i')
+        self.min_temps = array.array('i')
+
+    @classmethod
+    def from_points(cls, points):
+        """A batch of (date, day_in_advance, source, max_temp, min_temp)
+              tuples."""
+        batch = cls()
+        for point in points:
+            batch.append(*point)
+        return batch
+
+    @classmethod
+    def from_days(cls, days_to_max_min, predict_date, source):
+        """A batch of one scrape's {day in advance: (max, min)} forecast."""
+        batch = cls()
+        ordinal = predict_date.toordinal()
+        for day_in_advance, (max_temp, min_temp) in days_to_max_min.items():
+            batch.ordinals.append(ordinal + day_in_advance)
+            batch.days_in_advance.append(day_in_advance)
+            batch.max_temps.append(max_temp)
+            batch.min_temps.append(min_temp)
+        batch.sources.extend([source] * len(days_to_max_min))
+        return batch
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def __iter__(self):
+        for ordinal, day_in_advance, source, max_temp, min_temp in zip(
+                self.ordinals, self.days_in_advance, self.sources,
+                self.max_temps, self.min_temps):
+            yield (datetime.date.fromordinal(ordinal), day_in_advance, source,
+                   max_temp, min_temp)
+
+    def append(self, date, day_in_advance, source, max_temp, min_temp):
+        """Add one forecast point."""
+        self.ordinals.append(date.toordinal())
+        self.days_in_advance.append(day_in_advance)
+        self.sources.append(source)
+        self.max_temps.append(max_temp)
+        self.min_temps.append(min_temp)
+
+    def extend(self, other):
+        """Add the points of another batch."""
+        self.ordinals.extend(other.ordinals)
+        self.days_in_advance.extend(other.days_in_advance)
+        self.sources.extend(other.sources)
+        self.max_temps.extend(other.max_temps)
+        self.min_temps.extend(other.min_temps)
+
+
+class ActualBatch:
+    """(date, location, max_temp, min_temp) actual points.
+
+    >>> batch = ActualBatch.from_points([(datetime.date(2016, 8, 1), 'PDX',
+    ...                                   83, 47)])
+    >>> len(batch), list(batch)
+    (1, [(datetime.date(2016, 8, 1), 'PDX', 83, 47)])
+    """
+    __slots__ = ('ordinals', 'locations', 'max_temps', 'min_temps')
+
+    def __init__(self):
+        self.ordinals = array.array('l')
+        self.locations = []
+        self.max_temps = array.array('i')
+        self.min_temps = array.array('i')
+
+    @classmethod
+    def from_points(cls, points):
+        """A batch of (date, location, max_temp, min_temp) tuples."""
+        batch = cls()
+        for point in points:
+            batch.append(*point)
+        return batch
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def __iter__(self):
+        for ordinal, location, max_temp, min_temp in zip(
+                self.ordinals, self.locations, self.max_temps,
+                self.min_temps):
+            yield (datetime.date.fromordinal(ordinal), location, max_temp,
+                   min_temp)
+
+    def append(self, date, location, max_temp, min_temp):
+        """Add one actual point."""
+        self.ordinals.append(date.toordinal())
+        self.locations.append(location)
+        self.max_temps.append(max_temp)
+        self.min_temps.append(min_temp)
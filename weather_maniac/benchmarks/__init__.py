@@ -0,0 +1,6 @@
+"""Weather Maniac performance benchmarks.
+
+  -- generator builds a deterministic synthetic dataset.
+  -- runner times the statistics functions and views against it.
+Run them with:  python manage.py runbenchmarks
+"""
@@ -0,0 +1,105 @@
+"""API forecast parsing benchmark.
+
+Times the json.loads() parse of an API forecast against the streamed parse
+  of json_stream.py, and measures the peak memory each allocates (with
+  tracemalloc), on synthetic payloads:  hourly rows, shaped like the test
+  fixture's, for a number of days and cities.  Checks both parses retime to
+  the same forecast.
+"""
+
+import copy
+import datetime
+import json
+import time
+import tracemalloc
+
+from .. import json_stream
+from .. import load_test_json
+from .. import logic
+
+HOURS = 16 * 24
+CITIES = [1, 10, 100]
+PREDICT_DATE = datetime.date(2016, 6, 16)
+
+
+def make_payload(hours=HOURS, cities=1):
+    """An API forecast as JSON text, with a row per hour for each city.
+
+    >>> payload = make_payload(hours=48, cities=2)
+    >>> data = json.loads(payload)
+    >>> data['cnt'], len(data['list'])
+    (96, 96)
+    """
+    fixture = json.loads(load_test_json.test_json)
+    template = fixture['list'][0]
+    rows = []
+    for city in range(cities):
+        for hour in range(hours):
+            row = copy.deepcopy(template)
+            row['dt'] = template['dt'] + hour * 3600
+            row['main']['temp'] = round(285 + (hour * 7 + city) % 23 -
+                                        (hour % 24 < 12) * 8, 2)
+            rows.append(row)
+    fixture['cnt'] = len(rows)
+    fixture['list'] = rows
+    return json.dumps(fixture)
+
+
+def loads_parse(payload):
+    """The original parse:  the whole document, then its rows."""
+    return logic.get_retimed_fcsts_from_json(json.loads(payload),
+                                             PREDICT_DATE)
+
+
+def stream_parse(payload):
+    """The streamed parse, a row at a time."""
+    return logic.get_retimed_fcsts_from_points(
+        json_stream.iter_forecast_points(payload), PREDICT_DATE)
+
+
+def peak_memory(parse, payload):
+    """Bytes allocated at the peak of one parse, beyond the payload."""
+    tracemalloc.start()
+    try:
+        parse(payload)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def time_parses(payload, repeat=5):
+    """Best-of-repeat times and peak memory for both parses of a payload.
+
+    >>> result = time_parses(make_payload(hours=48), repeat=1)
+    >>> sorted(result)
+    ['loads', 'loads_peak', 'same', 'size', 'speedup', 'stream', \
+'stream_peak']
+    >>> result['same'], result['stream_peak'] < result['loads_peak']
+    (True, True)
+    """
+    timings = {}
+    results = {}
+    for name, parse in (('loads', loads_parse), ('stream', stream_parse)):
+        walls = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results[name] = parse(payload)
+            walls.append(time.perf_counter() - start)
+        timings[name] = min(walls)
+    return {
+        'size': len(payload),
+        'loads': timings['loads'],
+        'stream': timings['stream'],
+        'speedup': timings['loads'] / timings['stream'],
+        'loads_peak': peak_memory(loads_parse, payload),
+        'stream_peak': peak_memory(stream_parse, payload),
+        'same': results['loads'] == results['stream']
+    }
+
+
+def run_json_benchmark(hours=HOURS, cities=None, repeat=5):
+    """Time a payload of each number of cities, returning a dict of
+          '<cities> cities' to timings."""
+    return {'{} cities'.format(count): time_parses(make_payload(hours, count),
+                                                   repeat)
+            for count in cities or CITIES}
@@ -0,0 +1,84 @@
+"""Deterministic synthetic dataset generator for benchmarks.
+
+Builds DayRecords for every source, ActualDayRecords for every location and
+  the error histograms that go with them.  The same seed always gives the
+  same data, so timings from different commits can be compared.
+"""
+
+import datetime
+import math
+import random
+
+from .. import histogram
+from .. import models
+
+BATCH_SIZE = 500
+
+
+def _seasonal_temps(date):
+    """Return the typical (max, min) temperature for a date.
+
+    >>> _seasonal_temps(datetime.date(2016, 7, 20))
+    (82, 57)
+    >>> _seasonal_temps(datetime.date(2017, 1, 20))
+    (46, 33)
+    """
+    phase = 2 * math.pi * (date.timetuple().tm_yday - 20) / 365.25
+    swing = math.cos(phase - math.pi)
+    return round(64 + 18 * swing), round(45 + 12 * swing)
+
+
+def _bulk_save(model, records):
+    """Save records in batches."""
+    for start in range(0, len(records), BATCH_SIZE):
+        model.objects.bulk_create(records[start:start + BATCH_SIZE])
+
+
+def generate_dataset(days, seed=0, end_date=None, locations=None):
+    """Fill the database with days of forecasts, actuals and histograms.
+
+    Forecasts run up to a week past end_date (default today) so the forecast
+      views never need to fetch fresh data.  Actuals run up to end_date.
+    Returns a dict of the number of records created per model.
+
+    >>> counts = generate_dataset(3, end_date=datetime.date(2016, 7, 20),
+    ...                           locations=['PDX', 'TRO'])
+    >>> sorted(counts.items())
+    ... # doctest: +NORMALIZE_WHITESPACE
+    [('ActualDayRecord', 6), ('DayRecord', 330), ('ErrorBin', 358),
+    ('ErrorHistogram', 132)]
+    >>> str(models.ActualDayRecord.objects.order_by('date_meas', 'location')[0])
+    '2016-07-18, PDX, 85, 57'
+    """
+    rand = random.Random(seed)
+    end_date = end_date or datetime.date.today()
+    locations = locations or sorted(models.LOCATIONS.values())
+    start_date = end_date - datetime.timedelta(days - 1)
+    actuals = []
+    forecasts = []
+    for offset in range(days + 7):
+        date = start_date + datetime.timedelta(offset)
+        max_temp, min_temp = _seasonal_temps(date)
+        if date <= end_date:
+            for location in locations:
+                actuals.append(models.ActualDayRecord(
+                    date_meas=date,
+                    location=location,
+                    max_temp=max_temp + rand.randint(-3, 3),
+                    min_temp=min_temp + rand.randint(-3, 3)))
+        for source_str, source_item in sorted(models.SOURCES.items()):
+            for day in range(source_item['length']):
+                spread = 1 + day
+                forecasts.append(models.DayRecord(
+                    date_reference=date,
+                    day_in_advance=day,
+                    source=source_str,
+                    max_temp=max_temp + rand.randint(-spread, spread),
+                    min_temp=min_temp + rand.randint(-spread, spread)))
+    _bulk_save(models.ActualDayRecord, actuals)
+    _bulk_save(models.DayRecord, forecasts)
+    for job in histogram.get_histogram_jobs(locations):
+        histogram.rebuild_histogram(job)
+    return {model.__name__: model.objects.count()
+            for model in [models.ActualDayRecord, models.DayRecord,
+                          models.ErrorHistogram, models.ErrorBin]}
@@ -0,0 +1,100 @@
+"""HTML extraction benchmark.
+
+Times the old full-page parse against html_scan.extract_divs() on the
+  forecast and measurement pages, and checks both give the same divs.
+The test fixtures only hold the wanted divs, so by default they are padded
+  out with page furniture (navigation, scripts, footer) to the size of a
+  scraped page.  Archived pages can be timed instead by passing a directory.
+"""
+
+import os
+import time
+
+from bs4 import BeautifulSoup
+
+from .. import html_scan
+from .. import load_test_html
+from .. import load_test_meas
+
+PAGE_SIZE = 115000
+
+_FURNITURE = ('<div class="nav"><ul><li><a href="/local">Local</a>'
+              '<li><a href="/radar">Radar</a><li><a href="/news">News</a>'
+              '</ul></div>\n<script>var ad = "<div class=\'ad\'></div>";'
+              '</script>\n<p class="teaser">More weather <b>news</b>\n')
+
+
+def pad_page(body, size=PAGE_SIZE):
+    """Surround the divs with page furniture, to make a page of about size.
+
+    >>> page = pad_page('<div id="content">x</div>', 2000)
+    >>> abs(len(page) - 2000) < 2 * len(_FURNITURE)
+    True
+    """
+    repeats = round(max(0, size - len(body)) / (2 * len(_FURNITURE)))
+    filler = _FURNITURE * repeats
+    container = '<div class="container">{}</div>'.format(body)
+    return ('<html><head><title>Forecast</title></head><body>'
+            '{0}{1}{0}</body></html>'.format(filler, container))
+
+
+def full_parse(html_data, attr, value):
+    """The original extraction:  parse the whole page, then search it."""
+    return BeautifulSoup(html_data, 'html.parser').find_all(
+        'div', attrs={attr: value})
+
+
+def time_extraction(html_data, attr, value, repeat=10):
+    """Best-of-repeat times for both extractions of one page.
+
+    >>> page = pad_page(load_test_meas.test_meas_html, 20000)
+    >>> result = time_extraction(page, *html_scan.MEAS_DIV, repeat=2)
+    >>> sorted(result)
+    ['divs', 'full', 'same', 'size', 'speedup', 'targeted']
+    >>> result['divs'], result['same']
+    (1, True)
+    """
+    timings = {}
+    found = {}
+    for name, extract in (('full', full_parse),
+                          ('targeted', html_scan.extract_divs)):
+        walls = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            found[name] = extract(html_data, attr, value)
+            walls.append(time.perf_counter() - start)
+        timings[name] = min(walls)
+    full_divs = [str(div) for div in found['full']]
+    targeted_divs = [str(div) for div in found['targeted']]
+    return {
+        'size': len(html_data),
+        'divs': len(found['targeted']),
+        'full': timings['full'],
+        'targeted': timings['targeted'],
+        'speedup': timings['full'] / timings['targeted'],
+        'same': full_divs == targeted_divs
+    }
+
+
+def get_pages(directory=None, size=PAGE_SIZE):
+    """Yield (name, html, attr, value) for each page to time.
+
+    Archived html_*.html files in the directory are forecast pages; the
+      rest are skipped.
+    """
+    if directory is None:
+        yield ('forecast', pad_page(load_test_html.test_html, size),
+               ) + html_scan.FCST_DIV
+        yield ('measured', pad_page(load_test_meas.test_meas_html, size),
+               ) + html_scan.MEAS_DIV
+        return
+    for file_name in sorted(os.listdir(directory)):
+        if file_name.startswith('html_') and file_name.endswith('.html'):
+            with open(os.path.join(directory, file_name)) as html_file:
+                yield (file_name, html_file.read()) + html_scan.FCST_DIV
+
+
+def run_html_benchmark(directory=None, repeat=10, size=PAGE_SIZE):
+    """Time every page, returning a dict of page name to timings."""
+    return {name: time_extraction(html_data, attr, value, repeat)
+            for name, html_data, attr, value in get_pages(directory, size)}
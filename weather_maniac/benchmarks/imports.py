@@ -0,0 +1,106 @@
+"""Web worker import benchmark.
+
+Times what a web worker imports before it can serve (the WSGI application,
+  with its middleware, and the URL configuration, and so the views), in a
+  fresh interpreter each time so nothing is already cached in sys.modules.
+  Run with -X importtime (Python 3.7 on), the interpreter's own per-module
+  figures give the slowest imports.
+Also checks that none of the INGEST_MODULES were imported:  scraping,
+  parsing and OCR belong to the loader, not the web process (see
+  forecasts.py), so loading one is a cold start regression.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from .. import settings
+
+WEB_MODULES = ['weather_maniac.wsgi', 'weather_maniac.urls']
+INGEST_MODULES = ['bs4', 'PIL', 'urllib.request', 'weather_maniac.data_loader',
+                  'weather_maniac.fetch', 'weather_maniac.file_processor',
+                  'weather_maniac.html_scan', 'weather_maniac.logic_ocr']
+
+# Run in the child:  import as a worker would, then report
+_SCRIPT = '''
+import importlib, json, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+for module in sys.argv[1:]:
+    importlib.import_module(module)
+json.dump({'wall': time.perf_counter() - start,
+           'modules': sorted(sys.modules)}, sys.stdout)
+'''
+
+
+def parse_importtime(output):
+    """Map each module to its cumulative import time (in us), from the
+          lines written by -X importtime.
+
+    >>> parse_importtime('import time: self [us] | cumulative | imported '
+    ...                  'package\\nimport time:       120 |        310 |   '
+    ...                  'bs4.element\\n')
+    {'bs4.element': 310}
+    """
+    cumulative = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            cumulative[fields[2].strip()] = int(fields[1])
+    return cumulative
+
+
+def measure_imports(modules=None, importtime=None):
+    """Import modules (by default the WEB_MODULES) in a fresh interpreter,
+          returning the wall time, the INGEST_MODULES that were loaded and,
+          with importtime, each module's cumulative time.
+
+    importtime defaults to whether this Python has -X importtime.
+
+    >>> result = measure_imports()
+    >>> result['ingest_modules']
+    []
+    >>> result['wall'] > 0, result['modules'] > len(WEB_MODULES)
+    (True, True)
+    """
+    if importtime is None:
+        importtime = sys.version_info >= (3, 7)
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', _SCRIPT] + (modules or WEB_MODULES)
+    environment = dict(os.environ)
+    environment.setdefault('DJANGO_SETTINGS_MODULE', 'weather_maniac.settings')
+    child = subprocess.run(command, cwd=settings.BASE_DIR, env=environment,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                           universal_newlines=True, check=True)
+    report = json.loads(child.stdout)
+    loaded = set(report['modules'])
+    return {
+        'wall': report['wall'],
+        'modules': len(loaded),
+        'ingest_modules': [module for module in INGEST_MODULES
+                           if module in loaded],
+        'cumulative': parse_importtime(child.stderr) if importtime else {}
+    }
+
+
+def run_import_benchmark(repeat=5, modules=None, top=10):
+    """Measure the imports repeat times, returning the best and median wall
+          times, the INGEST_MODULES loaded and the top slowest imports (of
+          the fastest run)."""
+    runs = sorted((measure_imports(modules) for _ in range(repeat)),
+                  key=lambda run: run['wall'])
+    best = runs[0]
+    slowest = sorted(best['cumulative'].items(), key=lambda item: -item[1])
+    return {
+        'wall_min': best['wall'],
+        'wall_median': runs[len(runs) // 2]['wall'],
+        'modules': best['modules'],
+        'ingest_modules': best['ingest_modules'],
+        'slowest': slowest[:top]
+    }
@@ -0,0 +1,111 @@
+"""OCR benchmark and accuracy harness.
+
+Runs a directory of labeled screenshots through logic_ocr.process_image().
+The directory holds screen_<source>_<YYYY_MM_DD_HH_MM>.jpg files, named as
+  the loader archives them, and a labels.csv ground truth with one row per
+  image:  file name, then day in advance, max, min for each day read.
+Reports the time spent in each stage, throughput and accuracy.  Passing
+  stub_engine runs the pipeline without tesseract (accuracy is then
+  meaningless, but the other stages are timed as usual).
+"""
+
+import collections
+import csv
+import os
+import re
+import time
+
+from .. import instrumentation
+from .. import logic_ocr
+
+SCREEN_RE = re.compile(r'screen_(\w+?)_(20\d{2}_\d{2}_\d{2}_\d{2}_\d{2})\.jpg$')
+LABELS_FILE = 'labels.csv'
+STAGES = ['decode', 'enhance', 'encode', 'ocr', 'clean']
+
+
+def stub_engine(input_image):
+    """Stand-in OCR engine which reads nothing."""
+    return ''
+
+
+def load_labels(directory):
+    """Read the ground truth into a dict of file name to days-to-max-min.
+
+    Missing or incomplete day entries are ignored.
+    """
+    labels = {}
+    file_name = os.path.join(directory, LABELS_FILE)
+    if not os.path.isfile(file_name):
+        return labels
+    with open(file_name, newline='') as csvfile:
+        for row in csv.reader(csvfile):
+            days_to_max_min = {}
+            for index in range(1, len(row) - 2, 3):
+                if all(item != '' for item in row[index:index + 3]):
+                    days_to_max_min[int(row[index])] = (int(row[index + 1]),
+                                                        int(row[index + 2]))
+            labels[row[0]] = days_to_max_min
+    return labels
+
+
+def score(truth, found):
+    """Count the temperatures read correctly, out of those labeled.
+
+    >>> score({0: (78, 54), 1: (76, 44)}, {0: (78, 55), 2: (70, 40)})
+    (1, 4)
+    """
+    correct = 0
+    for day, max_min in truth.items():
+        found_max_min = found.get(day, (None, None))
+        correct += sum(1 for temp, found_temp in zip(max_min, found_max_min)
+                       if temp == found_temp)
+    return correct, 2 * len(truth)
+
+
+def run_ocr_benchmark(directory, engine=None):
+    """Process every screenshot in the directory, timing and scoring it.
+
+    >>> import tempfile
+    >>> from PIL import Image
+    >>> directory = tempfile.mkdtemp()
+    >>> Image.new('RGB', (800, 450)).save(
+    ...     os.path.join(directory, 'screen_jpeg_2016_10_07_16_53.jpg'))
+    >>> with open(os.path.join(directory, LABELS_FILE), 'w') as f:
+    ...   _ = f.write('screen_jpeg_2016_10_07_16_53.jpg,0,78,54,1,76,44\\n')
+    >>> report = run_ocr_benchmark(directory, stub_engine)
+    >>> report['images'], report['correct'], report['points']
+    (1, 0, 4)
+    >>> sorted(report['stages'])
+    ['clean', 'decode', 'encode', 'enhance', 'ocr']
+    """
+    labels = load_labels(directory)
+    stage_times = collections.Counter()
+    images = correct = points = 0
+    start = time.perf_counter()
+    for file_name in sorted(os.listdir(directory)):
+        match = SCREEN_RE.search(file_name)
+        if not match:
+            continue
+        source_str, predict_date = match.groups()
+        with open(os.path.join(directory, file_name), 'rb') as f:
+            jpeg_image = f.read()
+        instrumentation.start_timings()
+        row_list, dow_offset = logic_ocr.process_image(
+            jpeg_image, source_str, predict_date, engine)
+        stage_times.update(instrumentation.stop_timings())
+        images += 1
+        if file_name in labels:
+            found = logic_ocr.conv_row_list_to_dict(row_list, dow_offset)
+            image_correct, image_points = score(labels[file_name], found)
+            correct += image_correct
+            points += image_points
+    seconds = time.perf_counter() - start
+    return {
+        'images': images,
+        'seconds': seconds,
+        'images_per_sec': images / seconds if seconds else 0,
+        'stages': {stage: stage_times[stage] for stage in STAGES},
+        'correct': correct,
+        'points': points,
+        'accuracy': correct / points if points else None
+    }
@@ -0,0 +1,122 @@
+"""Benchmark runner.
+
+Each case is run several times, recording its wall time and the number and
+  total time of its SQL queries.  The results are plain dicts so they can be
+  written out as JSON and compared between commits.
+"""
+
+import datetime
+import subprocess
+import time
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from .. import histogram
+from .. import models
+from .. import settings
+from .. import statistics
+
+
+def time_case(func, setup=None, repeat=5):
+    """Time func over repeat runs, calling setup (untimed) before each one.
+
+    The query figures are from the last run, once any caches are warm.
+
+    >>> result = time_case(models.DayRecord.objects.count, repeat=3)
+    >>> sorted(result)
+    ['queries', 'query_time', 'repeat', 'wall_median', 'wall_min']
+    >>> result['queries'], result['repeat']
+    (1, 3)
+    """
+    walls = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            func()
+            walls.append(time.perf_counter() - start)
+    walls.sort()
+    return {
+        'wall_min': walls[0],
+        'wall_median': walls[len(walls) // 2],
+        'queries': len(context.captured_queries),
+        'query_time': sum(float(query['time'])
+                          for query in context.captured_queries),
+        'repeat': repeat
+    }
+
+
+def _get_view(client, path, params=None):
+    """Request a page, making sure it worked."""
+    response = client.get(path, params or {})
+    if response.status_code != 200:
+        raise RuntimeError('{} returned {}'.format(path,
+                                                   response.status_code))
+    return response
+
+
+def _reset_histogram():
+    """Empty the histogram timed by the populate_histogram case."""
+    histogram.get_histogram('api', models.DEFAULT_LOCATION, 'max',
+                            1).errorbin_set.all().delete()
+
+
+def get_cases():
+    """Return the benchmark cases as (name, func, setup) tuples."""
+    client = Client()
+    location = models.DEFAULT_LOCATION
+    return [
+        ('get_statistics',
+         lambda: statistics.get_statistics('api', location, 'max'), None),
+        ('make_stats_json',
+         lambda: statistics.make_stats_json('html', 'max', location), None),
+        ('make_graph_json',
+         lambda: statistics.make_graph_json('max'), None),
+        ('populate_histogram',
+         lambda: histogram.populate_histogram('api', location, 'max', 1,
+                                              datetime.date(2016, 6, 1)),
+         _reset_histogram),
+        ('view_statistics',
+         lambda: _get_view(client, '/statistics'), None),
+        ('view_json',
+         lambda: _get_view(client, '/json',
+                           {'forecaster': 'api', 'mtype': 'max'}), None),
+        ('view_graph_json',
+         lambda: _get_view(client, '/graph_json', {'mtype': 'max'}), None),
+    ]
+
+
+def run_benchmarks(repeat=5, names=None):
+    """Run the benchmark cases (all of them unless names are given).
+
+    Returns a dict with keys as case name, values as time_case() results.
+    """
+    return {name: time_case(func, setup, repeat)
+            for name, func, setup in get_cases()
+            if names is None or name in names}
+
+
+def compare_results(old, new):
+    """Compare two sets of results, as the ratio of new to old median time.
+
+    >>> old = {'a': {'wall_median': 2.0}, 'b': {'wall_median': 1.0}}
+    >>> new = {'a': {'wall_median': 1.0}, 'c': {'wall_median': 1.0}}
+    >>> compare_results(old, new)
+    {'a': 0.5}
+    """
+    return {name: new[name]['wall_median'] / old[name]['wall_median']
+            for name in sorted(new)
+            if name in old and old[name]['wall_median']}
+
+
+def get_commit():
+    """Return the current git commit, or None outside of a repository."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+            stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,176 @@
+"""Weather Maniac bulk fixture loading and dumping.
+
+loaddata deserializes and saves a fixture one object at a time, which makes
+  standing up a database from weather_maniac.json.gz slow.  Instead:
+  -- load_fixture() streams the fixture (see json_stream.py), and
+     bulk_load() groups its objects by model and bulk_creates them
+     BATCH_SIZE at a time, all in one transaction.  Constraint checks are
+     deferred until every object is in, so an ErrorBin may come before its
+     ErrorHistogram; the ErrorBin to ErrorHistogram keys are checked once at
+     the end, and sequences reset, as loaddata does.
+  -- dump_fixture() writes the same format as dumpdata, straight from
+     values() rows rather than through model instances and the serializer.
+Either file may be gzipped (by its name ending in .gz).
+"""
+
+import gzip
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from . import json_stream
+from . import models
+
+BATCH_SIZE = 5000
+
+# The weather data, in an order where every foreign key points backwards
+FIXTURE_MODELS = [models.DayRecord, models.ActualDayRecord,
+                  models.ErrorHistogram, models.ErrorBin]
+
+
+def _open(file_name, mode):
+    """Open a fixture file as text, through gzip if its name ends in .gz."""
+    if file_name.endswith('.gz'):
+        return gzip.open(file_name, mode + 't', encoding='utf-8')
+    return open(file_name, mode, encoding='utf-8')
+
+
+def _get_converters(model):
+    """Map each serialized field name of a model to (attname, converter).
+
+    A foreign key is serialized as the related object's pk, and is set on
+      its attname (e.g., member_of_hist_id) as it is.
+    """
+    converters = {}
+    for field in model._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        if field.remote_field:
+            converters[field.name] = (field.attname, None)
+        else:
+            converters[field.name] = (field.attname, field.to_python)
+    return converters
+
+
+def _build(model, converters, item):
+    """Make an unsaved instance of model from one fixture object."""
+    values = {}
+    for name, value in item['fields'].items():
+        attname, convert = converters[name]
+        values[attname] = value if convert is None else convert(value)
+    return model(pk=item['pk'], **values)
+
+
+def clear_tables(using=DEFAULT_DB_ALIAS):
+    """Delete every row of the FIXTURE_MODELS, dependents first."""
+    for model in reversed(FIXTURE_MODELS):
+        model.objects.using(using).all().delete()
+
+
+def bulk_load(objects, batch_size=BATCH_SIZE, replace=False,
+              using=DEFAULT_DB_ALIAS):
+    """Bulk create unsaved model instances, returning a dict of model label
+          to objects created.
+
+    The objects are grouped by model and saved batch_size at a time, all in
+      one transaction with constraint checks deferred (see above).  They keep
+      their pks, so they must not already be in the database:  nothing is
+      saved if one is.  With replace, the FIXTURE_MODELS tables are emptied
+      first (in the same transaction).
+    """
+    connection = connections[using]
+    loaded = {}
+    batches = {}
+    with transaction.atomic(using=using):
+        if replace:
+            clear_tables(using)
+        with connection.constraint_checks_disabled():
+            for instance in objects:
+                model = type(instance)
+                if model not in batches:
+                    batches[model] = []
+                    loaded[model._meta.label_lower] = 0
+                batch = batches[model]
+                batch.append(instance)
+                loaded[model._meta.label_lower] += 1
+                if len(batch) >= batch_size:
+                    model.objects.using(using).bulk_create(batch)
+                    batch.clear()
+            for model, batch in batches.items():
+                model.objects.using(using).bulk_create(batch)
+        connection.check_constraints(
+            table_names=[model._meta.db_table for model in batches])
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(),
+                                                         list(batches))
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for line in sequence_sql:
+                    cursor.execute(line)
+    return loaded
+
+
+def _iter_fixture(file_name):
+    """Yield an unsaved instance for each object of a fixture."""
+    converters = {}
+    with _open(file_name, 'r') as fixture:
+        for item in json_stream.iter_items(fixture):
+            model = apps.get_model(item['model'])
+            if model not in converters:
+                converters[model] = _get_converters(model)
+            yield _build(model, converters[model], item)
+
+
+def load_fixture(file_name, batch_size=BATCH_SIZE, replace=False,
+                 using=DEFAULT_DB_ALIAS):
+    """Bulk load a dumpdata format fixture, returning a dict of model label
+          to objects loaded (see bulk_load()).
+
+    >>> import os, tempfile
+    >>> from . import load_test_records
+    >>> load_test_records.histo_loader()
+    >>> load_test_records.record_loader()
+    >>> file_name = os.path.join(tempfile.mkdtemp(), 'test.json.gz')
+    >>> dumped = dump_fixture(file_name)
+    >>> dumped['weather_maniac.errorbin']
+    198
+    >>> load_fixture(file_name)  # doctest: +IGNORE_EXCEPTION_DETAIL
+    Traceback (most recent call last):
+    ...
+    django.db.utils.IntegrityError: UNIQUE constraint failed
+    >>> load_fixture(file_name, batch_size=40, replace=True) == dumped
+    True
+    >>> models.ErrorHistogram.objects.first().errorbin_set.count()
+    3
+    """
+    return bulk_load(_iter_fixture(file_name), batch_size, replace, using)
+
+
+def dump_fixture(file_name, model_list=None, using=DEFAULT_DB_ALIAS):
+    """Dump models (by default the FIXTURE_MODELS) in dumpdata format,
+          returning a dict of model label to objects dumped.
+
+    Rows are read in pk order, a chunk at a time, and written as they come.
+    """
+    encoder = DjangoJSONEncoder()
+    dumped = {}
+    separator = ''
+    with _open(file_name, 'w') as fixture:
+        fixture.write('[')
+        for model in model_list or FIXTURE_MODELS:
+            label = model._meta.label_lower
+            fields = [field for field in model._meta.concrete_fields
+                      if not field.primary_key]
+            names = [field.name for field in fields]
+            rows = model.objects.using(using).order_by('pk').values_list(
+                'pk', *[field.attname for field in fields])
+            dumped[label] = 0
+            for row in rows.iterator():
+                fixture.write(separator + encoder.encode(
+                    {'model': label, 'pk': row[0],
+                     'fields': dict(zip(names, row[1:]))}))
+                separator = ', '
+                dumped[label] += 1
+        fixture.write(']')
+    return dumped
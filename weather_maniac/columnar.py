@@ -0,0 +1,148 @@
+"""Weather Maniac columnar history.
+
+dump_columnar() writes the forecast, actual and histogram tables as typed
+  column arrays (a NumPy .npy file per column, in a directory per table), so
+  offline analysis (backtests, the statistics precompute) can read years of
+  history without going through the ORM row by row.
+load_columnar() maps them back into memory without copying (mmap):  nothing
+  is read from disk until a column is used.
+The members of a .npz cannot be memory mapped, so dumping with compress (a
+  compressed .npz per table) is for moving the history around; it is read
+  back into memory instead.
+import_columnar() restores the tables into the database (see
+  bulk_fixtures.py).
+numpy is optional for Weather Maniac; only this module needs it.
+"""
+
+import collections
+import os
+import shutil
+
+from django.db import DEFAULT_DB_ALIAS
+
+from . import bulk_fixtures
+from . import models
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Each table's model and its (column, dtype)s, the columns being attnames
+TABLES = collections.OrderedDict([
+    ('dayrecord', (models.DayRecord, [
+        ('id', 'int32'), ('date_reference', 'datetime64[D]'),
+        ('day_in_advance', 'int8'), ('source', 'U6'),
+        ('max_temp', 'int16'), ('min_temp', 'int16')])),
+    ('actualdayrecord', (models.ActualDayRecord, [
+        ('id', 'int32'), ('date_meas', 'datetime64[D]'), ('location', 'U6'),
+        ('max_temp', 'int16'), ('min_temp', 'int16')])),
+    ('errorhistogram', (models.ErrorHistogram, [
+        ('id', 'int32'), ('source', 'U6'), ('location', 'U6'),
+        ('mtype', 'U6'), ('day_in_advance', 'int8')])),
+    ('errorbin', (models.ErrorBin, [
+        ('id', 'int32'), ('member_of_hist_id', 'int32'), ('error', 'int16'),
+        ('quantity', 'int32'), ('start_date', 'datetime64[D]'),
+        ('end_date', 'datetime64[D]')]))
+])
+
+
+def _require_numpy():
+    """Raise ImportError if numpy is not installed."""
+    if numpy is None:
+        raise ImportError('numpy is needed for the columnar history')
+
+
+def dump_columnar(path, compress=False, using=DEFAULT_DB_ALIAS):
+    """Write each of the TABLES as column arrays under path, returning a
+          dict of table to rows written.
+
+    >>> if numpy is None:
+    ...   import pytest; pytest.skip('numpy is not installed')
+    >>> import tempfile
+    >>> from . import load_test_records
+    >>> load_test_records.histo_loader()
+    >>> load_test_records.record_loader()
+    >>> path = tempfile.mkdtemp()
+    >>> dumped = dump_columnar(path)
+    >>> dumped['errorbin'] == models.ErrorBin.objects.count()
+    True
+    >>> columns = load_columnar(path)
+    >>> max_temps = columns['dayrecord']['max_temp']
+    >>> type(max_temps).__name__, max_temps.dtype.name
+    ('memmap', 'int16')
+    >>> columns['actualdayrecord']['date_meas'][0]
+    numpy.datetime64('2016-07-01')
+    >>> imported = import_columnar(path, replace=True)
+    >>> sorted(imported.values()) == sorted(dumped.values())
+    True
+    >>> dump_columnar(path, compress=True) == dumped
+    True
+    >>> load_columnar(path, ['errorbin'])['errorbin']['error'][:3]
+    array([1, 2, 3], dtype=int16)
+    """
+    _require_numpy()
+    dumped = collections.OrderedDict()
+    os.makedirs(path, exist_ok=True)
+    for table, (model, columns) in TABLES.items():
+        names = [name for name, _ in columns]
+        rows = list(model.objects.using(using).order_by('pk').values_list(
+            *names))
+        values = list(zip(*rows)) or [()] * len(columns)
+        arrays = {name: numpy.array(column, dtype=dtype)
+                  for (name, dtype), column in zip(columns, values)}
+        directory = os.path.join(path, table)
+        npz_file = os.path.join(path, table + '.npz')
+        # Only one form of a table is kept, so it is the one loaded
+        if compress:
+            numpy.savez_compressed(npz_file, **arrays)
+            if os.path.isdir(directory):
+                shutil.rmtree(directory)
+        else:
+            os.makedirs(directory, exist_ok=True)
+            for name, array in arrays.items():
+                numpy.save(os.path.join(directory, name + '.npy'), array)
+            if os.path.isfile(npz_file):
+                os.remove(npz_file)
+        dumped[table] = len(rows)
+    return dumped
+
+
+def load_columnar(path, tables=None):
+    """Read tables (by default all of the TABLES) from under path, as a dict
+          of table to a dict of column name to array.
+
+    Columns dumped as .npy files are memory mapped, read only; compressed
+      ones are read into memory.
+    """
+    _require_numpy()
+    loaded = {}
+    for table in tables or TABLES:
+        _, columns = TABLES[table]
+        directory = os.path.join(path, table)
+        if os.path.isdir(directory):
+            loaded[table] = {
+                name: numpy.load(os.path.join(directory, name + '.npy'),
+                                 mmap_mode='r')
+                for name, _ in columns}
+        else:
+            with numpy.load(os.path.join(path, table + '.npz')) as arrays:
+                loaded[table] = {name: arrays[name] for name, _ in columns}
+    return loaded
+
+
+def _iter_instances(loaded):
+    """Yield an unsaved instance for each row of the loaded tables."""
+    for table, columns in loaded.items():
+        model, _ = TABLES[table]
+        names = list(columns)
+        for row in zip(*(columns[name].tolist() for name in names)):
+            yield model(**dict(zip(names, row)))
+
+
+def import_columnar(path, batch_size=bulk_fixtures.BATCH_SIZE,
+                    replace=False, using=DEFAULT_DB_ALIAS):
+    """Restore the tables under path into the database, returning a dict of
+          model label to objects created (see bulk_fixtures.bulk_load())."""
+    return bulk_fixtures.bulk_load(_iter_instances(load_columnar(path)),
+                                   batch_size, replace, using)
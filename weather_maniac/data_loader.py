@@ -9,59 +9,64 @@ The main() function will make all of the necessary calls.
 """
 
 import datetime
-import json
+import logging
 import re
 import os
 import csv
-import urllib.request
 from time import strftime
 
-from bs4 import BeautifulSoup
 from django.core.files import File
 
+from . import archive
+from . import fetch
+from . import instrumentation
+from . import json_stream
 from . import logic
+from . import manifest
 from . import models
 from . import settings
+from . import publish
 from . import logic_ocr
-from . import file_processor
+from . import html_scan
 
+logger = logging.getLogger(__name__)
 
-def get_api_data(api_key):
-    """API data gatherer.
+
+@instrumentation.timed('scrape')
+def get_api_data(api_key, day=None):
+    """API data gatherer, conditional on the last fetch (see get_data()).
 
     The api key is hidden.
     """
-    req = urllib.request.Request(
-        'http://api.openweathermap.org/data/2.5/forecast/city?' + api_key)
-    with urllib.request.urlopen(req) as f:
-        file_contents = f.read()
-    return file_contents.decode('utf-8')
+    return fetch.fetch('http://api.openweathermap.org/data/2.5/forecast/city?'
+                       + api_key, 'api', day)
 
 
 def store_api_file(contents, today_str):
     """API file storer.
 
-    The file is stored directly in the Arch/ directory since it is being
-      processed immediately and not being queued for processing.
-    The file repo has each file with the date+time encoded in the filename.
+    The file is stored directly in the Arch/ directory's packed archive
+      (see archive.py) since it is being processed immediately and not being
+      queued for processing.  It is indexed by the date+time.
     """
-    file_name = os.path.join(models.SOURCES['api']['arch_path'],
-                             ('api_' + today_str + '.json'))
     try:
-        with open(file_name, 'w') as f:
-            file = File(f)
-            file.write(contents)
+        archive.append_record(models.SOURCES['api']['arch_path'], today_str,
+                              contents)
     except FileNotFoundError as error:
-        print('{}: Likely {} does not exist'.format(
-            error, models.SOURCES['api']['arch_path']))
-        print('Proceeding without data archiving...')
+        logger.warning('%s: Likely %s does not exist.  '
+                       'Proceeding without data archiving...',
+                       error, models.SOURCES['api']['arch_path'])
 
 
-def get_data(source):
-    """Generic data gatherer, for either HTML or JPEG"""
-    with urllib.request.urlopen(source) as f:
-        file_contents = f.read()
-    return file_contents
+@instrumentation.timed('scrape')
+def get_data(source, source_str=None, day=None):
+    """Generic data gatherer, for either HTML or JPEG
+
+    Returns a fetch.Response.  Given the source_str the fetch is conditional:
+      if the contents have not changed since its last fetch (on the day, if
+      given), the body is None and there is nothing to process.
+    """
+    return fetch.fetch(source, source_str, day)
 
 
 def extract_fcst_soup(html_data):
@@ -74,8 +79,7 @@ def extract_fcst_soup(html_data):
     class="weather-box-header">...<i class="fa
     fa-caret-right"></i></div></div></div></div>]
     """
-    html_soup = BeautifulSoup(html_data, 'html.parser')
-    return html_soup.find_all('div', class_='weather-box daily-forecast')
+    return html_scan.extract_divs(html_data, *html_scan.FCST_DIV)
 
 
 def store_jpeg_file(contents, today_str, source_str):
@@ -85,49 +89,48 @@ def store_jpeg_file(contents, today_str, source_str):
       is not implemented yet.
     The file repo has each file with the date+time encoded in the filename.
     Since these are jpg files, they are stored as bytes.
+    Returns the stored file's name, or None if it could not be stored.
     """
-    file_name = os.path.join(models.SOURCES[source_str]['data_path'],
-                             ('screen_' + source_str +
-                              '_' + today_str + '.jpg'))
+    name = 'screen_' + source_str + '_' + today_str + '.jpg'
+    file_name = os.path.join(models.SOURCES[source_str]['data_path'], name)
     try:
         with open(file_name, 'wb') as f:
             file = File(f)
             file.write(contents)
     except FileNotFoundError as error:
-        print('{}: Likely {} does not exist'.format(
-            error, source_str['data_path']))
-        print('Proceeding without data archiving...')
+        logger.warning('%s: Likely %s does not exist.  '
+                       'Proceeding without data archiving...',
+                       error, models.SOURCES[source_str]['data_path'])
+        return None
+    return name
 
 
 def archive_jpeg_file():
     """JPG file archiver"""
-    print('Archiving measured...')
+    logger.info('Archiving measured...')
     today_str = strftime('%Y_%m_%d_%H_%M')
     for source_str in ['jpeg', 'jpeg3', 'jpeg4']:
-        jpg_contents = get_data(models.SOURCES[source_str]['location'])
-        store_jpeg_file(jpg_contents, today_str, source_str)
+        response = get_data(models.SOURCES[source_str]['location'])
+        store_jpeg_file(response.body, today_str, source_str)
 
 
 def store_html_file(fcast_soup, today_str):
     """HTML storing function.
 
-    The file is stored directly in the Arch/ directory since it is being
-      processed immediately and not being queued for processing.
+    The file is stored directly in the Arch/ directory's packed archive
+      (see archive.py) since it is being processed immediately and not being
+      queued for processing.  It is indexed by the date+time.
     Since the raw html files are big, this gets stripped down to just the
       forecast portion of the html.
-    The file repo has each file with the date+time encoded in the filename.
     """
     fcast_html_string = str(fcast_soup)
-    file_name = os.path.join(models.SOURCES['html']['arch_path'],
-                             ('html_' + today_str + '.html'))
     try:
-        with open(file_name, 'w') as f:
-            file = File(f)
-            file.write(fcast_html_string)
+        archive.append_record(models.SOURCES['html']['arch_path'], today_str,
+                              fcast_html_string)
     except FileNotFoundError as error:
-        print('{}: Likely {} does not exist'.format(
-            error, models.SOURCES['html']['arch_path']))
-        print('Proceeding without data archiving...')
+        logger.warning('%s: Likely %s does not exist.  '
+                       'Proceeding without data archiving...',
+                       error, models.SOURCES['html']['arch_path'])
 
 
 def process_api_data(json_string, today_str):
@@ -154,9 +157,15 @@ def process_api_data(json_string, today_str):
     2016-06-20, 4, api, 82, 44
     2016-06-21, 5, api, 82, 51
     """
+    process_api_points(json_stream.iter_forecast_points(json_string),
+                       today_str)
+
+
+def process_api_points(points, today_str):
+    """Save the (epoch time, temperature) points of one API file, as
+          streamed from it, to DayRecords (see process_api_data())."""
     today_date = logic.get_date(today_str)
-    json_data = json.loads(json_string)
-    days_to_max_min = logic.get_retimed_fcsts_from_json(json_data, today_date)
+    days_to_max_min = logic.get_retimed_fcsts_from_points(points, today_date)
     logic.process_days_to_max_min(days_to_max_min, today_date, 'api')
 
 
@@ -203,20 +212,6 @@ def process_jpeg_data(jpeg_image, source_str, today_str):
     return days_to_max_min
 
 
-def conv_dict_to_csv_list(days_to_max_min):
-    """Convert days-to-max-min dict to list for csv writing.
-
-    >>> conv_dict_to_csv_list({'predict': '2016_09_22', 0: (78, 54),
-    ... 1: (76, 44)})
-    ['2016_09_22', 0, 78, 54, 1, 76, 44]
-    """
-    outlist = [days_to_max_min['predict']]
-    for idx in range(models.SOURCES['jpeg']['length']):
-        if idx in days_to_max_min:
-            outlist += [idx, days_to_max_min[idx][0], days_to_max_min[idx][1]]
-    return outlist
-
-
 def extract_meas_soup(html_data):
     """Extract the forecast html soup item for subsequent searching.
 
@@ -227,29 +222,26 @@ def extract_meas_soup(html_data):
     class="h1-blue">Portland, OR</span>...</strong></p><div
     style="clear:left"></div><div id="google_translate_element"></div></div>]
     """
-    meas_soup = BeautifulSoup(html_data, 'html.parser')
-    return meas_soup.find_all('div', id='content')
+    return html_scan.extract_divs(html_data, *html_scan.MEAS_DIV)
 
 
 def store_meas_file(meas_soup, today_str):
     """Measured data HTML storing function.
 
-    The file is stored directly in the Arch/ directory since it is being
-      processed immediately and not being queued for processing.
+    The file is stored directly in the Arch/ directory's packed archive
+      (see archive.py) since it is being processed immediately and not being
+      queued for processing.  It is indexed by the date+time.
     Since the raw html files are big, this gets stripped down to just the
       contents portion of the html.
-    The file repo has each file with the date+time encoded in the filename.
     """
     meas_html_string = str(meas_soup)
-    file_name = os.path.join(models.ACTUAL['arch_path'],
-                             ('meas_' + today_str + '.html'))
     try:
-        with open(file_name, 'w') as file:
-            file.write(meas_html_string)
+        archive.append_record(models.ACTUAL['arch_path'], today_str,
+                              meas_html_string)
     except FileNotFoundError as error:
-        print('{}: Likely {} does not exist'.format(
-            error, models.ACTUAL['arch_path']))
-        print('Proceeding without data archiving...')
+        logger.warning('%s: Likely %s does not exist.  '
+                       'Proceeding without data archiving...',
+                       error, models.ACTUAL['arch_path'])
 
 
 def process_meas_data(daily_meas_soup, today_str):
@@ -278,116 +270,169 @@ def process_meas_data(daily_meas_soup, today_str):
         act_temp_model = logic.get_actual(meas_date, location,
                                           max_temp, min_temp)
     except ValueError as error:
-        print(error)
+        logger.warning('Actual rejected: %s', error)
     else:
         act_temp_model.save()
 
 
-def load_forecast_record(source_str, today):
-    """Ensure that the forecast record is current.
+def count_skipped(source_str):
+    """Count the work saved by not processing a source's payload again.
 
-    Look for tomorrow's record since sometimes today is missing a min temp.
+    >>> instrumentation.reset_counts()
+    >>> count_skipped('jpeg')
+    >>> count_skipped('meas')
+    >>> [instrumentation.COUNTS[event] for event in
+    ...  ['payloads skipped', 'OCR runs skipped', 'parses skipped',
+    ...   'forecast writes skipped', 'actual writes skipped']]
+    [2, 1, 1, 7, 1]
     """
-    tomorrow = today + datetime.timedelta(1)
-    try:
-        models.DayRecord.objects.get(
-            source=source_str,
-            date_reference=tomorrow,
-            day_in_advance=1
-        )
-    except models.DayRecord.DoesNotExist:
-        update_html_data()
-        update_api_data()
-        for source_str in ['jpeg', 'jpeg3', 'jpeg4']:
-            update_jpeg_data(source_str)
-
-
-def get_forecast(source_str, mtype, today):
-    """Get the current temperature forecast.
-
-    >>> today = datetime.date.today()
-    >>> for i in range(7):
-    ...   models.DayRecord(date_reference=today + datetime.timedelta(i),
-    ...   day_in_advance=i, source='api', max_temp=83, min_temp=50 + i).save()
-    ...   models.DayRecord(date_reference=today + datetime.timedelta(i),
-    ...   day_in_advance=i, source='html', max_temp=83, min_temp=50 - i).save()
-    >>> get_forecast('api', 'min', today)
-    {0: 50, 1: 51, 2: 52, 3: 53, 4: 54}
-    >>> get_forecast('html', 'min', today)
-    {0: 50, 1: 49, 2: 48, 3: 47, 4: 46, 5: 45, 6: 44}
-    >>> get_forecast('api', 'max', today)
-    {0: 83, 1: 83, 2: 83, 3: 83, 4: 83}
-    """
-    load_forecast_record(source_str, today)
-    records = []
-    for day in range(models.SOURCES[source_str]['length']):
-        try:
-            record = [models.DayRecord.objects.get(
-                source=source_str,
-                day_in_advance=day,
-                date_reference=today + datetime.timedelta(day)
-            )]
-        except models.DayRecord.DoesNotExist:
-            print('Forecast point missing.')
+    instrumentation.count('payloads skipped')
+    if source_str in models.SOURCES:
+        if 'dims' in models.SOURCES[source_str]:
+            instrumentation.count('OCR runs skipped')
         else:
-            records += record
-    if mtype == 'max':
-        days_to_temp = {record.day_in_advance: record.max_temp
-                        for record in records}
+            instrumentation.count('parses skipped')
+        instrumentation.count('forecast writes skipped',
+                              models.SOURCES[source_str]['length'])
     else:
-        days_to_temp = {record.day_in_advance: record.min_temp
-                        for record in records}
-    return days_to_temp
+        instrumentation.count('parses skipped')
+        instrumentation.count('actual writes skipped')
+
+
+def is_not_modified(source_str, response):
+    """Whether the source answered 304, counting the work saved if so."""
+    if response.body is not None:
+        return False
+    logger.info('%s unchanged', source_str)
+    count_skipped(source_str)
+    return True
+
+
+def is_duplicate(source_str, response, digest, day):
+    """Whether the payload was already processed on the day, counting the
+          work saved if so.
+
+    A duplicate still has its response's validators saved.
+    """
+    if not fetch.is_duplicate(source_str, digest, day):
+        return False
+    logger.info('%s payload unchanged', source_str)
+    fetch.save_validators(source_str, response, digest, day)
+    count_skipped(source_str)
+    return True
 
 
 def update_html_data():
-    """Main function to update and archive the web-site based forecasts."""
-    print('Updating html...')
+    """Main function to update and archive the web-site based forecasts.
+
+    Nothing is parsed or saved if the page, or its forecast, has not changed.
+
+    >>> from . import load_test_html, load_test_server
+    >>> server = load_test_server.start_stub_server(
+    ...     load_test_html.test_html.encode('utf-8'))
+    >>> saved_settings = settings.WM_SRC2_ID, settings.WM_LOCAL
+    >>> settings.WM_SRC2_ID, settings.WM_LOCAL = server.url, False
+    >>> instrumentation.reset_counts()
+    >>> update_html_data()
+    >>> models.FetchValidator.objects.filter(source='html').exists()
+    True
+    >>> update_html_data()
+    >>> server.body = server.body.replace(b'</body>', b'<!-- ad --></body>')
+    >>> update_html_data()
+    >>> (instrumentation.COUNTS['fetches changed'],
+    ...  instrumentation.COUNTS['fetches unchanged'],
+    ...  instrumentation.COUNTS['payloads skipped'], server.requests)
+    (2, 1, 2, 3)
+    >>> settings.WM_SRC2_ID, settings.WM_LOCAL = saved_settings
+    >>> fetch.close_connections()
+    >>> server.shutdown()
+    """
+    logger.info('Updating html...')
     today_str = strftime('%Y_%m_%d_%H_%M')
-    html_data = get_data(settings.WM_SRC2_ID)
-    html_soup = extract_fcst_soup(html_data)
+    today_date = logic.get_date(today_str)
+    response = get_data(settings.WM_SRC2_ID, 'html', today_date)
+    if is_not_modified('html', response):
+        return
+    html_soup = extract_fcst_soup(response.body)
+    digest = fetch.fingerprint(str(html_soup), today_date)
+    if is_duplicate('html', response, digest, today_date):
+        return
     if settings.WM_LOCAL:
         store_html_file(html_soup, today_str)
     process_html_data(html_soup, today_str)
+    fetch.save_validators('html', response, digest, today_date)
 
 
 def update_api_data():
-    """Main function to update and archive the api based forecasts."""
-    print('Updating api...')
+    """Main function to update and archive the api based forecasts.
+
+    The payload fingerprinted is the forecast's points alone, as the rest of
+      the response (e.g., its calculation time) changes on every call.
+    """
+    logger.info('Updating api...')
     today_str = strftime('%Y_%m_%d_%H_%M')
+    today_date = logic.get_date(today_str)
     app_str = '&'.join([settings.WM_APP_ID, settings.WM_APP_KEY])
-    api_string = get_api_data(app_str)
+    response = get_api_data(app_str, today_date)
+    if is_not_modified('api', response):
+        return
+    api_string = response.body.decode('utf-8')
+    points = list(json_stream.iter_forecast_points(api_string))
+    digest = fetch.fingerprint(repr(points), today_date)
+    if is_duplicate('api', response, digest, today_date):
+        return
     if settings.WM_LOCAL:
         store_api_file(api_string, today_str)
-    process_api_data(api_string, today_str)
+    process_api_points(points, today_str)
+    fetch.save_validators('api', response, digest, today_date)
 
 
 def update_jpeg_data(source_str):
     """Main function to update and archive the web-site based forecasts."""
     # source_str = list(source.keys())[0]
-    print('Updating {}...'.format(source_str))
+    logger.info('Updating %s...', source_str)
     today_str = strftime('%Y_%m_%d_%H_%M')
-    jpeg_image = get_data(models.SOURCES[source_str]['location'])
+    today_date = logic.get_date(today_str)
+    response = get_data(models.SOURCES[source_str]['location'], source_str,
+                        today_date)
+    if is_not_modified(source_str, response):
+        return
+    jpeg_image = response.body
+    digest = fetch.fingerprint(jpeg_image, today_date)
+    if is_duplicate(source_str, response, digest, today_date):
+        return
     days_to_max_min = process_jpeg_data(jpeg_image, source_str, today_str)
     if settings.WM_LOCAL:
-        store_jpeg_file(jpeg_image, today_str, source_str)
+        name = store_jpeg_file(jpeg_image, today_str, source_str)
+        if name is not None:
+            # Already processed:  keep the file watcher from OCRing it again
+            manifest.mark_processed(models.SOURCES[source_str]['data_path'],
+                                    name)
         days_to_max_min['predict'] = today_str
-        csv_file = os.path.join(file_processor.ROOT_PATH, 'total.csv')
+        csv_file = os.path.join(models.ROOT_PATH, 'total.csv')
         with open(csv_file, 'a', newline='') as csvfile:
             csv_writer = csv.writer(csvfile, delimiter=',')
-            csv_list = conv_dict_to_csv_list(days_to_max_min)
+            csv_list = logic_ocr.conv_dict_to_csv_list(days_to_max_min)
             csv_writer.writerow(csv_list)
+    fetch.save_validators(source_str, response, digest, today_date)
 
 
 def update_meas_data():
     """Main function to update and archive the measured temps."""
-    print('Updating measured...')
+    logger.info('Updating measured...')
     today_str = strftime('%Y_%m_%d_%H_%M')
-    meas_data = get_data(settings.WM_MEAS_ID)
-    meas_soup = extract_meas_soup(meas_data)
+    today_date = logic.get_date(today_str)
+    response = get_data(settings.WM_MEAS_ID, 'meas', today_date)
+    if is_not_modified('meas', response):
+        return
+    meas_soup = extract_meas_soup(response.body)
+    digest = fetch.fingerprint(str(meas_soup), today_date)
+    if is_duplicate('meas', response, digest, today_date):
+        return
     if settings.WM_LOCAL:
         store_meas_file(meas_soup, today_str)
     process_meas_data(meas_soup, today_str)
+    fetch.save_validators('meas', response, digest, today_date)
 
 
 def main():
@@ -398,6 +443,9 @@ def main():
         update_jpeg_data(source_str)
     if settings.WM_LOCAL:
         archive_jpeg_file()
+    fetch.close_connections()
+    publish.publish_all()
+    instrumentation.log_counts(logger, 'Data loading')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,197 @@
+"""Weather Maniac fetching.
+
+The scrapers fetch through here rather than urllib, so that:
+  -- Connections are kept open (HTTP/1.1 keep-alive) and reused, one per
+     host, for as long as the process runs.
+  -- Each source's ETag and Last-Modified validators are kept (as
+     FetchValidators) and sent back on its next fetch.  An upstream that has
+     not changed answers 304 with no body, and the caller can skip parsing,
+     OCR and saving altogether.
+  -- A fingerprint of the payload each source last had processed is kept
+     with its validators, so contents that come back unchanged from a source
+     without validators (or behind a new ETag) can be skipped just the same.
+The validators are saved by save_validators() only once the caller has dealt
+  with the new contents, so a failed run does not leave data unprocessed.
+Forecasts are retimed against the day they are fetched, so validators and
+  fingerprints saved on an earlier day are not trusted.
+"""
+
+import collections
+import gzip
+import hashlib
+import http.client
+import logging
+import sys
+import urllib.error
+import urllib.parse
+
+from . import instrumentation
+from . import models
+
+FETCH_TIMEOUT = 60
+MAX_REDIRECTS = 5
+USER_AGENT = 'Python-urllib/{}.{}'.format(*sys.version_info[:2])
+
+Response = collections.namedtuple('Response', ['url', 'status', 'body',
+                                               'etag', 'last_modified'])
+
+_connections = {}
+
+logger = logging.getLogger(__name__)
+
+
+def _get_connection(scheme, netloc):
+    """The open connection to a host, opening one if needed."""
+    key = (scheme, netloc)
+    if key not in _connections:
+        if scheme == 'https':
+            connection_class = http.client.HTTPSConnection
+        else:
+            connection_class = http.client.HTTPConnection
+        _connections[key] = connection_class(netloc, timeout=FETCH_TIMEOUT)
+    return _connections[key]
+
+
+def close_connections():
+    """Close every pooled connection."""
+    for connection in _connections.values():
+        connection.close()
+    _connections.clear()
+
+
+def _request(url, headers):
+    """GET over the host's pooled connection, returning the http.client
+          response with its body read.
+
+    A pooled connection the server has since closed is reopened, once.
+    """
+    parts = urllib.parse.urlsplit(url)
+    path = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query,
+                                    ''))
+    for attempt in range(2):
+        connection = _get_connection(parts.scheme, parts.netloc)
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.body = response.read()
+        except (http.client.RemoteDisconnected, ConnectionError,
+                http.client.BadStatusLine):
+            connection.close()
+            if attempt:
+                raise
+            continue
+        if response.will_close:
+            connection.close()
+        return response
+
+
+def _get_validator(source, day=None):
+    """source's FetchValidator, or None if it has none (for the given day)."""
+    try:
+        validator = models.FetchValidator.objects.get(source=source)
+    except models.FetchValidator.DoesNotExist:
+        return None
+    if day is not None and validator.day != day:
+        return None
+    return validator
+
+
+def fetch(url, source=None, day=None):
+    """GET a url, conditionally if source's validators have been saved (for
+          the given day, if any).
+
+    Returns a Response; its body is None (and status 304) if the contents
+      have not changed.  Redirects are followed; other errors raise
+      urllib.error.HTTPError, as urllib.request.urlopen() did.
+
+    >>> import datetime
+    >>> from . import load_test_server
+    >>> server = load_test_server.start_stub_server(b'<div>71</div>')
+    >>> day = datetime.date(2016, 7, 24)
+    >>> response = fetch(server.url, 'html', day)
+    >>> response.status, response.body
+    (200, b'<div>71</div>')
+    >>> save_validators('html', response, day=day)
+    >>> fetch(server.url, 'html', day).status
+    304
+    >>> server.body = b'<div>72</div>'
+    >>> fetch(server.url, 'html', day).body
+    b'<div>72</div>'
+    >>> fetch(server.url, 'html', datetime.date(2016, 7, 25)).status
+    200
+    >>> fetch(server.url + 'missing', 'html')
+    Traceback (most recent call last):
+    ...
+    urllib.error.HTTPError: HTTP Error 404: Not Found
+    >>> server.requests, server.connections
+    (5, 1)
+    >>> close_connections()
+    >>> server.shutdown()
+    """
+    headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip'}
+    if source is not None:
+        validator = _get_validator(source, day)
+        if validator is not None:
+            if validator.etag:
+                headers['If-None-Match'] = validator.etag
+            if validator.last_modified:
+                headers['If-Modified-Since'] = validator.last_modified
+    for _ in range(MAX_REDIRECTS + 1):
+        response = _request(url, headers)
+        location = response.getheader('Location')
+        if response.status in (301, 302, 303, 307, 308) and location:
+            url = urllib.parse.urljoin(url, location)
+            continue
+        break
+    if response.status == 304:
+        instrumentation.count('fetches unchanged')
+        logger.debug('%s not modified', source or url)
+        return Response(url, 304, None, None, None)
+    if response.status >= 300:
+        raise urllib.error.HTTPError(url, response.status, response.reason,
+                                     response.msg, None)
+    body = response.body
+    if response.getheader('Content-Encoding') == 'gzip':
+        body = gzip.decompress(body)
+    instrumentation.count('fetches changed')
+    return Response(url, response.status, body, response.getheader('ETag'),
+                    response.getheader('Last-Modified'))
+
+
+def fingerprint(payload, day):
+    """SHA-1 hex digest of a payload (str or bytes) as processed on a day.
+
+    >>> import datetime
+    >>> day = datetime.date(2016, 7, 24)
+    >>> fingerprint('<div>71</div>', day) == fingerprint(b'<div>71</div>', day)
+    True
+    >>> (fingerprint(b'<div>71</div>', day) ==
+    ...  fingerprint(b'<div>71</div>', day + datetime.timedelta(1)))
+    False
+    """
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    digest = hashlib.sha1(day.isoformat().encode('ascii'))
+    digest.update(payload)
+    return digest.hexdigest()
+
+
+def is_duplicate(source, digest, day):
+    """Whether source's payload with this fingerprint was already processed
+          on the day."""
+    validator = _get_validator(source, day)
+    return validator is not None and validator.fingerprint == digest
+
+
+def save_validators(source, response, digest='', day=None):
+    """Keep a response's validators, and its payload's fingerprint, for
+          source's next fetch.
+
+    The validators of a 304 response are left as they were.
+    """
+    defaults = {'fingerprint': digest, 'day': day}
+    if response.status != 304:
+        defaults.update(etag=response.etag or '',
+                        last_modified=response.last_modified or '')
+    models.FetchValidator.objects.update_or_create(source=source,
+                                                   defaults=defaults)
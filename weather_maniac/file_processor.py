@@ -2,106 +2,173 @@
 
 import csv
 import datetime
-import json
+import logging
+import multiprocessing
 import os
 import re
 from os import listdir, rename
 from os.path import getsize, isfile, join
 
-from bs4 import BeautifulSoup
+from django.db import connections
 
+from . import archive
+from . import batches
+from . import html_scan
+from . import instrumentation
+from . import json_stream
 from . import logic
 from . import logic_ocr
+from . import manifest
 from . import models
-from . import settings
+from . import publish
 
-ROOT_PATH = os.path.join(settings.BASE_DIR, 'rawdatafiles')
-CONTAINER_PATH = os.path.join(ROOT_PATH, 'Reduced_Data')
+CONTAINER_PATH = os.path.join(models.ROOT_PATH, 'Reduced_Data')
 
-DATA_RE = re.compile('20\d{2}_\d{2}_\d{2}')
+DATA_RE = re.compile(r'20\d{2}_\d{2}_\d{2}_\d{2}_\d{2}')
 
+ACT_CHUNK_SIZE = 500  # Rows per bulk save; keeps SQLite under its 999 vars.
+FCST_BATCH_FILES = 50  # Files per backfill write; about a month of forecasts.
 
-def _get_html_soup(file_name):
-    """HTML file loader."""
-    with open(file_name) as html_file:
-        html_string = html_file.read()
-    return BeautifulSoup(html_string, 'html.parser')
+# Smaller files are partial downloads.
+#   html original: 115kB, archived: 15kB;  api normal: 15kB
+MIN_FILE_SIZES = {'html': 10000, 'api': 100}
 
+logger = logging.getLogger(__name__)
 
-def get_forecasts_from_html(html_soup):
+
+def get_forecasts_from_html(html_string):
     """HTML file content loader."""
-    return html_soup.find_all('div', class_='weather-box daily-forecast')
+    return html_scan.extract_divs(html_string, *html_scan.FCST_DIV)
+
+
+def parse_forecast(source, stamp, contents):
+    """Read one html or api scrape into (predict_date, days_to_max_min).
+
+    An api scrape's contents may also be an open file, to be streamed.
+
+    The prediction date comes from when the scrape was made, its stamp.
+    Nothing is saved, so this is safe to run in a worker.
+
+    >>> from . import load_test_json
+    >>> parse_forecast('api', '2016_06_16_10_10', load_test_json.test_json)
+    ...   # doctest: +NORMALIZE_WHITESPACE
+    (datetime.date(2016, 6, 16), {0: (59, 51), 1: (63, 47), 2: (60, 47),
+    3: (69, 39), 4: (82, 44), 5: (82, 51)})
+    """
+    predict_date = logic.get_date(stamp)
+    if source == 'html':
+        daily_forecasts = get_forecasts_from_html(contents)
+        days_to_max_min = logic.get_retimed_fcsts_from_html(daily_forecasts,
+                                                            predict_date)
+    else:
+        days_to_max_min = logic.get_retimed_fcsts_from_points(
+            json_stream.iter_forecast_points(contents), predict_date)
+    return predict_date, days_to_max_min
+
+
+def parse_forecast_file(source, file_name):
+    """Read one html or api file, its stamp encoded in the filename.
+
+    >>> import tempfile
+    >>> from . import load_test_html
+    >>> directory = tempfile.mkdtemp()
+    >>> file_name = os.path.join(directory, 'html_2016_07_24_10_10.html')
+    >>> with open(file_name, 'w') as f:
+    ...   _ = f.write(load_test_html.test_html)
+    >>> parse_forecast_file('html', file_name)
+    ...   # doctest: +NORMALIZE_WHITESPACE
+    (datetime.date(2016, 7, 24), {0: (83, 59), 1: (82, 61), 2: (80, 62),
+    3: (84, 60), 4: (87, 62), 5: (92, 62)})
+    """
+    stamp = DATA_RE.search(file_name).group(0)
+    with open(file_name) as data_file:
+        if source == 'api':
+            # Streamed straight from the file
+            return parse_forecast(source, stamp, data_file)
+        return parse_forecast(source, stamp, data_file.read())
 
 
 def process_html_file(file_name):
     """Main function to extract max and min temperatures from one HTML file
         and save the contents to a DayRecord.
 
-    The prediction date comes from when the file was read, and is encoded in
-       the filename.  The html file contains a forecast time; this is ignored.
+    The html file contains a forecast time; this is ignored.
     The date the forecast applies to is normalized to PDT, and max/min temps
        are found for the time from midnight to midnight.
     """
-    predict_date = logic.get_date(DATA_RE.search(file_name).group(0))
-    html_soup = _get_html_soup(file_name)
-    daily_forecasts = get_forecasts_from_html(html_soup)
-    days_to_max_min = logic.get_retimed_fcsts_from_html(daily_forecasts,
-                                                        predict_date)
+    predict_date, days_to_max_min = parse_forecast_file('html', file_name)
     logic.process_days_to_max_min(days_to_max_min, predict_date, 'html')
 
 
-def _get_json(file_name):
-    """JSON file content loader. """
-    with open(file_name) as data_file:
-        json_data = json.load(data_file)
-    return json_data
-
-
 def process_json_file(file_name):
     """Main function to extract max and min temperatures from one API(json) file
         and save the contents to a DayRecord.
 
     The file contains temperature predictions every hour (not max/min) so the
        process is to find the max and min for a given day.
-    The prediction date comes from when the file was read, and is encoded in
-       the filename.  The json file does not contain prediction time.
+    The json file does not contain prediction time.
     The date the forecast applies to is normalized to PDT, and max/min temps
        are found for the time from midnight to midnight.
     """
-    predict_date = logic.get_date(DATA_RE.search(file_name).group(0))
-    json_data = _get_json(file_name)
-    days_to_max_min = logic.get_retimed_fcsts_from_json(json_data, predict_date)
+    predict_date, days_to_max_min = parse_forecast_file('api', file_name)
     logic.process_days_to_max_min(days_to_max_min, predict_date, 'api')
 
 
 def _process_csv_row(row, max_temp_index, min_temp_index):
-    """Convert the csv rows into saved model records."""
+    """Convert a csv row into a (date, location, max, min) tuple.  It is
+          qualified with the rest of its batch (see logic.save_actuals()).
+
+    >>> row = ['GHCND:USW00024229', 'PORTLAND INTERNATIONAL AIRPORT OR US',
+    ...        '20160801', '83', '57']
+    >>> _process_csv_row(row, 3, 4)
+    (datetime.date(2016, 8, 1), 'PDX', 83, 57)
+    >>> _process_csv_row(row[:3] + ['', '57'], 3, 4)
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid literal for int() with base 10: ''
+    """
     date = datetime.datetime.strptime(row[2], '%Y%m%d').date()
     location = models.LOCATIONS[row[1]]
     max_temp = int(row[max_temp_index])
     min_temp = int(row[min_temp_index])
-    try:
-        act_temp_model = logic.get_actual(date, location, max_temp, min_temp)
-    except ValueError as error:
-        print(error)
-    else:
-        act_temp_model.save()
+    return date, location, max_temp, min_temp
 
 
 def process_actual_csv_file(filename):
     """Main function to extract actual temperatures from the .csv file and
-       save the contents in an ActualDayRecord.
+       save the contents in ActualDayRecords.
     TMAX/TMIN column parameterized in case the .csv file changes format.
+
+    Rows for every station in LOCATIONS are kept; others are skipped.
+    The file is streamed and saved ACT_CHUNK_SIZE rows at a time, so memory
+      use does not grow with the file.
+    Returns the number of records created.
     """
+    saved = 0
+    chunk = batches.ActualBatch()
     with open(filename, newline='') as csvfile:
         csv_reader = csv.reader(csvfile, delimiter=',', quotechar='|')
         header_row = next(csv_reader)
         max_temp_index = header_row.index('TMAX')
         min_temp_index = header_row.index('TMIN')
         for row in csv_reader:
-            print(row)
-            if row[1] == 'PORTLAND INTERNATIONAL AIRPORT OR US':
-                _process_csv_row(row, max_temp_index, min_temp_index)
+            if row[1] not in models.LOCATIONS:
+                instrumentation.count('rows skipped')
+                continue
+            try:
+                chunk.append(*_process_csv_row(row, max_temp_index,
+                                               min_temp_index))
+            except ValueError as error:
+                instrumentation.count('rows rejected')
+                logger.debug('%s', error)
+            else:
+                instrumentation.count('rows processed')
+            if len(chunk) >= ACT_CHUNK_SIZE:
+                saved += logic.save_actuals(chunk)
+                chunk = batches.ActualBatch()
+    if chunk:
+        saved += logic.save_actuals(chunk)
+    return saved
 
 
 def _process_jpeg_csv_row(row):
@@ -124,7 +191,7 @@ def process_jpeg_csv_file(filename):
     with open(filename, newline='') as csvfile:
         csv_reader = csv.reader(csvfile, delimiter=',', quotechar='|')
         for row in csv_reader:
-            print(row)
+            logger.debug('%s', row)
             predict_date = datetime.datetime.strptime(row[0], '%Y_%m_%d').date()
             days_to_max_min = _process_jpeg_csv_row(row)
             logic.process_days_to_max_min(days_to_max_min, predict_date, source)
@@ -135,21 +202,42 @@ def move_file_to_archive(f, data_path, arch_path):
     rename(os.path.join(data_path, f), os.path.join(arch_path, f))
 
 
+def pack_file_to_archive(f, data_path, arch_path):
+    """Move the processed file into the packed archive."""
+    archive.pack_files(arch_path, [(DATA_RE.search(f).group(0),
+                                    os.path.join(data_path, f))], remove=True)
+
+
+def ingest_api_file(f):
+    """Process one API file from the Data/ directory, then pack it away."""
+    data_path = models.SOURCES['api']['data_path']
+    process_json_file(os.path.join(data_path, f))
+    manifest.mark_processed(data_path, f)
+    pack_file_to_archive(f, data_path, models.SOURCES['api']['arch_path'])
+
+
 def process_api_files():
     """Process the files loaded thought the API (JSON files).
 
     Comparison with 100B done to strip off partial files (normal: 15kB)
+    Only files not in the manifest (or changed since) are looked at.
     """
     data_path = models.SOURCES['api']['data_path']
-    arch_path = models.SOURCES['api']['arch_path']
-    only_files = [f for f in listdir(data_path)
-                  if isfile(os.path.join(data_path, f))]
-    for f in only_files:
+    for f in manifest.scan_new_files(data_path, DATA_RE):
         date_string = DATA_RE.search(f).group(0)
-        print('processing API {}'.format(date_string))
-        if getsize(os.path.join(data_path, f)) > 100:
-            process_json_file(data_path + f)
-            move_file_to_archive(f, data_path, arch_path)
+        logger.info('processing API %s', date_string)
+        if getsize(os.path.join(data_path, f)) > MIN_FILE_SIZES['api']:
+            ingest_api_file(f)
+        else:
+            manifest.mark_processed(data_path, f)
+
+
+def ingest_html_file(f):
+    """Process one HTML file from the Data/ directory, then pack it away."""
+    data_path = models.SOURCES['html']['data_path']
+    process_html_file(os.path.join(data_path, f))
+    manifest.mark_processed(data_path, f)
+    pack_file_to_archive(f, data_path, models.SOURCES['html']['arch_path'])
 
 
 def process_html_files():
@@ -157,53 +245,164 @@ def process_html_files():
 
     Comparison with 10KB done to strip off partial files
       (original: 115kB, archived: 15kB)
+    Only files not in the manifest (or changed since) are looked at.
     """
     data_path = models.SOURCES['html']['data_path']
-    arch_path = models.SOURCES['html']['arch_path']
-    only_files = [f for f in listdir(data_path)
-                  if isfile(os.path.join(data_path, f))]
-    for f in only_files:
+    for f in manifest.scan_new_files(data_path, DATA_RE):
         date_string = DATA_RE.search(f).group(0)
-        print('processing HTML {}'.format(date_string))
-        if getsize(os.path.join(data_path, f)) > 10000:
-            process_html_file(data_path + f)
-            move_file_to_archive(f, data_path, arch_path)
+        logger.info('processing HTML %s', date_string)
+        if getsize(os.path.join(data_path, f)) > MIN_FILE_SIZES['html']:
+            ingest_html_file(f)
+        else:
+            manifest.mark_processed(data_path, f)
+
+
+def ingest_jpeg_file(f):
+    """OCR one JPEG file from the Data/ directory into total.csv, as the
+          loader does for a fetched one."""
+    data_path = models.SOURCES['jpeg']['data_path']
+    date_string = DATA_RE.search(f).group(0)
+    with open(os.path.join(data_path, f), 'rb') as jpeg_file:
+        jpeg_image = jpeg_file.read()
+    row_list, dow_offset = logic_ocr.process_image(jpeg_image, 'jpeg',
+                                                   date_string)
+    days_to_max_min = logic_ocr.conv_row_list_to_dict(row_list, dow_offset)
+    days_to_max_min['predict'] = date_string
+    csv_file = os.path.join(models.ROOT_PATH, 'total.csv')
+    with open(csv_file, 'a', newline='') as csvfile:
+        csv_writer = csv.writer(csvfile, delimiter=',')
+        csv_writer.writerow(logic_ocr.conv_dict_to_csv_list(days_to_max_min))
+    # process_jpeg_file(HTML_DATA_PATH + f)
+    # move_file_to_archive(f, SCREEN_DATA_PATH, SCREEN_ARCH_PATH)
+    manifest.mark_processed(data_path, f)
 
 
 def process_jpeg_files():
-    """Process the files loaded thought the web site (i.e., JPEG)."""
+    """Process the files loaded thought the web site (i.e., JPEG).
+
+    The files stay where they are, so the manifest is what keeps them from
+      being read (and added to total.csv) again on every run.
+    """
     # TODO: expand this to include all jpeg files
     data_path = models.SOURCES['jpeg']['data_path']
-    only_files = [f for f in listdir(data_path)
-                  if isfile(os.path.join(data_path, f))]
-    for f in only_files:
-        if f == 'thumbs.db':
-            continue
+    for f in manifest.scan_new_files(data_path, DATA_RE):
         date_string = DATA_RE.search(f).group(0)
-        print('processing JPEG {}'.format(date_string))
-        file_name = os.path.join(data_path, f)
-        if getsize(file_name) > 10000:
-            row_list = logic_ocr.process_image(file_name, 'jpeg', date_string)
-            csv_file = os.path.join(ROOT_PATH, 'total.csv')
-            with open(csv_file, 'a', newline='') as csvfile:
-                csv_writer = csv.writer(csvfile, delimiter=',')
-                csv_writer.writerow(row_list)
-            # process_jpeg_file(HTML_DATA_PATH + f)
-            # move_file_to_archive(f, SCREEN_DATA_PATH, SCREEN_ARCH_PATH)
+        logger.info('processing JPEG %s', date_string)
+        if getsize(os.path.join(data_path, f)) > 10000:
+            ingest_jpeg_file(f)
+        else:
+            manifest.mark_processed(data_path, f)
+
+
+def ingest_actual_file(f):
+    """Process one actuals .csv file from the Data/ directory, then
+          archive it."""
+    data_path = models.ACTUAL['data_path']
+    saved = process_actual_csv_file(join(data_path, f))
+    logger.info('saved %s new Actuals', saved)
+    manifest.mark_processed(data_path, f)
+    move_file_to_archive(f, data_path, models.ACTUAL['arch_path'])
 
 
 def process_actual_files():
-    """Process the files loaded thought the web site as JPG."""
-    data_path = models.SOURCES['act']['data_path']
-    arch_path = models.SOURCES['act']['arch_path']
-    only_files = [f for f in listdir(data_path)
-                  if isfile(join(data_path, f))]
-    for f in only_files:
-        f_string = f
-        print('processing Actuals {}'.format(f_string))
-        if getsize(data_path + f) > 10:
-            process_actual_csv_file(data_path + f)
-            move_file_to_archive(f, data_path, arch_path)
+    """Process the files loaded thought the web site as JPG.
+
+    Only files not in the manifest (or changed since) are looked at.
+    """
+    data_path = models.ACTUAL['data_path']
+    for f in manifest.scan_new_files(data_path):
+        logger.info('processing Actuals %s', f)
+        if getsize(join(data_path, f)) > 10:
+            ingest_actual_file(f)
+        else:
+            manifest.mark_processed(data_path, f)
+
+
+def get_backfill_files(sources, from_data=False):
+    """List (source, file name or archive.Entry) for the archived html and
+          api scrapes, oldest first.  Partial loose files are left out.
+
+    Both the packed archive and any loose files in the Arch/ directories are
+      read.  from_data lists the unprocessed files in the Data/ directories
+      instead.
+    """
+    scrapes = []
+    for source in sources:
+        if from_data:
+            path = models.SOURCES[source]['data_path']
+        else:
+            path = models.SOURCES[source]['arch_path']
+            scrapes.extend((entry.stamp, source, entry)
+                           for entry in archive.iter_entries(path))
+        if not os.path.isdir(path):
+            continue
+        for f in listdir(path):
+            file_name = join(path, f)
+            match = DATA_RE.search(f)
+            if (match and isfile(file_name) and
+                    getsize(file_name) > MIN_FILE_SIZES[source]):
+                scrapes.append((match.group(0), source, file_name))
+    scrapes.sort(key=lambda scrape: scrape[:2])
+    return [(source, location) for _, source, location in scrapes]
+
+
+def _parse_backfill_job(job):
+    """Pool worker:  parse one scrape, returning its forecast points as a
+          ForecastBatch."""
+    source, location = job
+    try:
+        if isinstance(location, archive.Entry):
+            predict_date, days_to_max_min = parse_forecast(
+                source, location.stamp, archive.read_entry(location))
+        else:
+            predict_date, days_to_max_min = parse_forecast_file(source,
+                                                                location)
+    except (ValueError, KeyError, AttributeError, TypeError) as error:
+        logger.warning('%s not parsed: %s', location, error)
+        return job, None
+    return job, batches.ForecastBatch.from_days(days_to_max_min,
+                                                predict_date, source)
+
+
+def backfill_forecasts(files, processes=None, batch_files=FCST_BATCH_FILES):
+    """Rebuild DayRecords from many forecast scrapes (files or archive
+          Entries).
+
+    A pool parses the scrapes, while this (single) process saves the results
+      in order, batch_files files per logic.save_forecasts() call, so there
+      is one writer and the batches cover a short run of dates.
+    Yields (files done, created, updated, unparsed) after each batch.
+
+    >>> import tempfile
+    >>> from . import load_test_html
+    >>> directory = tempfile.mkdtemp()
+    >>> files = []
+    >>> for stamp in ['2016_07_24_10_10', '2016_07_25_10_10']:
+    ...   files.append(('html', os.path.join(directory,
+    ...                                      'html_' + stamp + '.html')))
+    ...   with open(files[-1][1], 'w') as f:
+    ...     _ = f.write(load_test_html.test_html)
+    >>> list(backfill_forecasts(files, processes=1, batch_files=1))
+    [(1, 6, 0, 0), (2, 5, 0, 0)]
+    """
+    connections.close_all()
+    done = 0
+    batch = batches.ForecastBatch()
+    batch_size = unparsed = 0
+    with multiprocessing.Pool(processes) as pool:
+        for job, forecasts in pool.imap(_parse_backfill_job, files,
+                                        chunksize=4):
+            done += 1
+            batch_size += 1
+            if forecasts is None:
+                unparsed += 1
+            else:
+                batch.extend(forecasts)
+            if batch_size >= batch_files or done == len(files):
+                created, updated = logic.save_forecasts(batch)
+                yield done, created, updated, unparsed
+                batch = batches.ForecastBatch()
+                batch_size = unparsed = 0
 
 
 def main():
@@ -211,6 +410,8 @@ def main():
     process_api_files()
     process_actual_files()
     process_jpeg_files()
+    publish.publish_all()
+    instrumentation.log_counts(logger, 'File processing')
 
 if __name__ == '__main__':
     main()
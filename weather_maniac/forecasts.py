@@ -0,0 +1,130 @@
+"""Weather Maniac forecast reading.
+
+The read side of the forecasts, for the web process:  views import
+  statistics, which imports this rather than data_loader, so a web worker
+  does not load the scraping, parsing and OCR modules (BeautifulSoup,
+  Pillow, urllib) at start up.  See benchmarks/imports.py.
+"""
+
+import datetime
+import logging
+
+from . import instrumentation
+from . import models
+
+logger = logging.getLogger(__name__)
+
+
+def load_forecast_record(source_str, today):
+    """Ensure that the forecast record is current.
+
+    Look for tomorrow's record since sometimes today is missing a min temp.
+    If it is missing, the sources are scraped there and then; the ingest
+      modules are only imported in that case.
+    """
+    tomorrow = today + datetime.timedelta(1)
+    try:
+        models.DayRecord.objects.get(
+            source=source_str,
+            date_reference=tomorrow,
+            day_in_advance=1
+        )
+    except models.DayRecord.DoesNotExist:
+        from . import data_loader
+        data_loader.update_html_data()
+        data_loader.update_api_data()
+        for source_str in ['jpeg', 'jpeg3', 'jpeg4']:
+            data_loader.update_jpeg_data(source_str)
+
+
+def get_forecast(source_str, mtype, today):
+    """Get the current temperature forecast.
+
+    >>> today = datetime.date.today()
+    >>> for i in range(7):
+    ...   models.DayRecord(date_reference=today + datetime.timedelta(i),
+    ...   day_in_advance=i, source='api', max_temp=83, min_temp=50 + i).save()
+    ...   models.DayRecord(date_reference=today + datetime.timedelta(i),
+    ...   day_in_advance=i, source='html', max_temp=83, min_temp=50 - i).save()
+    >>> get_forecast('api', 'min', today)
+    {0: 50, 1: 51, 2: 52, 3: 53, 4: 54}
+    >>> get_forecast('html', 'min', today)
+    {0: 50, 1: 49, 2: 48, 3: 47, 4: 46, 5: 45, 6: 44}
+    >>> get_forecast('api', 'max', today)
+    {0: 83, 1: 83, 2: 83, 3: 83, 4: 83}
+    """
+    load_forecast_record(source_str, today)
+    records = []
+    for day in range(models.SOURCES[source_str]['length']):
+        try:
+            record = [models.DayRecord.objects.get(
+                source=source_str,
+                day_in_advance=day,
+                date_reference=today + datetime.timedelta(day)
+            )]
+        except models.DayRecord.DoesNotExist:
+            instrumentation.count('missing forecasts')
+            logger.debug('Forecast point missing: %s, day %s',
+                         source_str, day)
+        else:
+            records += record
+    if mtype == 'max':
+        days_to_temp = {record.day_in_advance: record.max_temp
+                        for record in records}
+    else:
+        days_to_temp = {record.day_in_advance: record.min_temp
+                        for record in records}
+    return days_to_temp
+
+
+def _read_forecasts(sources, today):
+    """Read the sources' forecasts from today in one query (in day order, as
+          obfuscate_forecast() draws its noise in that order)."""
+    days = max(models.SOURCES[source_str]['length'] for source_str in sources)
+    forecasts = {source_str: {mtype: {} for mtype in models.TYPES}
+                 for source_str in sources}
+    records = models.DayRecord.objects.filter(
+        source__in=sources, date_reference__range=(
+            today, today + datetime.timedelta(days - 1))
+    ).order_by('day_in_advance').values_list(
+        'source', 'date_reference', 'day_in_advance', 'max_temp', 'min_temp')
+    for source_str, date, day, max_temp, min_temp in records:
+        if (date - today).days == day < models.SOURCES[source_str]['length']:
+            forecasts[source_str]['max'][day] = max_temp
+            forecasts[source_str]['min'][day] = min_temp
+    return forecasts
+
+
+def get_forecasts(sources, today):
+    """Get the current forecasts of several sources at once, as
+          {source: {mtype: forecast}}, each as get_forecast() returns it.
+
+    If a source has no record for tomorrow, the sources are scraped (once)
+      and read again, as in load_forecast_record().
+
+    >>> today = datetime.date.today()
+    >>> for source_str in ['api', 'html']:
+    ...   for i in range(7):
+    ...     models.DayRecord(date_reference=today + datetime.timedelta(i),
+    ...     day_in_advance=i, source=source_str, max_temp=83, min_temp=50 + i
+    ...     ).save()
+    >>> forecasts = get_forecasts(['api', 'html'], today)
+    >>> forecasts['api']['min']
+    {0: 50, 1: 51, 2: 52, 3: 53, 4: 54}
+    >>> forecasts['html']['max'] == get_forecast('html', 'max', today)
+    True
+    """
+    forecasts = _read_forecasts(sources, today)
+    stale = [source_str for source_str in sources
+             if 1 not in forecasts[source_str]['max']]
+    if stale:
+        load_forecast_record(stale[0], today)
+        forecasts = _read_forecasts(sources, today)
+    for source_str in sources:
+        missing = (models.SOURCES[source_str]['length'] -
+                   len(forecasts[source_str]['max']))
+        if missing:
+            instrumentation.count('missing forecasts', missing)
+            logger.debug('Forecast points missing: %s, %s days', source_str,
+                         missing)
+    return forecasts
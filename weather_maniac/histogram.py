@@ -5,11 +5,18 @@ These functions deal with:
 """
 
 import datetime
+import logging
 import math
+import multiprocessing
 
+from django.db import connections, transaction
 from django.db.models import Max, Min
 
+from . import instrumentation
 from . import models
+from . import singleflight
+
+logger = logging.getLogger(__name__)
 
 
 def create_histogram(source, location, mtype, day_in_advance):
@@ -138,8 +145,8 @@ def update_histogram(histo, error, date):
         ebin.save()
 
 
-def populate_all_histograms():
-    """Maintenance function to re-generate all histograms
+def populate_all_histograms(location=models.DEFAULT_LOCATION):
+    """Maintenance function to re-generate all histograms for a location.
 
     Since the histograms update on an as-needed basis, this function might
     be used if:
@@ -150,10 +157,6 @@ def populate_all_histograms():
     >>> from . import load_test_records
     >>> load_test_records.record_loader()
     >>> populate_all_histograms()
-    ... # doctest: +ELLIPSIS, +NORMALIZE_WHITESPACE
-    Updating source: ..., loc: PDX, mtype: max, day adv: 0, error: -2,
-    date: 2016-07-01 ...
-    No forecast matching actual record for 2016-07-12
     >>> for ebin in models.ErrorBin.objects.all():
     ...   print(str(ebin))
     ...   # doctest: +ELLIPSIS
@@ -163,29 +166,137 @@ def populate_all_histograms():
     for source_str, source_item in models.SOURCES.items():
         for mtype in models.TYPES:
             for day_in_advance in range(source_item['length']):
-                location = 'PDX'
                 start_day = datetime.date(2016, 6, 1)
                 populate_histogram(source_str, location, mtype, day_in_advance,
                                    start_day)
+    instrumentation.log_counts(logger, 'Histograms for {}'.format(location))
+
+
+def get_histogram_jobs(locations):
+    """List every histogram as an independent (location, source, mtype, day)
+         rebuild job.
+
+    >>> jobs = get_histogram_jobs(['PDX', 'TRO'])
+    >>> len(jobs)
+    132
+    >>> jobs[0]
+    ('PDX', 'api', 'max', 0)
+    """
+    return [(location, source_str, mtype, day_in_advance)
+            for location in locations
+            for source_str, source_item in sorted(models.SOURCES.items())
+            for mtype in models.TYPES
+            for day_in_advance in range(source_item['length'])]
+
+
+def count_errors(source, location, mtype, day_in_advance, start_day):
+    """Count forecast errors in memory, without touching the histogram.
+
+    Returns a dict with keys as error, values as [quantity, start_date,
+      end_date], i.e. the bins populate_histogram() would build from scratch.
+
+    >>> for date in [datetime.date(2016, 7, 1), datetime.date(2016, 7, 2)]:
+    ...   models.ActualDayRecord(date_meas=date, location='PDX',
+    ...                          max_temp=76, min_temp=55).save()
+    ...   models.DayRecord(date_reference=date, day_in_advance=3,
+    ...                    source='api', max_temp=83, min_temp=50).save()
+    >>> count_errors('api', 'PDX', 'min', 3, datetime.date(2016, 6, 1))
+    {-5: [2, datetime.date(2016, 7, 1), datetime.date(2016, 7, 2)]}
+    """
+    temp_field = '{}_temp'.format(mtype)
+    forecasts = dict(models.DayRecord.objects.filter(
+        source=source,
+        day_in_advance=day_in_advance,
+        date_reference__gte=start_day
+    ).values_list('date_reference', temp_field))
+    actuals = models.ActualDayRecord.objects.filter(
+        location=location,
+        date_meas__gte=start_day
+    ).order_by('date_meas').values_list('date_meas', temp_field)
+    error_to_bin = {}
+    for date, act_temp in actuals:
+        if date not in forecasts:
+            continue
+        error = forecasts[date] - act_temp
+        if error in error_to_bin:
+            error_to_bin[error][0] += 1
+            error_to_bin[error][2] = date
+        else:
+            error_to_bin[error] = [1, date, date]
+    return error_to_bin
+
+
+def rebuild_histogram(job):
+    """Re-generate one histogram from scratch.
+
+    The errors are counted first, then the old bins are swapped for the new
+      ones in a short transaction that starts with a write, so parallel
+      rebuilds queue on the database lock rather than deadlock on it.
+    Dropping the old bins means gaps in the Actual Day Records which were
+      filled in later get counted.  An interrupted rebuild leaves the
+      histogram as it was.
+    Returns the job and the number of forecast errors counted.
+
+    >>> models.ActualDayRecord(date_meas=datetime.date(2016, 7, 1),
+    ... location='PDX', max_temp=76, min_temp=55).save()
+    >>> models.DayRecord(date_reference=datetime.date(2016, 7, 1),
+    ... day_in_advance=3, source='api', max_temp=83, min_temp=50).save()
+    >>> rebuild_histogram(('PDX', 'api', 'max', 3))
+    (('PDX', 'api', 'max', 3), 1)
+    >>> rebuild_histogram(('PDX', 'api', 'max', 3))
+    (('PDX', 'api', 'max', 3), 1)
+    >>> for ebin in models.ErrorBin.objects.all():
+    ...   print(str(ebin))
+    api, max, PDX, 3, 7, 1, 2016-07-01, 2016-07-01
+    """
+    location, source, mtype, day_in_advance = job
+    error_to_bin = count_errors(source, location, mtype, day_in_advance,
+                                datetime.date(2016, 6, 1))
+    histo = get_histogram(source, location, mtype, day_in_advance)
+    with transaction.atomic():
+        histo.errorbin_set.all().delete()
+        models.ErrorBin.objects.bulk_create(
+            [create_bin(histo, error, quantity, start_date, end_date)
+             for error, (quantity, start_date, end_date)
+             in error_to_bin.items()])
+    return job, sum(ebin[0] for ebin in error_to_bin.values())
+
+
+def _rebuild_histogram_worker(job):
+    """Worker process entry point:  rebuild one histogram."""
+    return rebuild_histogram(job)
+
+
+def rebuild_histograms(jobs, processes=None):
+    """Rebuild the histograms for the given jobs on a process pool.
+
+    Yields (job, count) as each job finishes, in completion order.  The
+      parent's database connections are closed first so that each worker
+      opens its own.
+    """
+    connections.close_all()
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap_unordered(_rebuild_histogram_worker, jobs):
+            yield result
 
 
 def populate_histogram(source, location, mtype, day_in_advance, start_day):
     """Main function to populate Error Bins in appropriate Error Histogram.
 
     Combines data from ActualDayRecords (i.e., measured temperature) and data
-       from matching DayRecords (i.e., forecast).
+       from matching DayRecords (i.e., forecast).  The forecasts are read in
+       one query rather than one per actual record.
 
     >>> models.ActualDayRecord(date_meas=datetime.date(2016, 7, 1),
     ... location='PDX', max_temp=76, min_temp=55).save()
+    >>> instrumentation.reset_counts()
     >>> populate_histogram('api', 'PDX', 'max', 3, datetime.date(2016, 6, 2))
-    No forecast matching actual record for 2016-07-01
     ErrorHistogram(source='api', mtype='max', location='PDX', day_in_advance=3)
+    >>> instrumentation.COUNTS['missing forecasts']
+    1
     >>> models.DayRecord(date_reference=datetime.date(2016, 7, 1),
     ... day_in_advance=3, source='api', max_temp=83, min_temp=50).save()
     >>> populate_histogram('api', 'PDX', 'max', 3, datetime.date(2016, 6, 2))
-    ...   # doctest: +NORMALIZE_WHITESPACE
-    Updating source: api, loc: PDX, mtype: max, day adv: 3, error: 7,
-    date: 2016-07-01
     ErrorHistogram(source='api', mtype='max', location='PDX', day_in_advance=3)
     >>> populate_histogram('api', 'PDX', 'max', 3, datetime.date(2016, 7, 20))
     ErrorHistogram(source='api', mtype='max', location='PDX', day_in_advance=3)
@@ -199,26 +310,32 @@ def populate_histogram(source, location, mtype, day_in_advance, start_day):
     actuals = models.ActualDayRecord.objects.filter(
         location=location,
         date_meas__gte=start_day
-    )
+    ).order_by('date_meas')
+    forecasts = {forecast.date_reference: forecast
+                 for forecast in models.DayRecord.objects.filter(
+                     source=source,
+                     day_in_advance=day_in_advance,
+                     date_reference__gte=start_day)}
     histo = get_histogram(source, location, mtype, day_in_advance)
+    debug = logger.isEnabledFor(logging.DEBUG)
     for act_record in actuals:
         date = act_record.date_meas
-        try:
-            forecast = models.DayRecord.objects.get(
-                date_reference=date,
-                source=source,
-                day_in_advance=day_in_advance,
-            )
-        except models.DayRecord.DoesNotExist:
-            print('No forecast matching actual record for {}'.format(date))
+        if date not in forecasts:
+            instrumentation.count('missing forecasts')
+            if debug:
+                logger.debug('No forecast matching actual record for %s',
+                             date)
             continue
+        forecast = forecasts[date]
         if mtype == 'max':
             error = forecast.max_temp - act_record.max_temp
         else:
             error = forecast.min_temp - act_record.min_temp
-        print('Updating source: {}, loc: {}, mtype: {}, '
-              'day adv: {}, error: {}, date: {}'.
-              format(source, location, mtype, day_in_advance, error, str(date)))
+        instrumentation.count('errors counted')
+        if debug:
+            logger.debug('Updating source: %s, loc: %s, mtype: %s, '
+                         'day adv: %s, error: %s, date: %s',
+                         source, location, mtype, day_in_advance, error, date)
         update_histogram(histo, error, date)
     return histo
 
@@ -227,6 +344,9 @@ def get_latest_matching_day(source, location, day_in_adv, start_day):
     """Check for presence of both a DayRecord and an ActualDayRecord on any one
          day between a particular day and today.
 
+    This is one query regardless of how far back start_day is, so a location
+      whose histograms have never been built is still quick to check.
+
     >>> models.ActualDayRecord(date_meas=datetime.date(2016, 8, 1),
     ... location='PDX', max_temp=76, min_temp=55).save()
     >>> models.DayRecord(date_reference=datetime.date(2016, 8, 2),
@@ -240,21 +360,17 @@ def get_latest_matching_day(source, location, day_in_adv, start_day):
     >>> get_latest_matching_day('api', 'PDX', 3, datetime.date(2016, 8, 3))
     datetime.date(2016, 6, 1)
     """
-    day_count = (datetime.date.today() - start_day).days
-    day_iter = [start_day + datetime.timedelta(n) for n in range(day_count)]
-    latest_day = datetime.date(2016, 6, 1)
-    for day in day_iter:
-        if ((len(models.DayRecord.objects.filter(
-            date_reference=day,
-            day_in_advance=day_in_adv,
-            source=source,
-        )) > 0) and
-         (len(models.ActualDayRecord.objects.filter(
-            date_meas=day,
-            location=location
-         )) > 0)):
-            latest_day = day
-    return latest_day
+    matching_dates = models.ActualDayRecord.objects.filter(
+        location=location
+    ).values('date_meas')
+    latest_day = models.DayRecord.objects.filter(
+        source=source,
+        day_in_advance=day_in_adv,
+        date_reference__gte=start_day,
+        date_reference__lt=datetime.date.today(),
+        date_reference__in=matching_dates
+    ).aggregate(Max('date_reference'))['date_reference__max']
+    return latest_day or datetime.date(2016, 6, 1)
 
 
 def get_latest_histogram_bin(source, location, mtype, day_in_advance):
@@ -269,6 +385,10 @@ def get_latest_histogram_bin(source, location, mtype, day_in_advance):
 
     >>> get_latest_histogram_bin('api', 'PDX', 'max', 2)
     datetime.date(2016, 6, 1)
+    >>> get_histogram('api', 'TRO', 'max', 2)
+    ErrorHistogram(source='api', mtype='max', location='TRO', day_in_advance=2)
+    >>> get_latest_histogram_bin('api', 'TRO', 'max', 2)
+    datetime.date(2016, 6, 1)
     >>> from . import load_test_records
     >>> load_test_records.histo_loader()
     >>> get_latest_histogram_bin('api', 'PDX', 'max', 2)
@@ -284,7 +404,8 @@ def get_latest_histogram_bin(source, location, mtype, day_in_advance):
     except models.ErrorHistogram.DoesNotExist:
         return datetime.date(2016, 6, 1)
     bins = histo.errorbin_set.all()
-    return bins.aggregate(Max('end_date'))['end_date__max']
+    latest_bin = bins.aggregate(Max('end_date'))['end_date__max']
+    return latest_bin or datetime.date(2016, 6, 1)
 
 
 def display_histogram(source, location, mtype, day_in_advance):
@@ -344,6 +465,9 @@ def display_histogram(source, location, mtype, day_in_advance):
 def get_all_bins(source, location, mtype, day_in_advance):
     """Returns all bins for a particular histogram.
 
+    This only reads:  a histogram that does not exist yet has no bins, and is
+      left to populate_histogram() to create (under its lock).
+
     >>> from . import load_test_records
     >>> load_test_records.histo_loader()
     >>> get_all_bins('api', 'PDX', 'max', 2)
@@ -359,8 +483,12 @@ def get_all_bins(source, location, mtype, day_in_advance):
     location='PDX', day_in_advance=2), error=3, quantity=3,
     start_date=datetime.date(2016, 6, 1), end_date=datetime.date(2016, 8, 1))]>
     """
-    histo = get_histogram(source, location, mtype, day_in_advance)
-    return histo.errorbin_set.all()
+    return models.ErrorBin.objects.filter(
+        member_of_hist__source=source,
+        member_of_hist__location=location,
+        member_of_hist__mtype=mtype,
+        member_of_hist__day_in_advance=day_in_advance
+    ).order_by('pk')
 
 
 def get_statistics_per_day(bins):
@@ -383,6 +511,59 @@ def get_statistics_per_day(bins):
     return mean, std
 
 
+def refresh_histogram(source_str, location, mtype, day_in_advance):
+    """Bring one histogram up to date with the forecasts and actuals since
+          its latest bin, returning whether there were any.
+
+    Only a stale histogram takes its lock (see singleflight.py), and it is
+      checked again once the lock is held, as another worker may have
+      populated it meanwhile.  If the lock is not taken in time, the
+      histogram is left as it is.
+
+    >>> from . import load_test_records
+    >>> load_test_records.record_loader()
+    >>> refresh_histogram('api', 'PDX', 'max', 1)
+    True
+    >>> refresh_histogram('api', 'PDX', 'max', 1)
+    False
+    """
+    latest_bin = get_latest_histogram_bin(source_str, location, mtype,
+                                          day_in_advance)
+    latest_day = get_latest_matching_day(source_str, location, day_in_advance,
+                                         latest_bin)
+    if latest_day <= latest_bin:
+        return False
+    key = singleflight.make_key('histogram', source_str, location, mtype,
+                                day_in_advance)
+    with singleflight.database_lock(key) as locked:
+        if not locked:
+            return False
+        latest_bin = get_latest_histogram_bin(source_str, location, mtype,
+                                              day_in_advance)
+        if latest_day <= latest_bin:
+            return False
+        populate_histogram(source_str, location, mtype, day_in_advance,
+                           latest_bin)
+    return True
+
+
+def refresh_all_histograms(locations=None):
+    """Bring every histogram (of every location, by default) up to date,
+          returning the number that were stale.
+
+    The pages' bulk reads (statistics.get_bulk_statistics()) and the
+      snapshot rely on this having been run after each ingest (see
+      publish.publish_all()).
+    """
+    if locations is None:
+        locations = sorted(models.LOCATIONS.values())
+    refreshed = sum(refresh_histogram(source_str, location, mtype, day)
+                    for location, source_str, mtype, day in
+                    get_histogram_jobs(locations))
+    logger.info('%s histograms brought up to date', refreshed)
+    return refreshed
+
+
 def get_statistics(source_str, location, mtype):
     """Main function to collect statistics for application to the forecast
          points on the web-site.
@@ -398,11 +579,7 @@ def get_statistics(source_str, location, mtype):
     means = {}
     stds = {}
     for day in range(models.SOURCES[source_str]['length']):
-        latest_bin = get_latest_histogram_bin(source_str, location, mtype, day)
-        latest_day = get_latest_matching_day(source_str,
-                                             location, day, latest_bin)
-        if latest_day > latest_bin:
-            populate_histogram(source_str, location, mtype, day, latest_bin)
+        refresh_histogram(source_str, location, mtype, day)
         bins = get_all_bins(source_str, location, mtype, day)
         means[day], stds[day] = get_statistics_per_day(bins)
     return means, stds
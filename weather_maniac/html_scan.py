@@ -0,0 +1,115 @@
+"""Weather Maniac targeted HTML extraction.
+
+The scraped pages are ~115 kB, but only one block of divs is wanted from
+  each.  Rather than build a tree of the whole page, extract_divs() walks the
+  tags SAX-style, noting where each matching div starts and ends, and stops
+  reading as soon as the element holding them closes.  Only those pieces are
+  then parsed by BeautifulSoup, limited by a SoupStrainer.
+Small pages (such as the archived files, which hold only the wanted divs)
+  gain nothing from the scan, so they and pages where the scan finds nothing
+  (e.g., badly broken HTML) are parsed whole, with just the strainer.
+"""
+
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup, SoupStrainer, UnicodeDammit
+
+SCAN_CHUNK_SIZE = 8192
+SCAN_MIN_SIZE = 20000  # Below this, scanning costs more than it saves.
+
+FCST_DIV = ('class', 'weather-box daily-forecast')
+MEAS_DIV = ('id', 'content')
+
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+             'keygen', 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+
+
+class _DivScanner(HTMLParser):
+    """Find the (start, end) line positions of divs with a given attribute.
+
+    An open-tag stack is kept so that unclosed tags (<p>, <li>, ...) do not
+      throw off where the matching divs end.
+    """
+
+    def __init__(self, attr, value):
+        super().__init__(convert_charrefs=False)
+        self.attr = attr
+        self.value = value
+        self.stack = []
+        self.match_depth = None
+        self.start = None
+        self.spans = []
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if self.done or tag in VOID_TAGS:
+            return
+        self.stack.append(tag)
+        if (self.start is None and tag == 'div' and
+                dict(attrs).get(self.attr) == self.value):
+            self.start = self.getpos()
+            self.match_depth = len(self.stack)
+
+    def handle_endtag(self, tag):
+        if self.done or tag not in self.stack:
+            return
+        while self.stack:
+            depth = len(self.stack)
+            if self.start is not None and depth == self.match_depth:
+                self.spans.append((self.start, self.getpos()))
+                self.start = None
+            if self.match_depth is not None and depth < self.match_depth:
+                self.done = True    # The container of the matches closed.
+            if self.stack.pop() == tag:
+                break
+
+
+def _to_index(line_starts, position):
+    """Convert an HTMLParser (line, offset) position to a string index."""
+    line, offset = position
+    return line_starts[line - 1] + offset
+
+
+def scan_divs(html_string, attr, value):
+    """Return the source of each div whose attr is value, in page order.
+
+    >>> page = ('<html><body><div id="nav"><p>menu</div>'
+    ...         '<div><div class="box">1<br></div><div class="box">2</div>'
+    ...         '</div><div class="box">ignored</div></body></html>')
+    >>> scan_divs(page, 'class', 'box')
+    ['<div class="box">1<br></div>', '<div class="box">2</div>']
+    """
+    line_starts = [0]
+    for index, char in enumerate(html_string):
+        if char == '\n':
+            line_starts.append(index + 1)
+    scanner = _DivScanner(attr, value)
+    for start in range(0, len(html_string), SCAN_CHUNK_SIZE):
+        scanner.feed(html_string[start:start + SCAN_CHUNK_SIZE])
+        if scanner.done:
+            break
+    pieces = []
+    for start, end in scanner.spans:
+        end_index = html_string.index('>', _to_index(line_starts, end)) + 1
+        pieces.append(html_string[_to_index(line_starts, start):end_index])
+    return pieces
+
+
+def extract_divs(html_data, attr, value):
+    """Return the matching divs as BeautifulSoup tags.
+
+    html_data may be str or bytes (as read from the web).
+
+    >>> extract_divs(b'<div><div id="a">x</div></div>', 'id', 'a')
+    [<div id="a">x</div>]
+    >>> extract_divs('<div id="a">x', 'id', 'a')
+    [<div id="a">x</div>]
+    """
+    if isinstance(html_data, bytes):
+        html_data = UnicodeDammit(html_data, is_html=True).unicode_markup
+    strainer = SoupStrainer('div', attrs={attr: value})
+    if len(html_data) >= SCAN_MIN_SIZE:
+        pieces = scan_divs(html_data, attr, value)
+        html_data = ''.join(pieces) or html_data
+    soup = BeautifulSoup(html_data, 'html.parser', parse_only=strainer)
+    return soup.find_all('div', attrs={attr: value})
@@ -0,0 +1,99 @@
+"""Weather Maniac instrumentation.
+
+Hot loops tally what they did (rows processed, rows skipped, missing
+  forecasts) with count() instead of printing a line per record.  The tallies
+  are logged as one summary line by log_counts(), usually at the end of a run.
+Per-record detail goes to each module's logger at DEBUG level; the levels are
+  set per module through settings.LOGGING.
+Slow outside calls (scraping, OCR) are wrapped with timed(), which adds up
+  their time while a request is being profiled (see middleware.py).
+"""
+
+import collections
+import functools
+import logging
+import threading
+import time
+
+COUNTS = collections.Counter()
+
+_timings = threading.local()
+
+
+def count(event, amount=1):
+    """Add to the tally for an event.
+
+    >>> reset_counts()
+    >>> count('rows processed')
+    >>> count('rows processed', 2)
+    >>> COUNTS['rows processed']
+    3
+    """
+    COUNTS[event] += amount
+
+
+def reset_counts():
+    """Clear all of the tallies."""
+    COUNTS.clear()
+
+
+def format_counts(counts):
+    """Format tallies as one line, in alphabetical order.
+
+    >>> format_counts({'rows skipped': 2, 'rows processed': 10})
+    'rows processed: 10, rows skipped: 2'
+    >>> format_counts({})
+    'nothing counted'
+    """
+    if not counts:
+        return 'nothing counted'
+    return ', '.join('{}: {}'.format(event, qty)
+                     for event, qty in sorted(counts.items()))
+
+
+def log_counts(logger, title, level=logging.INFO):
+    """Log the tallies as one summary line, then clear them."""
+    logger.log(level, '%s: %s', title, format_counts(COUNTS))
+    reset_counts()
+
+
+def start_timings():
+    """Start adding up timed() calls on this thread."""
+    _timings.totals = collections.Counter()
+
+
+def stop_timings():
+    """Stop adding up timed() calls, returning the seconds spent per name."""
+    totals = getattr(_timings, 'totals', None)
+    _timings.totals = None
+    return dict(totals or {})
+
+
+def timed(name):
+    """Decorator adding the time spent in a function to the named total.
+
+    Nothing is measured unless start_timings() has been called.
+
+    >>> @timed('nap')
+    ... def nap():
+    ...   time.sleep(0.01)
+    >>> nap()
+    >>> start_timings()
+    >>> nap()
+    >>> totals = stop_timings()
+    >>> sorted(totals), totals['nap'] >= 0.01
+    (['nap'], True)
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            totals = getattr(_timings, 'totals', None)
+            if totals is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                totals[name] += time.perf_counter() - start
+        return wrapper
+    return decorator
@@ -0,0 +1,155 @@
+"""Weather Maniac streaming JSON reader.
+
+An API forecast is a JSON object whose "list" holds a row for each forecast
+  time.  json.loads() builds the whole document before any of it can be used;
+  iter_array() instead reads it a chunk at a time and decodes the rows one at
+  a time, so only the current row is held in memory however long the
+  forecast is.
+The other members of the top level object are decoded and dropped.
+iter_items() streams the elements of a top level array in the same way.
+"""
+
+import io
+import json
+
+CHUNK_SIZE = 65536
+
+_NUMBER_CHARACTERS = '0123456789.eE+-'
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """A text stream read a chunk at a time, with the unread part buffered.
+
+    A str is decoded where it is, as one whole chunk.
+    """
+
+    def __init__(self, contents, chunk_size=CHUNK_SIZE):
+        if isinstance(contents, str):
+            self.stream = None
+            self.buffer = contents
+        else:
+            if isinstance(contents, bytes):
+                contents = io.TextIOWrapper(io.BytesIO(contents),
+                                            encoding='utf-8')
+            self.stream = contents
+            self.buffer = ''
+        self.chunk_size = chunk_size
+        self.pos = 0
+
+    def fill(self):
+        """Read another chunk (larger, if a value outgrows the buffer);
+              False at the end of the stream."""
+        if self.stream is None:
+            return False
+        unread = self.buffer[self.pos:]
+        chunk = self.stream.read(max(self.chunk_size, len(unread)))
+        if not chunk:
+            return False
+        self.buffer = unread + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """The next character that is not whitespace, '' at the end."""
+        while True:
+            while self.pos < len(self.buffer) and \
+                    self.buffer[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, characters):
+        """Consume the next character, which must be one of characters."""
+        character = self.peek()
+        if not character or character not in characters:
+            raise json.JSONDecodeError(
+                'Expecting one of {!r}'.format(characters), self.buffer,
+                self.pos)
+        self.pos += 1
+        return character
+
+    def decode(self):
+        """Decode the next whole value."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number (e.g., '3.' of 3.5) may carry on in the next chunk.
+            if (end < len(self.buffer) and
+                    self.buffer[end] not in _NUMBER_CHARACTERS) or \
+                    not self.fill():
+                self.pos = end
+                return value
+
+
+def _iter_elements(reader):
+    """Yield the elements of the array starting at the reader."""
+    reader.expect('[')
+    if reader.peek() == ']':
+        return
+    while True:
+        yield reader.decode()
+        if reader.expect(',]') == ']':
+            return
+
+
+def iter_items(contents, chunk_size=CHUNK_SIZE):
+    """Yield each element of a JSON array, e.g., a dumpdata fixture.
+
+    contents is a str, bytes, or a text file.
+
+    >>> list(iter_items(b'[{"model": "weather_maniac.dayrecord"}, []]'))
+    [{'model': 'weather_maniac.dayrecord'}, []]
+    """
+    return _iter_elements(_Reader(contents, chunk_size))
+
+
+def iter_array(contents, key, chunk_size=CHUNK_SIZE):
+    """Yield each element of the array under key in a JSON object.
+
+    contents is a str, bytes, or a text file.  Nothing is yielded if the
+      object has no such key.
+
+    >>> import io
+    >>> list(iter_array(io.StringIO('{"cod": "200", "list": [{"dt": 1}, '
+    ...                             '[2], 3.5]}'), 'list', chunk_size=4))
+    [{'dt': 1}, [2], 3.5]
+    >>> list(iter_array(b'{"message": 0.0032, "cnt": 0}', 'list'))
+    []
+    >>> list(iter_array('{"list": [1 2]}', 'list'))
+    Traceback (most recent call last):
+    ...
+    json.decoder.JSONDecodeError: Expecting one of ',]': line 1 column 13 \
+(char 12)
+    """
+    reader = _Reader(contents, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.decode()
+        reader.expect(':')
+        if name == key:
+            yield from _iter_elements(reader)
+            return
+        reader.decode()
+        if reader.expect(',}') == '}':
+            return
+
+
+def iter_forecast_points(contents, chunk_size=CHUNK_SIZE):
+    """Yield (epoch time, temperature in K) for each row of an API forecast.
+
+    >>> from . import load_test_json
+    >>> points = list(iter_forecast_points(load_test_json.test_json))
+    >>> len(points), points[0]
+    (40, (1466132400, 288.2))
+    """
+    for row in iter_array(contents, 'list', chunk_size):
+        yield row['dt'], row['main']['temp']
@@ -0,0 +1,57 @@
+"""Local HTTP stub server for the fetch tests.
+
+It serves one body at '/', with an ETag and Last-Modified, and answers 304
+  when the request's validators still match.  It keeps connections alive and
+  counts requests and connections, so reuse can be checked.
+"""
+
+import hashlib
+import http.server
+import socketserver
+import threading
+
+LAST_MODIFIED = 'Sun, 24 Jul 2016 10:10:00 GMT'
+
+
+class _StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests += 1
+        if self.path != '/':
+            self.send_error(404)
+            return
+        etag = '"{}"'.format(hashlib.sha1(self.server.body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', LAST_MODIFIED)
+        self.send_header('Content-Length', str(len(self.server.body)))
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _StubServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+def start_stub_server(body):
+    """Serve body on a free local port, in a background thread."""
+    server = _StubServer(('127.0.0.1', 0), _StubHandler)
+    server.body = body
+    server.requests = 0
+    server.connections = 0
+    server.url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -5,12 +5,25 @@ These functions deal with:
   -- Creating instances of ActualDayRecord to hold measure temperature points
   -- Qualifying and then loading the forecast data into DayRecord
   -- Qualifying and then loading the measured temps into ActualDayRecord
+Batches of points (see batches.py) are qualified a column at a time and
+  saved in one transaction.
 """
-from datetime import datetime, timedelta
+import logging
+import operator
+from datetime import datetime
 
+from django.db import transaction
+
+from . import batches
+from . import instrumentation
 from . import models
 from . import utilities
 
+FIRST_DATE = datetime(2016, 5, 1).date()
+LAST_DATE = datetime(2116, 6, 1).date()
+
+logger = logging.getLogger(__name__)
+
 
 def _create_forecast(date, day_in_advance, source, max_temp, min_temp):
     """Create Forecast model.
@@ -40,8 +53,8 @@ def _qualify_date(date):
     False
     """
     return all([
-        date > datetime(2016, 5, 1).date(),
-        date < datetime(2116, 6, 1).date()
+        date > FIRST_DATE,
+        date < LAST_DATE
     ])
 
 
@@ -114,6 +127,86 @@ def _qualify_act_fields(date, location, max_temp, min_temp):
         raise ValueError('Min temp not correct.  Got {}'.format(str(min_temp)))
 
 
+def _qualify_columns(batch):
+    """Whether every date and temp of a batch qualifies, checked a column
+          at a time.
+
+    (Every max at least its min, the lowest min and the highest max in range,
+      puts every temp in range.)
+    """
+    return all([
+        min(batch.ordinals) > FIRST_DATE.toordinal(),
+        max(batch.ordinals) < LAST_DATE.toordinal(),
+        min(batch.min_temps) >= -99,
+        max(batch.max_temps) <= 199,
+        not any(map(operator.lt, batch.max_temps, batch.min_temps))
+    ])
+
+
+def _qualify_batch(batch):
+    """Field qualifiers for a whole ForecastBatch, prior to saving it.
+
+    The batch is returned as it is if its columns qualify.  If not, its
+      points are checked one at a time by _qualify_fields(), and those that
+      fail are counted, logged and left out of the batch returned.
+
+    >>> from . import batches
+    >>> batch = batches.ForecastBatch.from_days(
+    ...   {0: (83, 59), 1: (82, 61)}, datetime(2016, 7, 24).date(), 'api')
+    >>> _qualify_batch(batch) is batch
+    True
+    >>> batch.append(datetime(2016, 7, 24).date(), 8, 'api', 65, 23)
+    >>> len(_qualify_batch(batch))
+    2
+    """
+    if not batch or all([
+            _qualify_columns(batch),
+            min(batch.days_in_advance) >= 0,
+            max(batch.days_in_advance) <= 7,
+            models.SOURCES.keys() >= set(batch.sources)]):
+        return batch
+    qualified = batches.ForecastBatch()
+    for point in batch:
+        try:
+            _qualify_fields(*point)
+        except ValueError as error:
+            instrumentation.count('forecasts rejected')
+            logger.warning('%s forecast rejected: %s', point[2], error)
+        else:
+            qualified.append(*point)
+    return qualified
+
+
+def _qualify_act_batch(batch):
+    """Field qualifiers for a whole ActualBatch, prior to saving it.
+
+    As _qualify_batch(), with _qualify_act_fields() for the points.  Actuals
+      come in bulk from station files, which mark missing temps as out of
+      range, so rejects are logged at DEBUG level.
+
+    >>> from . import batches
+    >>> batch = batches.ActualBatch.from_points(
+    ...   [(datetime(2016, 8, 1).date(), 'PDX', 83, 47),
+    ...    (datetime(2016, 8, 2).date(), 'PDX', -9999, 50)])
+    >>> list(_qualify_act_batch(batch))
+    [(datetime.date(2016, 8, 1), 'PDX', 83, 47)]
+    """
+    if not batch or all([
+            _qualify_columns(batch),
+            set(models.LOCATIONS.values()) >= set(batch.locations)]):
+        return batch
+    qualified = batches.ActualBatch()
+    for point in batch:
+        try:
+            _qualify_act_fields(*point)
+        except ValueError as error:
+            instrumentation.count('actuals rejected')
+            logger.debug('Actual rejected: %s', error)
+        else:
+            qualified.append(*point)
+    return qualified
+
+
 def _update_forecast(date, day_in_advance, source, max_temp, min_temp):
     """Update the forecast point, creating a new one if needed.
 
@@ -192,8 +285,8 @@ def get_retimed_fcsts_from_html(daily_forecasts, predict_date):
 
 
 def process_days_to_max_min(days_to_max_min, predict_date, source):
-    """Iterate through dict holding days-in-advance and max/min temps, and
-          call forecast creation function with the results.
+    """Save the forecast of a dict holding days-in-advance and max/min
+          temps, as one batch (see save_forecasts()).
 
     >>> from . import models
     >>> days_to_max_min = ({0: (83, 59), 1: (82, 61), 2: (80, 62), 3: (84, 60),
@@ -210,13 +303,73 @@ def process_days_to_max_min(days_to_max_min, predict_date, source):
     2016-07-29, 5, api, 92, 62
 
     """
-    for day_in_advance, (max_temp, min_temp) in days_to_max_min.items():
-        date_reference = predict_date + timedelta(day_in_advance)
-        try:
-            _update_forecast(date_reference, day_in_advance, source,
-                             max_temp, min_temp)
-        except ValueError as error:
-            print(error)
+    save_forecasts(batches.ForecastBatch.from_days(days_to_max_min,
+                                                   predict_date, source))
+
+
+def save_forecasts(batch):
+    """Save a ForecastBatch of forecast points.
+
+    As with _update_forecast(), a point already in the database (or repeated
+      in the batch) keeps the highest max and lowest min seen.  Points that
+      do not qualify are counted, logged and skipped (see _qualify_batch()).
+    The batch is read in one query and written in one transaction, so it
+      should cover a short run of dates.  Existing records are read as rows;
+      model instances are only made for the records created.
+      Returns (created, updated).
+
+    >>> from . import batches, models
+    >>> save_forecasts(batches.ForecastBatch.from_points(
+    ...   [(datetime(2016, 8, 1).date(), 2, 'api', 83, 47),
+    ...    (datetime(2016, 8, 2).date(), 2, 'api', 70, 40)]))
+    (2, 0)
+    >>> save_forecasts(batches.ForecastBatch.from_points(
+    ...   [(datetime(2016, 8, 1).date(), 2, 'api', 90, 50),
+    ...    (datetime(2016, 8, 1).date(), 2, 'api', 80, 40),
+    ...    (datetime(2016, 8, 2).date(), 2, 'api', 70, 40),
+    ...    (datetime(2016, 8, 3).date(), 9, 'api', 70, 40)]))
+    (0, 1)
+    >>> for record in models.DayRecord.objects.all():
+    ...   print(str(record))
+    2016-08-01, 2, api, 90, 40
+    2016-08-02, 2, api, 70, 40
+    """
+    batch = _qualify_batch(batch)
+    if not batch:
+        return 0, 0
+    instrumentation.count('forecasts saved', len(batch))
+    merged = {}
+    for date, day_in_advance, source, max_temp, min_temp in batch:
+        key = (date, day_in_advance, source)
+        if key in merged:
+            old_max, old_min = merged[key]
+            max_temp, min_temp = max(max_temp, old_max), min(min_temp, old_min)
+        merged[key] = (max_temp, min_temp)
+    existing = models.DayRecord.objects.filter(
+        source__in=set(batch.sources),
+        date_reference__range=(
+            datetime.fromordinal(min(batch.ordinals)).date(),
+            datetime.fromordinal(max(batch.ordinals)).date())
+    ).values_list('pk', 'date_reference', 'day_in_advance', 'source',
+                  'max_temp', 'min_temp')
+    updated = 0
+    with transaction.atomic():
+        for pk, date, day_in_advance, source, old_max, old_min in existing:
+            key = (date, day_in_advance, source)
+            if key not in merged:
+                continue
+            max_temp, min_temp = merged.pop(key)
+            max_temp = max(max_temp, old_max)
+            min_temp = min(min_temp, old_min)
+            if (max_temp, min_temp) != (old_max, old_min):
+                models.DayRecord.objects.filter(pk=pk).update(
+                    max_temp=max_temp, min_temp=min_temp)
+                updated += 1
+        models.DayRecord.objects.bulk_create(
+            _create_forecast(date, day_in_advance, source, max_temp, min_temp)
+            for (date, day_in_advance, source), (max_temp, min_temp)
+            in sorted(merged.items()))
+    return len(merged), updated
 
 
 def get_retimed_fcsts_from_json(json_data, predict_date):
@@ -233,20 +386,31 @@ def get_retimed_fcsts_from_json(json_data, predict_date):
     {0: (59, 51), 1: (63, 47), 2: (60, 47), 3: (69, 39), 4: (82, 44),
     5: (82, 51)}
     """
-    if 'list' not in json_data:
-        return {}
-    date_max_min_temp = {}
-    for row in json_data['list']:
-        forecast_utc = row['dt']
-        days_in_advance = utilities.calc_days_in_adv(predict_date, forecast_utc)
-        new_temp = int(utilities.temp_f(row['main']['temp']))
-        if days_in_advance in date_max_min_temp:
-            (max_temp, min_temp) = date_max_min_temp[days_in_advance]
-            date_max_min_temp[days_in_advance] = (max([new_temp, max_temp]),
-                                                  min([new_temp, min_temp]))
-        else:
-            date_max_min_temp[days_in_advance] = (new_temp, new_temp)
-    return date_max_min_temp
+    return get_retimed_fcsts_from_points(
+        ((row['dt'], row['main']['temp'])
+         for row in json_data.get('list', [])), predict_date)
+
+
+def get_retimed_fcsts_from_points(points, predict_date):
+    """Harvests temperature points streamed from a json file, as
+          (epoch time, temperature in K) pairs (see json_stream.py).
+
+    Returns a dict with keys as day in advance, values as (max_temp, min_temp).
+
+    >>> from . import json_stream, load_test_json
+    >>> predict_date = datetime(2016, 6, 16).date()
+    >>> get_retimed_fcsts_from_points(
+    ...   json_stream.iter_forecast_points(load_test_json.test_json),
+    ...   predict_date)
+    ... # doctest: +NORMALIZE_WHITESPACE
+    {0: (59, 51), 1: (63, 47), 2: (60, 47), 3: (69, 39), 4: (82, 44),
+    5: (82, 51)}
+    """
+    days_to_max_min = utilities.retime_max_min(points, predict_date)
+    # Rounding to Fahrenheit keeps the order, so it is done per day only.
+    return {day: (int(utilities.temp_f(max_temp)),
+                  int(utilities.temp_f(min_temp)))
+            for day, (max_temp, min_temp) in days_to_max_min.items()}
 
 
 def get_actual(date, location, max_temp, min_temp):
@@ -278,3 +442,54 @@ def get_actual(date, location, max_temp, min_temp):
             min_temp=min_temp
         )
     return act
+
+
+def save_actuals(batch):
+    """Save an ActualBatch of actual points.
+
+    As with get_actual(), points already in the database are left alone.
+      Points that do not qualify are counted and skipped (see
+      _qualify_act_batch()).
+    The batch is checked against the database in one query and inserted in
+      one transaction.  Returns the number of records created.
+
+    >>> from . import batches
+    >>> save_actuals(batches.ActualBatch.from_points(
+    ...   [(datetime(2016, 8, 1).date(), 'PDX', 83, 47),
+    ...    (datetime(2016, 8, 1).date(), 'TRO', 85, 45)]))
+    2
+    >>> save_actuals(batches.ActualBatch.from_points(
+    ...   [(datetime(2016, 8, 1).date(), 'PDX', 0, 0),
+    ...    (datetime(2016, 8, 2).date(), 'PDX', 80, 50),
+    ...    (datetime(2016, 8, 2).date(), 'PDX', 70, 50),
+    ...    (datetime(2016, 8, 3).date(), 'PDX', -9999, 50)]))
+    1
+    >>> for actual in models.ActualDayRecord.objects.order_by('date_meas',
+    ...                                                       'location'):
+    ...   print(str(actual))
+    2016-08-01, PDX, 83, 47
+    2016-08-01, TRO, 85, 45
+    2016-08-02, PDX, 80, 50
+    """
+    batch = _qualify_act_batch(batch)
+    if not batch:
+        return 0
+    existing = set(models.ActualDayRecord.objects.filter(
+        date_meas__in={datetime.fromordinal(ordinal).date()
+                       for ordinal in set(batch.ordinals)},
+        location__in=set(batch.locations)
+    ).values_list('date_meas', 'location'))
+    new_records = []
+    for date, location, max_temp, min_temp in batch:
+        if (date, location) in existing:
+            continue
+        existing.add((date, location))
+        new_records.append(models.ActualDayRecord(
+            date_meas=date,
+            location=location,
+            max_temp=max_temp,
+            min_temp=min_temp
+        ))
+    with transaction.atomic():
+        models.ActualDayRecord.objects.bulk_create(new_records)
+    return len(new_records)
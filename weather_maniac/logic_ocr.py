@@ -1,12 +1,14 @@
 """Weather Maniac optical character recognition functions."""
 
 import io
+import logging
 import os
 import re
 import subprocess
 
 from PIL import Image, ImageOps, ImageFilter
 
+from . import instrumentation
 from . import logic
 from . import models
 
@@ -25,6 +27,8 @@ FHI_RE = re.compile('FHI')
 FFI_RE = re.compile('FFI')
 DATE_RE = re.compile('20\d{2}_\d{2}_\d{2}')
 
+logger = logging.getLogger(__name__)
+
 
 def get_crop_dim(day_num, source_str, image_str):
     """Return the crop window.
@@ -43,6 +47,7 @@ def get_crop_dim(day_num, source_str, image_str):
     return x_min, y_min, x_max, y_max
 
 
+@instrumentation.timed('enhance')
 def crop_enhance_item(img, box, image_item):
     """Crop out and enhance an item."""
     small_img = img.crop(box)
@@ -71,6 +76,7 @@ def crop_enhance_item(img, box, image_item):
     return pad_img
 
 
+@instrumentation.timed('encode')
 def get_virtual_jpeg(img):
     """Turn the image into a .jpeg item for piping."""
     output = io.BytesIO()
@@ -80,6 +86,7 @@ def get_virtual_jpeg(img):
     return virtual_jpeg
 
 
+@instrumentation.timed('clean')
 def clean_day_results(out_string):
     """Qualify the day results as much as possible.
 
@@ -99,6 +106,7 @@ def clean_day_results(out_string):
     return out_string[:3]
 
 
+@instrumentation.timed('clean')
 def clean_temp_results(temp_string):
     """Qualify the temperature results.
 
@@ -147,13 +155,31 @@ def get_day_of_week_offset(day_string, day_num, predict_dow, dow_offset):
     return dow_offset
 
 
-def process_item(img, day_num, source_str, image_str):
-    """Process the day, max or min temp item."""
+@instrumentation.timed('decode')
+def decode_image(jpeg_image):
+    """Decode the screenshot, so that cropping does not have to."""
+    img = Image.open(io.BytesIO(jpeg_image))
+    img.load()
+    return img
+
+
+@instrumentation.timed('ocr')
+def run_engine(engine, input_image):
+    """Run the OCR engine on one item; kept separate to time it."""
+    return engine(input_image)
+
+
+def process_item(img, day_num, source_str, image_str, engine=None):
+    """Process the day, max or min temp item.
+
+    engine takes a .jpeg (bytes) and returns the text read from it; it
+      defaults to call_tesseract.
+    """
     image_item = models.SOURCES[source_str]['dims'][image_str]
     box = get_crop_dim(day_num, source_str, image_str)
     pad_img = crop_enhance_item(img, box, image_item)
     pad_jpeg = get_virtual_jpeg(pad_img)
-    tess_string = call_tesseract(pad_jpeg)
+    tess_string = run_engine(engine or call_tesseract, pad_jpeg)
     return tess_string
 
 
@@ -174,7 +200,21 @@ def conv_row_list_to_dict(row_list, dow_offset):
     return days_to_max_min
 
 
-def process_image(jpeg_image, source_str, predict_date):
+def conv_dict_to_csv_list(days_to_max_min):
+    """Convert days-to-max-min dict to list for csv writing.
+
+    >>> conv_dict_to_csv_list({'predict': '2016_09_22', 0: (78, 54),
+    ... 1: (76, 44)})
+    ['2016_09_22', 0, 78, 54, 1, 76, 44]
+    """
+    outlist = [days_to_max_min['predict']]
+    for idx in range(models.SOURCES['jpeg']['length']):
+        if idx in days_to_max_min:
+            outlist += [idx, days_to_max_min[idx][0], days_to_max_min[idx][1]]
+    return outlist
+
+
+def process_image(jpeg_image, source_str, predict_date, engine=None):
     """Main function to process a 7-day forecast image.
 
     The process is:
@@ -184,26 +224,41 @@ def process_image(jpeg_image, source_str, predict_date):
        -- Figure out what the day-of-week offset is for the prediction day
        -- Process the max temp and min temps, making a list of tuples
     -- Store the resulting list.
+    engine is the OCR engine (see process_item), tesseract by default.
+
+    >>> image = Image.new('RGB', (800, 450))
+    >>> jpeg_image = get_virtual_jpeg(image)
+    >>> process_image(jpeg_image, 'jpeg', '2016_10_07_16_53',
+    ...               engine=lambda item: '71')
+    ... # doctest: +NORMALIZE_WHITESPACE
+    ([('71', '71'), ('71', '71'), ('71', '71'), ('71', '71'), ('71', '71'),
+    ('71', '71'), ('71', '71')], 10)
        """
-    img = Image.open(io.BytesIO(jpeg_image))
+    img = decode_image(jpeg_image)
     predict_dow = logic.get_date(predict_date).weekday()
     row_list = []
     dow_offset = 10  # Make sure the first day is read, or make data garbage.
     for day_num in range(models.SOURCES[source_str]['length']):
-        tess_string = process_item(img, day_num, source_str, 'day')
+        tess_string = process_item(img, day_num, source_str, 'day',
+                                   engine)
         day_string = clean_day_results(tess_string)
         try:
             dow_offset = get_day_of_week_offset(day_string, day_num,
                                                 predict_dow, dow_offset)
         except ValueError:
             pass
-        tess_string = process_item(img, day_num, source_str, 'max')
+        tess_string = process_item(img, day_num, source_str, 'max',
+                                   engine)
         max_temp = clean_temp_results(tess_string)
-        tess_string = process_item(img, day_num, source_str, 'min')
+        tess_string = process_item(img, day_num, source_str, 'min',
+                                   engine)
         min_temp = clean_temp_results(tess_string)
         row_list.append((max_temp, min_temp))
-        print('Day: {}, Max: {}, Min: {}'.format(day_string, max_temp,
-                                                 min_temp))
+        if max_temp == '' or min_temp == '':
+            instrumentation.count('OCR days unread')
+        logger.debug('Day: %s, Max: %s, Min: %s', day_string, max_temp,
+                     min_temp)
+    instrumentation.count('images processed')
     return row_list, dow_offset
 
 
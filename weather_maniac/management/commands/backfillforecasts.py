@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from weather_maniac import file_processor
+from weather_maniac import instrumentation
+
+SOURCES = ['html', 'api']
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the html and api DayRecords from the archived files, '
+            'parsing in parallel and saving in ordered batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', action='append', choices=SOURCES,
+                            help='Source to backfill (repeatable).  '
+                                 'Defaults to both.')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Parsing processes.  Defaults to CPU count.')
+        parser.add_argument('--batch-files', type=int,
+                            default=file_processor.FCST_BATCH_FILES,
+                            help='Files saved per transaction.')
+        parser.add_argument('--data', action='store_true',
+                            help='Read the Data/ directories (unprocessed '
+                                 'files) rather than the archives.')
+
+    def handle(self, *args, **options):
+        files = file_processor.get_backfill_files(
+            options['source'] or SOURCES, options['data'])
+        self.stdout.write('{} files to backfill.'.format(len(files)))
+        start_time = time.time()
+        totals = {'created': 0, 'updated': 0, 'unparsed': 0}
+        done = 0
+        for done, created, updated, unparsed in \
+                file_processor.backfill_forecasts(files, options['processes'],
+                                                  options['batch_files']):
+            totals['created'] += created
+            totals['updated'] += updated
+            totals['unparsed'] += unparsed
+            elapsed = time.time() - start_time
+            self.stdout.write(
+                '[{}/{}] {} created, {} updated: {:.1f} files/s'.format(
+                    done, len(files), totals['created'], totals['updated'],
+                    done / elapsed if elapsed else 0))
+        elapsed = time.time() - start_time
+        self.stdout.write(
+            'Backfilled {} files in {:.1f} s: {:.1f} files/s, {:.0f} '
+            'forecasts/s; {created} created, {updated} updated, {unparsed} '
+            'unparsed.  {}.'.format(
+                done, elapsed, done / elapsed if elapsed else 0,
+                instrumentation.COUNTS['forecasts saved'] / elapsed
+                if elapsed else 0,
+                instrumentation.format_counts(instrumentation.COUNTS),
+                **totals))
+        instrumentation.reset_counts()
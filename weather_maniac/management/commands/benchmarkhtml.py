@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from weather_maniac.benchmarks import html
+
+
+class Command(BaseCommand):
+    help = ('Times the full-page HTML parse against the targeted extraction, '
+            'checking both find the same forecast divs.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory',
+                            help='Time archived html_*.html pages instead '
+                                 'of the padded test fixtures.')
+        parser.add_argument('--size', type=int, default=html.PAGE_SIZE,
+                            help='Size to pad the fixtures to.')
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--output', help='Write the JSON to this file.')
+
+    def handle(self, *args, **options):
+        results = html.run_html_benchmark(options['directory'],
+                                          options['repeat'], options['size'])
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2, sort_keys=True)
+        for name, result in sorted(results.items()):
+            self.stdout.write(
+                '{}: {} bytes, {} divs, full {:.2f} ms, targeted {:.2f} ms, '
+                '{:.1f}x'.format(name, result['size'], result['divs'],
+                                 result['full'] * 1000,
+                                 result['targeted'] * 1000,
+                                 result['speedup']))
+        mismatched = [name for name, result in results.items()
+                      if not result['same']]
+        if mismatched:
+            raise CommandError('Extractions differ for: ' +
+                               ', '.join(sorted(mismatched)))
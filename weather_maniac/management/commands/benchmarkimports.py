@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from weather_maniac.benchmarks import imports
+
+
+class Command(BaseCommand):
+    help = ('Times the imports of a fresh web worker, failing if it loads '
+            'any of the scraping, parsing or OCR modules.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--top', type=int, default=10,
+                            help='Slowest imports to show (needs Python '
+                                 '3.7 or later, for -X importtime).')
+        parser.add_argument('--output', help='Write the JSON to this file.')
+
+    def handle(self, *args, **options):
+        result = imports.run_import_benchmark(options['repeat'],
+                                              top=options['top'])
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(result, output_file, indent=2, sort_keys=True)
+        self.stdout.write(
+            'Worker imports: {:.0f} ms best, {:.0f} ms median, {} '
+            'modules'.format(result['wall_min'] * 1000,
+                             result['wall_median'] * 1000,
+                             result['modules']))
+        for module, cumulative in result['slowest']:
+            self.stdout.write('  {:>8.1f} ms  {}'.format(cumulative / 1000,
+                                                         module))
+        if result['ingest_modules']:
+            raise CommandError('Web worker imports ingest modules: ' +
+                               ', '.join(result['ingest_modules']))
@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from weather_maniac.benchmarks import api_json
+
+
+class Command(BaseCommand):
+    help = ('Times the whole-document parse of API forecasts against the '
+            'streamed parse, with the peak memory of each.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=api_json.HOURS,
+                            help='Hourly rows per city.')
+        parser.add_argument('--cities', type=int, nargs='+',
+                            default=api_json.CITIES,
+                            help='Payload sizes to time, in cities.')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help='Write the JSON to this file.')
+
+    def handle(self, *args, **options):
+        results = api_json.run_json_benchmark(
+            options['hours'], options['cities'], options['repeat'])
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2, sort_keys=True)
+        for name, result in sorted(results.items(),
+                                   key=lambda item: item[1]['size']):
+            self.stdout.write(
+                '{}: {} bytes, loads {:.1f} ms / {:.0f} kB peak, '
+                'stream {:.1f} ms / {:.0f} kB peak'.format(
+                    name, result['size'], result['loads'] * 1000,
+                    result['loads_peak'] / 1024, result['stream'] * 1000,
+                    result['stream_peak'] / 1024))
+        mismatched = [name for name, result in results.items()
+                      if not result['same']]
+        if mismatched:
+            raise CommandError('Parses differ for: ' +
+                               ', '.join(sorted(mismatched)))
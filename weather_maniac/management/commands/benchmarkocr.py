@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand
+from weather_maniac.benchmarks import ocr
+
+
+class Command(BaseCommand):
+    help = ('Runs a directory of labeled screenshots through the OCR '
+            'pipeline, reporting stage timings, throughput and accuracy.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--engine', choices=['tesseract', 'stub'],
+                            default='tesseract',
+                            help='stub times the pipeline without tesseract.')
+        parser.add_argument('--output', help='Write the JSON to this file.')
+
+    def handle(self, *args, **options):
+        engine = ocr.stub_engine if options['engine'] == 'stub' else None
+        report = ocr.run_ocr_benchmark(options['directory'], engine)
+        report_json = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(report_json)
+        self.stdout.write('{} images in {:.2f} s: {:.1f} images/s'.format(
+            report['images'], report['seconds'], report['images_per_sec']))
+        for stage in ocr.STAGES:
+            self.stdout.write('  {}: {:.3f} s'.format(
+                stage, report['stages'][stage]))
+        if report['accuracy'] is not None:
+            self.stdout.write('Accuracy: {} of {} temps ({:.1%})'.format(
+                report['correct'], report['points'], report['accuracy']))
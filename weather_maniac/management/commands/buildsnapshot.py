@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from weather_maniac import snapshot
+
+
+class Command(BaseCommand):
+    help = ("Writes today's forecasts and the error statistics to the "
+            'snapshot file served by the forecast pages.')
+
+    def handle(self, *args, **options):
+        generation = snapshot.build_snapshot()
+        self.stdout.write('Snapshot generation {} written.'.format(generation))
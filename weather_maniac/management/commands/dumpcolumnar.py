@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from weather_maniac import columnar
+
+
+class Command(BaseCommand):
+    help = ('Writes the forecast, actual and histogram tables as typed '
+            'column arrays (needs numpy), for offline analysis.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--compress', action='store_true',
+                            help='Write a compressed .npz per table, which '
+                                 'cannot be memory mapped.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            dumped = columnar.dump_columnar(options['directory'],
+                                            options['compress'])
+        except ImportError as error:
+            raise CommandError(error)
+        for table, qty in dumped.items():
+            self.stdout.write('{}: {} rows'.format(table, qty))
+        self.stdout.write('Dumped in {:.2f} s.'.format(
+            time.perf_counter() - start))
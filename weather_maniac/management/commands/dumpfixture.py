@@ -0,0 +1,26 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from weather_maniac import bulk_fixtures
+
+
+class Command(BaseCommand):
+    help = ('Dumps the weather data in dumpdata format, for loadfixture or '
+            'loaddata; a fast dumpdata.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Fixture file, .json or .json.gz')
+        parser.add_argument('model', nargs='*',
+                            help='Models to dump, e.g., '
+                                 'weather_maniac.DayRecord.  Defaults to the '
+                                 'forecast, actual and histogram models.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        model_list = [apps.get_model(label) for label in options['model']]
+        dumped = bulk_fixtures.dump_fixture(options['output'], model_list)
+        for label, qty in sorted(dumped.items()):
+            self.stdout.write('{}: {}'.format(label, qty))
+        self.stdout.write('Dumped {} objects in {:.2f} s.'.format(
+            sum(dumped.values()), time.perf_counter() - start))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from weather_maniac import bulk_fixtures
+
+
+class Command(BaseCommand):
+    help = ('Bulk loads a dumpdata format fixture (e.g., '
+            'weather_maniac.json.gz) in one transaction; a fast loaddata.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixture', help='Fixture file, .json or .json.gz')
+        parser.add_argument('--batch-size', type=int,
+                            default=bulk_fixtures.BATCH_SIZE,
+                            help='Objects per bulk insert.')
+        parser.add_argument('--replace', action='store_true',
+                            help='Empty the weather data tables first.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            loaded = bulk_fixtures.load_fixture(
+                options['fixture'], options['batch_size'], options['replace'])
+        except IntegrityError as error:
+            raise CommandError('{}  (Nothing was loaded; --replace empties '
+                               'the tables first.)'.format(error))
+        for label, qty in sorted(loaded.items()):
+            self.stdout.write('{}: {}'.format(label, qty))
+        self.stdout.write('Loaded {} objects in {:.2f} s.'.format(
+            sum(loaded.values()), time.perf_counter() - start))
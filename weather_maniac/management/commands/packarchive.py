@@ -0,0 +1,39 @@
+import os
+
+from django.core.management.base import BaseCommand
+from weather_maniac import archive
+from weather_maniac import file_processor
+from weather_maniac import models
+
+ARCHIVES = {'html': (models.SOURCES['html']['arch_path'], 'html_'),
+            'api': (models.SOURCES['api']['arch_path'], 'api_'),
+            'meas': (models.ACTUAL['arch_path'], 'meas_')}
+
+
+class Command(BaseCommand):
+    help = ('Moves the loose html_*, api_* and meas_* files in the Arch/ '
+            'directories into the packed monthly archive.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--archive', action='append',
+                            choices=sorted(ARCHIVES),
+                            help='Archive to pack (repeatable).  '
+                                 'Defaults to all.')
+        parser.add_argument('--keep', action='store_true',
+                            help='Leave the loose files in place.')
+
+    def handle(self, *args, **options):
+        for name in options['archive'] or sorted(ARCHIVES):
+            path, prefix = ARCHIVES[name]
+            if not os.path.isdir(path):
+                self.stdout.write('{}: {} does not exist.'.format(name, path))
+                continue
+            files = []
+            for f in os.listdir(path):
+                match = file_processor.DATA_RE.search(f)
+                if f.startswith(prefix) and match:
+                    files.append((match.group(0), os.path.join(path, f)))
+            packed = archive.pack_files(path, files,
+                                        remove=not options['keep'])
+            self.stdout.write('{}: packed {} files into {} segments.'.format(
+                name, packed, len(archive.get_segments(path))))
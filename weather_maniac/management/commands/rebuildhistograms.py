@@ -0,0 +1,74 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from weather_maniac import models
+from weather_maniac import publish
+from weather_maniac import settings
+from weather_maniac.histogram import get_histogram_jobs, rebuild_histograms
+
+CHECKPOINT_FILE = os.path.join(settings.BASE_DIR, 'histogram_rebuild.ckpt')
+
+
+def _job_to_line(job):
+    return ','.join(str(item) for item in job)
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the error histograms in parallel.  An interrupted '
+            'rebuild resumes from its checkpoint file.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--location', action='append',
+                            choices=sorted(models.LOCATIONS.values()),
+                            help='Location to rebuild (repeatable).  '
+                                 'Defaults to {}.'.format(
+                                     models.DEFAULT_LOCATION))
+        parser.add_argument('--all-locations', action='store_true',
+                            help='Rebuild every location in LOCATIONS.')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Worker processes.  Defaults to CPU count.')
+        parser.add_argument('--checkpoint', default=CHECKPOINT_FILE,
+                            help='File recording the finished jobs.')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the checkpoint and rebuild all.')
+
+    def handle(self, *args, **options):
+        if options['all_locations']:
+            locations = sorted(models.LOCATIONS.values())
+        else:
+            locations = options['location'] or [models.DEFAULT_LOCATION]
+        checkpoint = options['checkpoint']
+        if options['restart'] and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        done = set()
+        if os.path.exists(checkpoint):
+            with open(checkpoint) as ckpt_file:
+                done = {line.strip() for line in ckpt_file}
+        jobs = [job for job in get_histogram_jobs(locations)
+                if _job_to_line(job) not in done]
+        self.stdout.write('{} histograms to rebuild, {} already done.'.format(
+            len(jobs), len(done)))
+        start_time = time.time()
+        error_count = 0
+        with open(checkpoint, 'a') as ckpt_file:
+            results = rebuild_histograms(jobs, options['processes'])
+            for finished, (job, count) in enumerate(results, 1):
+                ckpt_file.write(_job_to_line(job) + '\n')
+                ckpt_file.flush()
+                error_count += count
+                elapsed = time.time() - start_time
+                self.stdout.write(
+                    '[{}/{}] {}: {} errors, {:.1f} histograms/s'.format(
+                        finished, len(jobs), _job_to_line(job), count,
+                        finished / elapsed))
+        os.remove(checkpoint)
+        elapsed = time.time() - start_time
+        self.stdout.write(
+            'Rebuilt {} histograms ({} forecast errors) in {:.1f} s: '
+            '{:.1f} histograms/s, {:.0f} errors/s.'.format(
+                len(jobs), error_count, elapsed,
+                len(jobs) / elapsed if elapsed else 0,
+                error_count / elapsed if elapsed else 0))
+        # The published statistics are out of date now
+        publish.publish_all()
@@ -0,0 +1,56 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from weather_maniac.benchmarks import generator, runner
+
+
+class Command(BaseCommand):
+    help = ('Times the statistics functions and views on a synthetic dataset '
+            'in a throw-away test database, and reports the results as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--case', action='append', dest='cases',
+                            help='Case to run (repeatable).  Default: all.')
+        parser.add_argument('--output', help='Write the JSON to this file.')
+        parser.add_argument('--compare',
+                            help='Earlier JSON results to compare against.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, serialize=False)
+        try:
+            records = generator.generate_dataset(365 * options['years'],
+                                                 options['seed'])
+            results = runner.run_benchmarks(options['repeat'],
+                                            options['cases'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        report = {
+            'created': datetime.datetime.now().isoformat(),
+            'commit': runner.get_commit(),
+            'years': options['years'],
+            'seed': options['seed'],
+            'records': records,
+            'results': results
+        }
+        report_json = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(report_json)
+        else:
+            self.stdout.write(report_json)
+        if options['compare']:
+            with open(options['compare']) as compare_file:
+                old_results = json.load(compare_file)['results']
+            for name, ratio in runner.compare_results(old_results,
+                                                      results).items():
+                self.stdout.write('{}: {:.2f}x the time of {}'.format(
+                    name, ratio, options['compare']))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from weather_maniac import watcher
+
+
+class Command(BaseCommand):
+    help = ('Watches the Data/ directories, ingesting each new file as soon '
+            'as it has been written.  Runs until interrupted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--settle', type=float,
+                            default=watcher.SETTLE_SECONDS,
+                            help='Seconds a file must be unchanged before '
+                                 'it is ingested.')
+        parser.add_argument('--interval', type=float,
+                            default=watcher.POLL_SECONDS,
+                            help='Seconds between polls (without inotify).')
+        parser.add_argument('--poll', action='store_true',
+                            help='Poll even where inotify is available.')
+
+    def handle(self, *args, **options):
+        try:
+            watcher.watch(options['settle'], options['interval'],
+                          use_inotify=not options['poll'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped watching.')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from weather_maniac import models
+from weather_maniac.statistics import get_worst_predictions
+
+
+class Command(BaseCommand):
+    help = 'Lists the worst forecasts for each day in advance.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', choices=sorted(models.SOURCES))
+        parser.add_argument('mtype', choices=models.TYPES)
+        parser.add_argument('--location', default='PDX',
+                            choices=sorted(models.LOCATIONS.values()))
+        parser.add_argument('--count', type=int, default=5)
+
+    def handle(self, *args, **options):
+        worst = get_worst_predictions(options['source'], options['location'],
+                                      options['mtype'], options['count'])
+        for day, records in sorted(worst.items()):
+            for record in records:
+                self.stdout.write(
+                    'Day adv: {}, Date: {}, Forecast: {} on {}, Actual: {}, '
+                    'Error: {}'.format(day, record['date'], record['forecast'],
+                                       record['predict_date'],
+                                       record['actual'], record['error']))
@@ -0,0 +1,112 @@
+"""Weather Maniac ingest manifest.
+
+The file_processor scans record every file they handle (its size,
+  modification time and SHA-1) as a ProcessedFile.  A later scan of the same
+  directory then returns only the files that are new or have changed, so a
+  run costs little more than the new files themselves.  Only the entries of
+  the files in the directory are read, not those of files since moved out.
+A file whose size or time changed but whose contents did not (e.g., it was
+  touched or copied back) is not returned; its entry is just brought up to
+  date.
+"""
+
+import hashlib
+import os
+
+from . import models
+
+HASH_BLOCK_SIZE = 65536
+QUERY_BATCH_SIZE = 500
+
+
+def hash_file(file_name):
+    """SHA-1 hex digest of a file's contents."""
+    digest = hashlib.sha1()
+    with open(file_name, 'rb') as data_file:
+        for block in iter(lambda: data_file.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_new_files(directory, pattern=None):
+    """List the names of the new or changed files in a directory, sorted.
+
+    pattern (a compiled regex) limits the scan to the names it matches.
+
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> for name in ['api_1.json', 'api_2.json']:
+    ...   with open(os.path.join(directory, name), 'w') as f:
+    ...     _ = f.write(name)
+    >>> scan_new_files(directory)
+    ['api_1.json', 'api_2.json']
+    >>> mark_processed(directory, 'api_1.json')
+    >>> scan_new_files(directory)
+    ['api_2.json']
+    >>> os.utime(os.path.join(directory, 'api_1.json'), (0, 0))
+    >>> scan_new_files(directory)
+    ['api_2.json']
+    >>> with open(os.path.join(directory, 'api_1.json'), 'w') as f:
+    ...   _ = f.write('changed')
+    >>> scan_new_files(directory)
+    ['api_1.json', 'api_2.json']
+    """
+    entries = [entry for entry in os.scandir(directory)
+               if entry.is_file() and
+               (not pattern or pattern.search(entry.name))]
+    known = _get_records(directory, [entry.name for entry in entries])
+    new_files = []
+    for entry in entries:
+        record = known.get(entry.name)
+        if record is None or _has_changed(record, entry.path, entry.stat()):
+            new_files.append(entry.name)
+    return sorted(new_files)
+
+
+def _get_records(directory, names):
+    """The ProcessedFiles of the named files in a directory, by name.
+
+    Only the names listed are read (in batches of QUERY_BATCH_SIZE, within
+      SQLite's limit on query parameters):  the entries of files since moved
+      out of the directory are never looked at.
+    """
+    records = {}
+    for start in range(0, len(names), QUERY_BATCH_SIZE):
+        for record in models.ProcessedFile.objects.filter(
+                directory=directory,
+                name__in=names[start:start + QUERY_BATCH_SIZE]):
+            records[record.name] = record
+    return records
+
+
+def _has_changed(record, file_name, stat):
+    """Compare a file with its manifest entry, updating the entry's time if
+          only that has changed."""
+    if (record.size, record.mtime) == (stat.st_size, stat.st_mtime_ns):
+        return False
+    if record.size == stat.st_size and record.digest == hash_file(file_name):
+        record.mtime = stat.st_mtime_ns
+        record.save()
+        return False
+    return True
+
+
+def is_new_file(directory, name):
+    """Whether one file is new or has changed since it was processed."""
+    file_name = os.path.join(directory, name)
+    try:
+        record = models.ProcessedFile.objects.get(directory=directory,
+                                                  name=name)
+    except models.ProcessedFile.DoesNotExist:
+        return True
+    return _has_changed(record, file_name, os.stat(file_name))
+
+
+def mark_processed(directory, name):
+    """Record the file, as it is now, as processed."""
+    file_name = os.path.join(directory, name)
+    stat = os.stat(file_name)
+    models.ProcessedFile.objects.update_or_create(
+        directory=directory, name=name,
+        defaults={'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                  'digest': hash_file(file_name)})
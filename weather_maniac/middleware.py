@@ -0,0 +1,137 @@
+"""Weather Maniac request profiling middleware.
+
+Opt-in:  settings.py only installs it when WM_PROFILE is set.
+For every request it records:
+  -- wall time,
+  -- the number and total time of SQL queries,
+  -- query shapes run more than once (the usual sign of an N+1 loop),
+  -- time spent scraping and in OCR (functions wrapped by
+     instrumentation.timed()).
+These go out as a Server-Timing header (shown by browser dev tools), plus an
+  X-Repeated-Queries header when there are repeats.
+If WM_PROFILE_DIR is set, a sample of requests (WM_PROFILE_SAMPLE, a fraction)
+  is run under cProfile and the stats are dumped there for pstats/snakeviz.
+"""
+
+import collections
+import cProfile
+import logging
+import os
+import random
+import re
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from . import instrumentation
+from . import settings
+
+NUMBER_RE = re.compile(r'\b\d+(\.\d+)?\b')
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+IN_LIST_RE = re.compile(r'IN \((\?, )*\?\)')
+PATH_RE = re.compile(r'\W+')
+
+logger = logging.getLogger(__name__)
+
+
+def get_query_shape(sql):
+    """Reduce a query to its shape by replacing the literal values.
+
+    >>> get_query_shape("SELECT * FROM t WHERE a = 12 AND b = 'x' AND c "
+    ...                 "IN (1, 2, 3)")
+    'SELECT * FROM t WHERE a = ? AND b = ? AND c IN (?)'
+    """
+    shape = STRING_RE.sub('?', sql)
+    shape = NUMBER_RE.sub('?', shape)
+    return IN_LIST_RE.sub('IN (?)', shape)
+
+
+def get_repeated_queries(queries, count=3):
+    """Return the most repeated query shapes as (times run, shape) tuples.
+
+    >>> get_repeated_queries([{'sql': 'SELECT a FROM t WHERE id = 1'},
+    ...                       {'sql': 'SELECT a FROM t WHERE id = 2'},
+    ...                       {'sql': 'SELECT b FROM u'}])
+    [(2, 'SELECT a FROM t WHERE id = ?')]
+    """
+    shapes = collections.Counter(get_query_shape(query['sql'])
+                                 for query in queries)
+    return [(times, shape) for shape, times in shapes.most_common(count)
+            if times > 1]
+
+
+def format_server_timing(wall, queries, call_times):
+    """Format the Server-Timing header; durations are in milliseconds.
+
+    >>> format_server_timing(0.0123, [{'time': '0.002'}, {'time': '0.001'}],
+    ...                      {'scrape': 0.004})
+    'total;dur=12.3, db;dur=3.0;desc="2 queries", scrape;dur=4.0'
+    """
+    db_time = sum(float(query['time']) for query in queries)
+    entries = ['total;dur={:.1f}'.format(wall * 1000),
+               'db;dur={:.1f};desc="{} queries"'.format(db_time * 1000,
+                                                        len(queries))]
+    for name, seconds in sorted(call_times.items()):
+        entries.append('{};dur={:.1f}'.format(name, seconds * 1000))
+    return ', '.join(entries)
+
+
+class ProfilingMiddleware(object):
+    """Attach timing and query figures to every response.
+
+    >>> from django.http import HttpResponse
+    >>> from django.test import RequestFactory
+    >>> from . import models
+    >>> def view(request):
+    ...   for day in range(3):
+    ...     models.DayRecord.objects.filter(day_in_advance=day).count()
+    ...   return HttpResponse()
+    >>> response = ProfilingMiddleware(view)(RequestFactory().get('/json'))
+    >>> response['Server-Timing']  # doctest: +ELLIPSIS
+    'total;dur=..., db;dur=...;desc="3 queries"'
+    >>> response['X-Repeated-Queries']  # doctest: +ELLIPSIS
+    '3x SELECT COUNT(*) AS "__count" FROM "weather_maniac_dayrecord" ...'
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.profile_dir = getattr(settings, 'WM_PROFILE_DIR', None)
+        self.sample_rate = getattr(settings, 'WM_PROFILE_SAMPLE', 0)
+
+    def __call__(self, request):
+        profiler = None
+        if self.profile_dir and random.random() < self.sample_rate:
+            profiler = cProfile.Profile()
+        instrumentation.start_timings()
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as context:
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+        wall = time.perf_counter() - start
+        call_times = instrumentation.stop_timings()
+        queries = context.captured_queries
+        response['Server-Timing'] = format_server_timing(wall, queries,
+                                                         call_times)
+        repeats = get_repeated_queries(queries)
+        if repeats:
+            response['X-Repeated-Queries'] = ' | '.join(
+                '{}x {}'.format(times, shape[:200]) for times, shape in repeats)
+        logger.debug('%s %s: %s', request.method, request.path,
+                     response['Server-Timing'])
+        if profiler:
+            self._dump_profile(profiler, request)
+        return response
+
+    def _dump_profile(self, profiler, request):
+        """Save the cProfile stats, named after the time and the path."""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        file_name = '{}_{}.prof'.format(
+            time.strftime('%Y_%m_%d_%H_%M_%S'),
+            PATH_RE.sub('_', request.path).strip('_') or 'index')
+        profiler.dump_stats(os.path.join(self.profile_dir, file_name))
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 23:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather_maniac', '0003_fetchvalidator'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchvalidator',
+            name='day',
+            field=models.DateField(null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 23:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather_maniac', '0004_fetchvalidator_day'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fetchvalidator',
+            name='fingerprint',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+    ]
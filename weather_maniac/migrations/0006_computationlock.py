@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.1 on 2026-10-18 23:38
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather_maniac', '0005_fetchvalidator_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComputationLock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=40, unique=True)),
+                ('owner', models.CharField(max_length=32)),
+                ('acquired', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -3,33 +3,27 @@
 from django.db import models
 import datetime
 import os
-from . import file_processor
 from . import settings
 
-ACTUAL = {'data_path': os.path.join(file_processor.ROOT_PATH,
-                                    'ACT_Data'),
-          'arch_path': os.path.join(file_processor.ROOT_PATH,
-                                    'ACT_Arch'),
+# Scraped files wait under here to be processed, then are archived
+ROOT_PATH = os.path.join(settings.BASE_DIR, 'rawdatafiles')
+
+ACTUAL = {'data_path': os.path.join(ROOT_PATH, 'ACT_Data'),
+          'arch_path': os.path.join(ROOT_PATH, 'ACT_Arch'),
           'location': settings.WM_MEAS_ID}
 
 SOURCES = {'html': {'length': 7, 'alias': 'Service A',
-                    'data_path': os.path.join(file_processor.ROOT_PATH,
-                                              'HTML_Data'),
-                    'arch_path': os.path.join(file_processor.ROOT_PATH,
-                                              'HTML_Arch'),
+                    'data_path': os.path.join(ROOT_PATH, 'HTML_Data'),
+                    'arch_path': os.path.join(ROOT_PATH, 'HTML_Arch'),
                     'location': settings.WM_SRC2_ID},
            'api': {'length': 5, 'alias': 'Service B',
-                   'data_path': os.path.join(file_processor.ROOT_PATH,
-                                             'API_Data'),
-                   'arch_path': os.path.join(file_processor.ROOT_PATH,
-                                             'API_Arch'),
+                   'data_path': os.path.join(ROOT_PATH, 'API_Data'),
+                   'arch_path': os.path.join(ROOT_PATH, 'API_Arch'),
                    'id': settings.WM_APP_ID,
                    'key': settings.WM_APP_KEY},
            'jpeg': {'length': 7, 'alias': 'Service C',
-                    'data_path': os.path.join(file_processor.ROOT_PATH,
-                                              'JPEG_Data'),
-                    'arch_path': os.path.join(file_processor.ROOT_PATH,
-                                              'JPEG_Arch'),
+                    'data_path': os.path.join(ROOT_PATH, 'JPEG_Data'),
+                    'arch_path': os.path.join(ROOT_PATH, 'JPEG_Arch'),
                     'location': settings.WM_SRC1_ID,
                     'dims': {
                         'x_pitch': 86.5, 'x_start': 98,
@@ -43,10 +37,8 @@ SOURCES = {'html': {'length': 7, 'alias': 'Service A',
                                 'win_y': 18, 'dark_back': True,
                                 'proc': 'none'}}},
            'jpeg3': {'length': 7, 'alias': 'Service D',
-                     'data_path': os.path.join(file_processor.ROOT_PATH,
-                                               'JPEG3_Data'),
-                     'arch_path': os.path.join(file_processor.ROOT_PATH,
-                                               'JPEG3_Arch'),
+                     'data_path': os.path.join(ROOT_PATH, 'JPEG3_Data'),
+                     'arch_path': os.path.join(ROOT_PATH, 'JPEG3_Arch'),
                      'location': settings.WM_SRC3_ID,
                      'dims': {
                          'x_pitch': 114, 'x_start': 99,
@@ -61,10 +53,8 @@ SOURCES = {'html': {'length': 7, 'alias': 'Service A',
                                  'proc': 'none'}
                      }},
            'jpeg4': {'length': 7, 'alias': 'Service E',
-                     'data_path': os.path.join(file_processor.ROOT_PATH,
-                                               'JPEG4_Data'),
-                     'arch_path': os.path.join(file_processor.ROOT_PATH,
-                                               'JPEG4_Arch'),
+                     'data_path': os.path.join(ROOT_PATH, 'JPEG4_Data'),
+                     'arch_path': os.path.join(ROOT_PATH, 'JPEG4_Arch'),
                      'location': settings.WM_SRC4_ID,
                      'dims': {
                          'x_pitch': 90, 'x_start': 49,
@@ -89,6 +79,7 @@ LOCATIONS = {'AURORA STATE AIRPORT OR US': 'AUR',
              'GRESHAM 2 SW OR US': 'GRE',
              'PORTLAND WEATHER FORECAST OFFICE OR US': 'PWO',
              'NATURE PARK BEAVERTON OR US': 'BNP'}
+DEFAULT_LOCATION = 'PDX'
 
 
 class DayRecord(models.Model):
@@ -284,3 +275,153 @@ class ErrorBin(models.Model):
                 self.start_date,
                 self.end_date
                 )
+
+
+class ProcessedFile(models.Model):
+    """Data file already handled by file_processor (see manifest.py).
+
+    directory and name locate the file as it was found.
+    size, mtime (ns) and digest (SHA-1) record its state when it was
+       processed, so a changed file can be told from an unchanged one.
+    """
+    directory = models.CharField(max_length=255)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    mtime = models.BigIntegerField()
+    digest = models.CharField(max_length=40)
+
+    class Meta:
+        unique_together = ('directory', 'name')
+
+    def __str__(self):
+        r"""String function
+
+        >>> str(ProcessedFile(directory='/data', name='api_1.json', size=10,
+        ... mtime=1470000000000000000, digest='ab12'))
+        '/data, api_1.json, 10, 1470000000000000000, ab12'
+        """
+        return ', '.join([
+            self.directory,
+            self.name,
+            str(self.size),
+            str(self.mtime),
+            self.digest
+        ])
+
+    def __repr__(self):
+        r"""Repr function
+
+        >>> repr(ProcessedFile(directory='/data', name='api_1.json', size=10,
+        ... mtime=1470000000000000000, digest='ab12'))
+        ...   # doctest: +NORMALIZE_WHITESPACE
+        "ProcessedFile(directory='/data', name='api_1.json', size=10,
+        mtime=1470000000000000000, digest='ab12')"
+        """
+        return 'ProcessedFile(directory={!r}, name={!r}, size={!r}, ' \
+               'mtime={!r}, digest={!r})'.format(
+                self.directory,
+                self.name,
+                self.size,
+                self.mtime,
+                self.digest
+                )
+
+
+class FetchValidator(models.Model):
+    """Cache validators and the payload fingerprint from a source's last
+         fetch (see fetch.py).
+
+    source is the name the loader fetches it under, e.g. a member of SOURCES.
+    etag and last_modified are the response headers, sent back on the next
+       fetch so an unchanged source can answer 304.
+    fingerprint is the SHA-1 of the last payload processed (its forecast part
+       only, see fetch.fingerprint()), and day is the day it was processed
+       for.  Both are only trusted on that same day, as forecasts are retimed
+       against the day they were fetched.
+    """
+    source = models.CharField(max_length=10, unique=True)
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    fingerprint = models.CharField(max_length=40, blank=True)
+    day = models.DateField(null=True)
+
+    def __str__(self):
+        r"""String function
+
+        >>> str(FetchValidator(source='html', etag='"ab12"',
+        ... last_modified='Sun, 24 Jul 2016 10:10:00 GMT',
+        ... fingerprint='cd34', day=datetime.date(2016, 7, 24)))
+        'html, "ab12", Sun, 24 Jul 2016 10:10:00 GMT, cd34, 2016-07-24'
+        """
+        return ', '.join([
+            self.source,
+            self.etag,
+            self.last_modified,
+            self.fingerprint,
+            str(self.day)
+        ])
+
+    def __repr__(self):
+        r"""Repr function
+
+        >>> repr(FetchValidator(source='html', etag='"ab12"',
+        ... last_modified='Sun, 24 Jul 2016 10:10:00 GMT',
+        ... fingerprint='cd34', day=datetime.date(2016, 7, 24)))
+        ...   # doctest: +NORMALIZE_WHITESPACE
+        'FetchValidator(source=\'html\', etag=\'"ab12"\',
+        last_modified=\'Sun, 24 Jul 2016 10:10:00 GMT\',
+        fingerprint=\'cd34\', day=datetime.date(2016, 7, 24))'
+        """
+        return 'FetchValidator(source={!r}, etag={!r}, ' \
+               'last_modified={!r}, fingerprint={!r}, day={!r})'.format(
+                self.source,
+                self.etag,
+                self.last_modified,
+                self.fingerprint,
+                self.day
+                )
+
+
+class ComputationLock(models.Model):
+    """Lock held while a computation runs, so that other processes wait for
+         it rather than repeating it (see singleflight.py).
+
+    key is the SHA-1 of the computation (function and arguments); the unique
+       constraint makes creating the row the act of taking the lock.
+    owner identifies the holder, so only it releases the lock, and acquired
+       is when it was taken; a lock held too long is taken to be abandoned.
+    """
+    key = models.CharField(max_length=40, unique=True)
+    owner = models.CharField(max_length=32)
+    acquired = models.DateTimeField()
+
+    def __str__(self):
+        r"""String function
+
+        >>> str(ComputationLock(key='ab12', owner='cd34',
+        ... acquired=datetime.datetime(2016, 8, 1, 12, 0,
+        ... tzinfo=datetime.timezone.utc)))
+        'ab12, cd34, 2016-08-01 12:00:00+00:00'
+        """
+        return ', '.join([
+            self.key,
+            self.owner,
+            str(self.acquired)
+        ])
+
+    def __repr__(self):
+        r"""Repr function
+
+        >>> repr(ComputationLock(key='ab12', owner='cd34',
+        ... acquired=datetime.datetime(2016, 8, 1, 12, 0,
+        ... tzinfo=datetime.timezone.utc)))
+        ...   # doctest: +NORMALIZE_WHITESPACE
+        "ComputationLock(key='ab12', owner='cd34',
+        acquired=datetime.datetime(2016, 8, 1, 12, 0,
+        tzinfo=datetime.timezone.utc))"
+        """
+        return 'ComputationLock(key={!r}, owner={!r}, acquired={!r})'.format(
+                self.key,
+                self.owner,
+                self.acquired
+                )
@@ -0,0 +1,179 @@
+"""Weather Maniac published JSON.
+
+The /json, /graph_json and /bundle_json responses are the same for every
+  visitor on a given day, so after each ingest publish_json() renders them
+  all to static files:  each forecaster and type's forecast (at the default
+  location), each type's graph, and the bundle of them all that the pages
+  load.
+Each file's name carries a hash of its contents, so it never changes and
+  can be cached for good; gzip (and, if brotli is installed, brotli) copies
+  are written beside it by WhiteNoise's compressor.  manifest.json names the
+  current file of each payload, and is written last (atomically), so it only
+  names complete files.  Files named by neither it nor the manifest before
+  are removed.
+PublishedFilesMiddleware serves them.  The pages' JS loads the manifest and
+  then the file, falling back to the views (as for other locations) if
+  today's is not published.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+
+from django.core.serializers.json import DjangoJSONEncoder
+from whitenoise.compress import Compressor
+from whitenoise.middleware import WhiteNoiseMiddleware
+from whitenoise.utils import MissingFileError
+
+from . import histogram
+from . import models
+from . import settings
+from . import snapshot
+from . import statistics
+
+MANIFEST = 'manifest.json'
+FILE_RE = re.compile(r'^(manifest\.json|[a-z0-9_]+\.[0-9a-f]{12}\.json'
+                     r'(\.gz|\.br)?)$')
+
+logger = logging.getLogger(__name__)
+
+
+def get_payloads():
+    """Render every published payload, as a dict of name to its data."""
+    payloads = {}
+    for mtype in models.TYPES:
+        for source in statistics.PAGE_SOURCES:
+            payloads['forecast_{}_{}'.format(source, mtype)] = (
+                statistics.return_json_of_forecast(source, mtype))
+        payloads['graph_' + mtype] = statistics.make_graph_json(mtype)
+    payloads['bundle'] = statistics.make_bundle_json()
+    return payloads
+
+
+def _write(root, name, data):
+    """Write a file atomically (aside, then renamed over)."""
+    fd, temp_name = tempfile.mkstemp(dir=root, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as published_file:
+            published_file.write(data)
+        os.chmod(temp_name, 0o644)
+        os.replace(temp_name, os.path.join(root, name))
+    except BaseException:
+        os.remove(temp_name)
+        raise
+
+
+def _read_manifest(root):
+    """The manifest published last, or an empty one."""
+    try:
+        with open(os.path.join(root, MANIFEST)) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {'files': {}}
+
+
+def publish_json(root=None, url=None):
+    """Publish today's payloads under root, returning the new manifest.
+
+    >>> import tempfile
+    >>> from . import load_test_records
+    >>> load_test_records.histo_loader()
+    >>> today = datetime.date.today()
+    >>> for source in statistics.PAGE_SOURCES:
+    ...   for day in range(models.SOURCES[source]['length']):
+    ...     models.DayRecord(date_reference=today + datetime.timedelta(day),
+    ...     day_in_advance=day, source=source, max_temp=80, min_temp=50
+    ...     ).save()
+    >>> root = tempfile.mkdtemp()
+    >>> manifest = publish_json(root, '/published/')
+    >>> len(manifest['files'])
+    11
+    >>> name = manifest['files']['forecast_api_max'][len('/published/'):]
+    >>> with open(os.path.join(root, name)) as published_file:
+    ...   json.load(published_file) == statistics.return_json_of_forecast(
+    ...     'api', 'max')
+    True
+    >>> publish_json(root, '/published/') == manifest
+    True
+    >>> all(os.path.exists(os.path.join(root, name + '.gz'))
+    ...     for name in os.listdir(root) if name.endswith('json')
+    ...     and name != MANIFEST)
+    True
+    """
+    root = root or settings.WM_PUBLISH_ROOT
+    url = url or settings.WM_PUBLISH_URL
+    os.makedirs(root, exist_ok=True)
+    compressor = Compressor(quiet=True)
+    manifest = {'date': datetime.date.today().isoformat(), 'files': {}}
+    for name, payload in sorted(get_payloads().items()):
+        data = json.dumps(payload, cls=DjangoJSONEncoder).encode('utf-8')
+        file_name = '{}.{}.json'.format(name,
+                                        hashlib.sha1(data).hexdigest()[:12])
+        if not os.path.exists(os.path.join(root, file_name)):
+            _write(root, file_name, data)
+            compressor.compress(os.path.join(root, file_name))
+        manifest['files'][name] = url + file_name
+    old_manifest = _read_manifest(root)
+    _write(root, MANIFEST, json.dumps(manifest, sort_keys=True)
+           .encode('utf-8'))
+    # Pages loaded just before may still ask for the last manifest's files
+    keep = {published_url[len(url):] for published_url in
+            list(manifest['files'].values()) +
+            list(old_manifest['files'].values())}
+    for name in os.listdir(root):
+        if FILE_RE.match(name) and name != MANIFEST and \
+                re.sub(r'\.(gz|br)$', '', name) not in keep:
+            os.remove(os.path.join(root, name))
+    logger.info('Published %s payloads for %s', len(manifest['files']),
+                manifest['date'])
+    return manifest
+
+
+def publish_all():
+    """After an ingest:  bring every histogram up to date, rebuild the
+          snapshot, then publish the JSON from it.  The views still serve
+          everything, so a failure is logged rather than raised."""
+    try:
+        histogram.refresh_all_histograms()
+    except Exception:
+        logger.warning('Histograms not brought up to date', exc_info=True)
+    snapshot.publish_snapshot()
+    if not settings.WM_PUBLISH_ROOT:
+        return
+    try:
+        publish_json()
+    except Exception:
+        logger.warning('JSON not published', exc_info=True)
+
+
+class PublishedFilesMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise, also serving the published JSON.
+
+    WhiteNoise lists its files once, at start up, so published files (which
+      come and go) are looked up as they are asked for.  The versioned files
+      are cached for good; the manifest for WhiteNoise's max-age.
+    """
+
+    def process_request(self, request):
+        url = request.path_info
+        if not settings.WM_PUBLISH_ROOT or \
+                not url.startswith(settings.WM_PUBLISH_URL):
+            return super().process_request(request)
+        name = url[len(settings.WM_PUBLISH_URL):]
+        if not FILE_RE.match(name):
+            return None
+        try:
+            static_file = self.get_static_file(
+                os.path.join(settings.WM_PUBLISH_ROOT, name), url)
+        except MissingFileError:
+            return None
+        return self.serve(static_file, request)
+
+    def is_immutable_file(self, path, url):
+        if url.startswith(settings.WM_PUBLISH_URL):
+            return not url.endswith('/' + MANIFEST)
+        return super().is_immutable_file(path, url)
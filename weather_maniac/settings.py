@@ -124,12 +124,79 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'mediafiles')
 
+# Logging
+# https://docs.djangoproject.com/en/1.10/topics/logging/
+#
+# WM_LOG_LEVEL sets the level for all weather_maniac modules (default INFO).
+# WM_LOG_LEVELS overrides it per module, e.g.
+#   WM_LOG_LEVELS=weather_maniac.histogram=DEBUG,weather_maniac.logic_ocr=DEBUG
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '%(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        'weather_maniac': {
+            'handlers': ['console'],
+            'level': os.environ.get('WM_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
+
+for module_level in os.environ.get('WM_LOG_LEVELS', '').split(','):
+    if '=' in module_level:
+        module, level = module_level.split('=')
+        LOGGING['loggers'][module.strip()] = {'level': level.strip()}
+
 # Heroku production settings
 # Will overwrite settings with production config vars from env variables if
 # Heroku is detected.
 #
 
-MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+# WhiteNoise, also serving the published JSON (see weather_maniac/publish.py)
+MIDDLEWARE.insert(1, 'weather_maniac.publish.PublishedFilesMiddleware')
+
+# Request profiling (see weather_maniac/middleware.py); off unless WM_PROFILE
+# is set.  WM_PROFILE_DIR enables cProfile dumps for a WM_PROFILE_SAMPLE
+# fraction of requests.
+
+WM_PROFILE = 'WM_PROFILE' in os.environ
+WM_PROFILE_DIR = os.environ.get('WM_PROFILE_DIR')
+WM_PROFILE_SAMPLE = float(os.environ.get('WM_PROFILE_SAMPLE', '0.01'))
+
+if WM_PROFILE:
+    MIDDLEWARE.insert(0, 'weather_maniac.middleware.ProfilingMiddleware')
+
+# Snapshot of the current forecasts and statistics, rebuilt by the loader and
+# memory mapped by the web workers (see weather_maniac/snapshot.py).  Set
+# WM_SNAPSHOT_PATH empty to serve everything from the database.
+
+WM_SNAPSHOT_PATH = os.environ.get('WM_SNAPSHOT_PATH',
+                                  os.path.join(BASE_DIR, 'snapshot.bin'))
+
+# Static JSON of the forecast and graph payloads, published after each ingest
+# (see weather_maniac/publish.py) and served at WM_PUBLISH_URL.  Set
+# WM_PUBLISH_ROOT empty to serve them from the views only.
+
+WM_PUBLISH_ROOT = os.environ.get('WM_PUBLISH_ROOT',
+                                 os.path.join(BASE_DIR, 'published'))
+WM_PUBLISH_URL = '/published/'
+
+# A stale histogram is populated by one worker at a time (see
+# weather_maniac/singleflight.py).  Another waits up to
+# WM_SINGLE_FLIGHT_TIMEOUT seconds (under the web server's worker timeout)
+# and then serves the histogram as it is.  A lock held for longer than
+# WM_SINGLE_FLIGHT_EXPIRY seconds is taken to have been abandoned.
+
+WM_SINGLE_FLIGHT_TIMEOUT = float(os.environ.get('WM_SINGLE_FLIGHT_TIMEOUT',
+                                                '10'))
+WM_SINGLE_FLIGHT_EXPIRY = float(os.environ.get('WM_SINGLE_FLIGHT_EXPIRY',
+                                               '300'))
 
 if 'DJANGO_SECRET_KEY' in os.environ:
     SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
@@ -0,0 +1,191 @@
+"""Weather Maniac single-flight computations.
+
+Right after an ingest, every page request wants the same statistics, and
+  each would recompute them, bringing the histograms up to date on the way.
+  Two things keep that work from being repeated:
+  -- within a process, a function decorated with single_flight runs once at
+     a time per arguments:  callers of a computation already running wait
+     for it and share its result (coalesce()), so a result must not be
+     mutated;
+  -- across processes, only the writes are serialized:  a stale histogram
+     is populated while holding its ComputationLock row (database_lock(),
+     see histogram.refresh_histogram()), so that two workers never populate
+     it at once.  Reads take no lock.
+A worker waits up to WM_SINGLE_FLIGHT_TIMEOUT for a lock, well under the
+  web server's worker timeout, and then goes on without it.  A lock older
+  than WM_SINGLE_FLIGHT_EXPIRY is taken to have been abandoned (its worker
+  was killed) and is taken over.
+"""
+
+import contextlib
+import datetime
+import functools
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import instrumentation
+from . import models
+from . import settings
+
+POLL_INTERVAL = 0.1
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """A computation running in this process, and its outcome."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def coalesce(key, compute):
+    """Return compute(), or, if a computation of key is already running in
+          this process, wait for it and return (or raise) its outcome.
+
+    >>> started, release = threading.Event(), threading.Event()
+    >>> calls = []
+    >>> def compute():
+    ...   calls.append(1)
+    ...   started.set()
+    ...   release.wait()
+    ...   return len(calls)
+    >>> results = []
+    >>> instrumentation.reset_counts()
+    >>> threads = [threading.Thread(target=lambda: results.append(
+    ...   coalesce('key', compute))) for _ in range(4)]
+    >>> threads[0].start(); started.wait()
+    True
+    >>> for thread in threads[1:]:
+    ...   thread.start()
+    >>> while instrumentation.COUNTS['coalesced computations'] < 3:
+    ...   time.sleep(0.01)
+    >>> release.set()
+    >>> for thread in threads:
+    ...   thread.join()
+    >>> results, len(calls)
+    ([1, 1, 1, 1], 1)
+    >>> coalesce('key', compute), len(calls)
+    (2, 2)
+    """
+    with _in_flight_lock:
+        call = _in_flight.get(key)
+        leader = call is None
+        if leader:
+            call = _in_flight[key] = _Call()
+    if not leader:
+        instrumentation.count('coalesced computations')
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+    try:
+        call.result = compute()
+    except BaseException as error:
+        call.error = error
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+        call.done.set()
+    return call.result
+
+
+def make_key(*parts):
+    """SHA-1 hex digest identifying a computation by the repr of its parts.
+
+    >>> make_key('histogram', 'api', 'PDX', 'max', 1) == make_key(
+    ...   'histogram', 'api', 'PDX', 'max', 2)
+    False
+    """
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def acquire_lock(key, owner, timeout=None):
+    """Take the ComputationLock of key for owner, waiting up to timeout
+          seconds (by default WM_SINGLE_FLIGHT_TIMEOUT) for its holder, and
+          return whether it was taken.
+
+    >>> acquire_lock('ab12', 'first'), acquire_lock('ab12', 'second', 0)
+    (True, False)
+    >>> release_lock('ab12', 'first')
+    >>> acquire_lock('ab12', 'second', 0)
+    True
+    """
+    if timeout is None:
+        timeout = settings.WM_SINGLE_FLIGHT_TIMEOUT
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with transaction.atomic():
+                models.ComputationLock.objects.create(
+                    key=key, owner=owner, acquired=timezone.now())
+            return True
+        except IntegrityError:
+            pass
+        # Take over a lock whose holder has held it too long
+        abandoned = timezone.now() - datetime.timedelta(
+            seconds=settings.WM_SINGLE_FLIGHT_EXPIRY)
+        if models.ComputationLock.objects.filter(
+                key=key, acquired__lt=abandoned).delete()[0]:
+            logger.warning('Took over abandoned computation lock %s', key)
+            continue
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(POLL_INTERVAL)
+
+
+def release_lock(key, owner):
+    """Release owner's ComputationLock of key (if it has not been taken
+          over)."""
+    models.ComputationLock.objects.filter(key=key, owner=owner).delete()
+
+
+@contextlib.contextmanager
+def database_lock(key, timeout=None):
+    """Hold the ComputationLock of key (a make_key()) while the block runs,
+          yielding whether it was taken.
+
+    If it was not (another worker held it for longer than timeout), the
+      block should not do the work the lock guards.
+    """
+    owner = uuid.uuid4().hex
+    start = time.monotonic()
+    locked = acquire_lock(key, owner, timeout)
+    waited = time.monotonic() - start
+    if waited >= POLL_INTERVAL:
+        instrumentation.count('computation lock waits')
+        logger.debug('Waited %.2f s for computation lock %s', waited, key)
+    if not locked:
+        logger.warning('Computation lock %s not taken', key)
+    try:
+        yield locked
+    finally:
+        if locked:
+            release_lock(key, owner)
+
+
+def single_flight(func):
+    """Decorate func to run once at a time per arguments within a process
+          (see coalesce()).
+
+    The arguments are keyed by their repr, so must have a stable one.
+    """
+    name = '{}.{}'.format(func.__module__, func.__qualname__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return coalesce(make_key(name, args, sorted(kwargs.items())),
+                        lambda: func(*args, **kwargs))
+    return wrapper
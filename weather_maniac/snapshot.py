@@ -0,0 +1,242 @@
+"""Weather Maniac forecast snapshot.
+
+The forecast pages need the same small, slowly changing data on every
+  request:  today's forecast from each source, and the mean and standard
+  deviation of each error histogram.  Rather than each web worker querying
+  the database for it, the loader writes it to one compact, read only file
+  after each ingest (build_snapshot()), and every worker memory maps that
+  file (get_snapshot()), so the operating system keeps one copy of it.
+The file is, in the machine's byte order:
+  -- a header:  magic, generation, start date (an ordinal), and the length
+     of the index and offsets of the blocks,
+  -- a JSON index of the sources, locations and types,
+  -- the forecasts:  int16, by source, day in advance, then type,
+  -- the statistics:  (mean, std) float64 pairs, by location, source, type,
+     then day in advance.
+It is replaced atomically (written aside, then renamed over), and its
+  generation goes up by one each time.  A worker stats the file on each
+  request (cheap), and on finding a new one maps it in place of the old.
+A snapshot is only used on the day it was built for; otherwise (or if there
+  is none) the pages are built from the database as before.
+"""
+
+import array
+import datetime
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+
+from . import models
+from . import settings
+
+MAGIC = b'WMSNAP01'
+HEADER = struct.Struct('=8sQIIII')
+MISSING = -32768
+
+_loaded = None
+
+logger = logging.getLogger(__name__)
+
+
+class Snapshot:
+    """A snapshot file, memory mapped read only."""
+
+    def __init__(self, file_name):
+        with open(file_name, 'rb') as snapshot_file:
+            self._map = mmap.mmap(snapshot_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        (magic, self.generation, ordinal, index_length, self._forecasts,
+         self._statistics) = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError('{} is not a snapshot'.format(file_name))
+        index = json.loads(self._map[HEADER.size:HEADER.size + index_length]
+                           .decode('utf-8'))
+        self.start_date = datetime.date.fromordinal(ordinal)
+        self._sources = {name: i for i, name in enumerate(index['sources'])}
+        self._locations = {name: i
+                           for i, name in enumerate(index['locations'])}
+        self._types = {name: i for i, name in enumerate(index['types'])}
+        self._days = index['days']
+
+    def get_forecast(self, source_str, mtype):
+        """The forecast, as forecasts.get_forecast() returns it."""
+        source = self._sources[source_str]
+        forecast = {}
+        for day in range(models.SOURCES[source_str]['length']):
+            row = source * self._days + day
+            cell = row * len(self._types) + self._types[mtype]
+            offset = self._forecasts + 2 * cell
+            temp, = struct.unpack_from('=h', self._map, offset)
+            if temp != MISSING:
+                forecast[day] = temp
+        return forecast
+
+    def get_statistics(self, source_str, location, mtype):
+        """The means and standard deviations, as statistics.get_statistics()
+              returns them."""
+        location_index = self._locations[location]
+        row = location_index * len(self._sources) + self._sources[source_str]
+        block = row * len(self._types) + self._types[mtype]
+        offset = self._statistics + 16 * self._days * block
+        means = {}
+        stds = {}
+        for day in range(models.SOURCES[source_str]['length']):
+            means[day], stds[day] = struct.unpack_from(
+                '=2d', self._map, offset + 16 * day)
+        return means, stds
+
+
+def get_snapshot(file_name=None, today=None):
+    """Today's snapshot, or None if there is not one.
+
+    The mapped snapshot is kept between calls; if the file has been replaced
+      (by a new generation), that is mapped instead.
+    """
+    global _loaded
+    file_name = file_name or settings.WM_SNAPSHOT_PATH
+    if not file_name:
+        return None
+    try:
+        stat = os.stat(file_name)
+    except FileNotFoundError:
+        return None
+    key = (file_name, stat.st_ino, stat.st_mtime_ns)
+    if _loaded is None or _loaded[0] != key:
+        try:
+            _loaded = (key, Snapshot(file_name))
+        except (OSError, ValueError) as error:
+            logger.warning('Snapshot not loaded: %s', error)
+            return None
+        logger.debug('Mapped snapshot generation %s', _loaded[1].generation)
+    current = _loaded[1]
+    if current.start_date != (today or datetime.date.today()):
+        return None
+    return current
+
+
+def _read_generation(file_name):
+    """The generation of the snapshot file, 0 if there is not one."""
+    try:
+        with open(file_name, 'rb') as snapshot_file:
+            magic, generation = HEADER.unpack(
+                snapshot_file.read(HEADER.size))[:2]
+    except (OSError, struct.error):
+        return 0
+    return generation if magic == MAGIC else 0
+
+
+def _align(offset):
+    """Round an offset up to a multiple of 8."""
+    return (offset + 7) // 8 * 8
+
+
+def build_snapshot(file_name=None, start_date=None):
+    """Write a new snapshot of start_date's (by default today's) forecasts
+          and of the statistics, returning its generation.
+
+    The histograms are brought up to date on the way, as the pages would.
+      (statistics is imported here, as it imports this module.)
+
+    >>> import tempfile
+    >>> from . import load_test_records, statistics
+    >>> load_test_records.histo_loader()
+    >>> today = datetime.date(2016, 8, 1)
+    >>> for day in range(5):
+    ...   models.DayRecord(date_reference=today + datetime.timedelta(day),
+    ...   day_in_advance=day, source='api', max_temp=83, min_temp=50 + day
+    ...   ).save()
+    >>> file_name = os.path.join(tempfile.mkdtemp(), 'snapshot.bin')
+    >>> build_snapshot(file_name, today)
+    1
+    >>> current = get_snapshot(file_name, today)
+    >>> current.get_forecast('api', 'min')
+    {0: 50, 1: 51, 2: 52, 3: 53, 4: 54}
+    >>> current.get_forecast('html', 'max')
+    {}
+    >>> stats = current.get_statistics('api', 'PDX', 'max')
+    >>> stats == statistics.get_statistics('api', 'PDX', 'max')
+    True
+    >>> get_snapshot(file_name, today + datetime.timedelta(1)) is None
+    True
+    >>> build_snapshot(file_name, today)
+    2
+    >>> get_snapshot(file_name, today).generation
+    2
+    """
+    from . import statistics
+    file_name = file_name or settings.WM_SNAPSHOT_PATH
+    start_date = start_date or datetime.date.today()
+    sources = sorted(models.SOURCES)
+    locations = sorted(models.LOCATIONS.values())
+    types = list(models.TYPES)
+    days = max(source['length'] for source in models.SOURCES.values())
+
+    cells = len(sources) * days * len(types)
+    forecasts = array.array('h', [MISSING]) * cells
+    records = models.DayRecord.objects.filter(
+        source__in=sources, date_reference__range=(
+            start_date, start_date + datetime.timedelta(days - 1)))
+    for record in records:
+        day = (record.date_reference - start_date).days
+        if record.day_in_advance != day:
+            continue
+        row = sources.index(record.source) * days + day
+        for type_index, mtype in enumerate(types):
+            cell = row * len(types) + type_index
+            forecasts[cell] = getattr(record, mtype + '_temp')
+
+    stats = array.array('d')
+    for location in locations:
+        for source_str in sources:
+            for mtype in types:
+                means, stds = statistics.get_statistics(source_str, location,
+                                                        mtype)
+                for day in range(days):
+                    stats.extend([means.get(day, 0.0), stds.get(day, 0.0)])
+
+    index = json.dumps({'sources': sources, 'locations': locations,
+                        'types': types, 'days': days}).encode('utf-8')
+    # Each block starts on an 8 byte boundary
+    forecasts_offset = _align(HEADER.size + len(index))
+    forecasts_size = forecasts.itemsize * len(forecasts)
+    statistics_offset = _align(forecasts_offset + forecasts_size)
+    generation = _read_generation(file_name) + 1
+
+    directory = os.path.dirname(os.path.abspath(file_name))
+    fd, temp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as snapshot_file:
+            snapshot_file.write(HEADER.pack(
+                MAGIC, generation, start_date.toordinal(), len(index),
+                forecasts_offset, statistics_offset))
+            snapshot_file.write(index)
+            padding = forecasts_offset - snapshot_file.tell()
+            snapshot_file.write(b'\0' * padding)
+            snapshot_file.write(forecasts.tobytes())
+            padding = statistics_offset - snapshot_file.tell()
+            snapshot_file.write(b'\0' * padding)
+            snapshot_file.write(stats.tobytes())
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.chmod(temp_name, 0o644)
+        os.replace(temp_name, file_name)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+    logger.info('Snapshot generation %s written for %s', generation,
+                start_date)
+    return generation
+
+
+def publish_snapshot():
+    """Build the snapshot after an ingest; as the pages fall back to the
+          database, a failure is logged rather than raised."""
+    if not settings.WM_SNAPSHOT_PATH:
+        return
+    try:
+        build_snapshot()
+    except Exception:
+        logger.warning('Snapshot not written', exc_info=True)
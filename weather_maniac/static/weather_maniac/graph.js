@@ -246,15 +246,11 @@ function runGraph() {
   $('#graph').prepend($('<img>',{id: 'crazy',
     src: '/static/weather_maniac/crazy.gif',
     style: 'width:300px;height:300px;'}));
-  var actionURL = sourceForm.attr('action');
-  var submitMethod = sourceForm.attr('method');
-  var formData = sourceForm.serialize();
-  return Promise.resolve($.ajax({
-    dataType: 'json',
-    url: actionURL,
-    method: submitMethod,
-    data: formData
-  })).then(displayGraph);
+  var mtype = sourceForm.find('input[name=mtype]:checked').val();
+  return loadBundle(sourceForm.data('bundle'),
+    sourceForm.data('today')).then(function (data) {
+    return data.graph[mtype];
+  }).then(displayGraph);
 }
 
 /**
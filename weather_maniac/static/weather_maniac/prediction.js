@@ -3,22 +3,20 @@
 var sourceForm = $('form');
 
 /**
- * Query the server for the graph data, using an AJAX request.
+ * Show the chosen forecast, from the bundle of them all (loaded on the
+ * first query).
  */
 function runQuery(event) {
   event.preventDefault();
   $('html,body').css('cursor', 'wait');
   if ($('svg').length) { $('svg').remove();}
   $('#graph').prepend($('<img>',{id:'crazy',src:'/static/weather_maniac/crazy.gif', style:"width:300px;height:300px;"}));
-  var actionURL = sourceForm.attr('action');
-  var submitMethod = sourceForm.attr('method');
-  var formData = sourceForm.serialize();
-  return Promise.resolve($.ajax({
-    dataType: 'json',
-    url: actionURL,
-    method: submitMethod,
-    data: formData
-  })).then(displayGraph);
+  var forecaster = sourceForm.find('input[name=forecaster]:checked').val();
+  var mtype = sourceForm.find('input[name=mtype]:checked').val();
+  return loadBundle(sourceForm.data('bundle'),
+    sourceForm.data('today')).then(function (data) {
+    return data.forecasts[forecaster][mtype];
+  }).then(displayGraph);
 }
 
 /**
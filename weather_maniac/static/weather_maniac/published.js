@@ -0,0 +1,47 @@
+'use strict';
+
+var publishedURL = '/published/';
+
+/**
+ * Load a payload published after the last ingest (see publish.py), falling
+ * back to the view if today's is not published.
+ * @param {string} name       payload name, e.g. 'forecast_api_max'
+ * @param {string} today      the server's date as YYYY-MM-DD, as the page
+ *                            gives it (see views.py)
+ * @param {function} fromView makes the view's request, returning a Promise
+ * @return {Promise}          the payload
+ */
+function loadPublished(name, today, fromView) {
+  return Promise.resolve($.ajax({
+    dataType: 'json',
+    url: publishedURL + 'manifest.json'
+  })).then(function (manifest) {
+    if (manifest.date !== today || !manifest.files[name]) {
+      throw new Error(name + ' is not published today');
+    }
+    return Promise.resolve($.ajax({
+      dataType: 'json',
+      url: manifest.files[name]
+    }));
+  }).catch(fromView);
+}
+
+var bundle = null;
+
+/**
+ * Load the bundle of every forecast on the pages (see make_bundle_json in
+ * statistics.py) once, as published or else from the view, so switching
+ * forecaster or type needs no further request.
+ * @param {string} url   the bundle view's URL
+ * @param {string} today the server's date (see loadPublished)
+ * @return {Promise}     the bundle
+ */
+function loadBundle(url, today) {
+  if (!bundle) {
+    bundle = loadPublished('bundle', today, function () {
+      return Promise.resolve($.ajax({dataType: 'json', url: url}));
+    });
+    bundle.catch(function () { bundle = null; });
+  }
+  return bundle;
+}
@@ -5,17 +5,24 @@ These functions deal with:
   -- Creating the JSON string to be returned to the Web Site.
 """
 
+import collections
 import datetime
 import math
 import random
 
+from django.db import connection
 from django.db.models import Max, Min
 
-from . import data_loader
+from . import forecasts
 from . import histogram
 from . import models
+from . import singleflight
+from . import snapshot
 from . import utilities
 
+# The forecasters on the pages
+PAGE_SOURCES = ['html', 'api', 'jpeg', 'jpeg3']
+
 
 def get_statistics_per_day(bins):
     """Get the statistics from a collection of bins.
@@ -28,19 +35,36 @@ def get_statistics_per_day(bins):
     >>> get_statistics_per_day(bins)
     (2.0, 0.6324555320336759)
     """
-    total = sum([ebin.quantity for ebin in bins])
+    return get_statistics_of_counts([(ebin.error, ebin.quantity)
+                                     for ebin in bins])
+
+
+def get_statistics_of_counts(counts):
+    """Get the statistics from (error, quantity) pairs, as
+          get_statistics_per_day() does from bins.
+
+    >>> get_statistics_of_counts([(1, 1), (3, 1)])
+    (2.0, 1.4142135623730951)
+    """
+    total = sum([quantity for _, quantity in counts])
     if total <= 1:    # Avoids a div by zero error; stats are nulled out.
         return 0, 0
-    mean = sum([ebin.error * ebin.quantity for ebin in bins]) / total
-    variance = sum([(ebin.error - mean)**2 * ebin.quantity for ebin in bins])
+    mean = sum([error * quantity for error, quantity in counts]) / total
+    variance = sum([(error - mean)**2 * quantity
+                    for error, quantity in counts])
     std = math.sqrt(variance / (total - 1))
     return mean, std
 
 
+@singleflight.single_flight
 def get_statistics(source_str, location, mtype):
     """Main function to collect statistics for application to the forecast
          points on the web-site.
 
+    Identical calls in a process run once at a time and share the result,
+      and only one worker populates a stale histogram (see
+      singleflight.py).
+
     >>> from . import load_test_records
     >>> load_test_records.histo_loader()
     >>> get_statistics('api', 'PDX', 'max')
@@ -52,39 +76,137 @@ def get_statistics(source_str, location, mtype):
     means = {}
     stds = {}
     for day in range(models.SOURCES[source_str]['length']):
-        latest_bin = histogram.get_latest_histogram_bin(source_str, location,
-                                                        mtype, day)
-        latest_day = histogram.get_latest_matching_day(source_str, location,
-                                                       day, latest_bin)
-        if latest_day > latest_bin:
-            histogram.populate_histogram(source_str, location, mtype,
-                                         day, latest_bin)
+        histogram.refresh_histogram(source_str, location, mtype, day)
         bins = histogram.get_all_bins(source_str, location, mtype, day)
         means[day], stds[day] = get_statistics_per_day(bins)
     return means, stds
 
 
+def get_bulk_statistics(sources, location):
+    """Collect the statistics of every type of several sources at once, as
+          {(source, mtype): (means, stds)}, from one read of their bins.
+
+    Unlike get_statistics(), the histograms are not brought up to date
+      first:  the loader does so for every location after each ingest (see
+      histogram.refresh_all_histograms()).
+
+    >>> from . import load_test_records
+    >>> load_test_records.histo_loader()
+    >>> stats = get_bulk_statistics(['api', 'html'], 'PDX')
+    >>> stats['api', 'max'] == get_statistics('api', 'PDX', 'max')
+    True
+    >>> stats['html', 'min'] == get_statistics('html', 'PDX', 'min')
+    True
+    """
+    counts = collections.defaultdict(list)
+    ebins = models.ErrorBin.objects.filter(
+        member_of_hist__location=location,
+        member_of_hist__source__in=sources
+    ).order_by('pk').values_list(
+        'member_of_hist__source', 'member_of_hist__mtype',
+        'member_of_hist__day_in_advance', 'error', 'quantity')
+    for source_str, mtype, day, error, quantity in ebins:
+        counts[source_str, mtype, day].append((error, quantity))
+    stats = {}
+    for source_str in sources:
+        for mtype in models.TYPES:
+            means = {}
+            stds = {}
+            for day in range(models.SOURCES[source_str]['length']):
+                means[day], stds[day] = get_statistics_of_counts(
+                    counts[source_str, mtype, day])
+            stats[source_str, mtype] = means, stds
+    return stats
+
+
+def get_worst_predictions(source, location, mtype, count=3):
+    """Return the worst forecasts, ranked by error, for each day in advance.
+
+    Forecasts are joined to the actual records in one query, and the error
+      (forecast - actual, as in the histograms) is computed and ranked in
+      SQL (a window function:  SQLite 3.25 or PostgreSQL).
+    Returns a dict with keys as day in advance, values as a list of up to
+      count records, worst first.  Ties go to the most recent date.
+
+    >>> from . import load_test_records
+    >>> load_test_records.record_loader()
+    >>> models.DayRecord(date_reference=datetime.date(2016, 7, 5),
+    ... day_in_advance=1, source='api', max_temp=90, min_temp=50).save()
+    >>> worst = get_worst_predictions('api', 'PDX', 'max', 2)
+    >>> for day, records in sorted(worst.items()):
+    ...   for record in records:
+    ...     print(day, sorted(record.items()))
+    ...   # doctest: +NORMALIZE_WHITESPACE
+    0 [('actual', 76), ('date', datetime.date(2016, 7, 12)), ('error', -2),
+       ('forecast', 74), ('predict_date', datetime.date(2016, 7, 12))]
+    0 [('actual', 76), ('date', datetime.date(2016, 7, 11)), ('error', -2),
+       ('forecast', 74), ('predict_date', datetime.date(2016, 7, 11))]
+    1 [('actual', 76), ('date', datetime.date(2016, 7, 5)), ('error', 14),
+       ('forecast', 90), ('predict_date', datetime.date(2016, 7, 4))]
+    1 [('actual', 76), ('date', datetime.date(2016, 7, 12)), ('error', -1),
+       ('forecast', 75), ('predict_date', datetime.date(2016, 7, 11))]
+    2 [('actual', 76), ('date', datetime.date(2016, 7, 12)), ('error', 0),
+       ('forecast', 76), ('predict_date', datetime.date(2016, 7, 10))]
+    2 [('actual', 76), ('date', datetime.date(2016, 7, 11)), ('error', 0),
+       ('forecast', 76), ('predict_date', datetime.date(2016, 7, 9))]
+    >>> get_worst_predictions('api', 'PDX', 'rain')
+    Traceback (most recent call last):
+    ...
+    ValueError: Type not correct.  Got rain
+    """
+    if mtype not in models.TYPES:
+        raise ValueError('Type not correct.  Got {}'.format(mtype))
+    temp_column = '{}_temp'.format(mtype)
+    # Rank each day in advance's errors in SQL, so only count rows come back
+    query = (
+        'SELECT day_in_advance, date_reference, forecast, actual, error '
+        'FROM (SELECT f.day_in_advance, f.date_reference, '
+        'f.{col} AS forecast, a.{col} AS actual, f.{col} - a.{col} AS error, '
+        'ROW_NUMBER() OVER (PARTITION BY f.day_in_advance '
+        'ORDER BY ABS(f.{col} - a.{col}) DESC, f.date_reference DESC) '
+        'AS error_rank '
+        'FROM {fcst} f INNER JOIN {act} a ON a.date_meas = f.date_reference '
+        'WHERE f.source = %s AND a.location = %s) ranked '
+        '{limit}ORDER BY day_in_advance, error_rank'
+    ).format(col=temp_column,
+             fcst=models.DayRecord._meta.db_table,
+             act=models.ActualDayRecord._meta.db_table,
+             limit='' if count is None else 'WHERE error_rank <= %s ')
+    params = [source, location] + ([] if count is None else [count])
+    worst = {}
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        for day, date, forecast, actual, error in cursor:
+            worst.setdefault(day, []).append({
+                'date': date,
+                'predict_date': date - datetime.timedelta(day),
+                'forecast': forecast,
+                'actual': actual,
+                'error': error
+            })
+    return worst
+
+
 def get_worst_prediction(source, location, mtype, day_in_advance):
-    """  """
-    histo = histogram.get_histogram(source, location, mtype, day_in_advance)
-    ebins = histogram.get_all_bins(source, location, mtype, day_in_advance)
-    worst_error = find_max_error(ebins)
-    ebin_day = histo.errorbin_set.get(error=worst_error).end_date
-    act = models.ActualDayRecord.objects.get(
-        date_meas=ebin_day,
-        location=location
-    )
-    predict = models.DayRecord.objects.get(
-        source=source,
-        day_in_advance=day_in_advance,
-        date_reference=ebin_day
-    )
-    print('Date: {}, Actual Max: {}, Predict Max: {} on {}'.format(
-        ebin_day, act.max_temp, predict.max_temp,
-        ebin_day - datetime.timedelta(day_in_advance)))
-    print('Date: {}, Actual Min: {}, Predict Min: {} on {}'.format(
-        ebin_day, act.min_temp, predict.min_temp,
-        ebin_day - datetime.timedelta(day_in_advance)))
+    """Print the worst forecast(s) for one day in advance.
+
+    Every occurrence of the worst error is shown, not just the latest one.
+
+    >>> from . import load_test_records
+    >>> load_test_records.record_loader()
+    >>> models.DayRecord(date_reference=datetime.date(2016, 7, 5),
+    ... day_in_advance=1, source='api', max_temp=90, min_temp=50).save()
+    >>> get_worst_prediction('api', 'PDX', 'max', 1)
+    Date: 2016-07-05, Actual Max: 76, Predict Max: 90 on 2016-07-04
+    """
+    worst = get_worst_predictions(source, location, mtype,
+                                  count=None).get(day_in_advance, [])
+    for record in worst:
+        if abs(record['error']) < abs(worst[0]['error']):
+            break
+        print('Date: {}, Actual {}: {}, Predict {}: {} on {}'.format(
+            record['date'], mtype.title(), record['actual'],
+            mtype.title(), record['forecast'], record['predict_date']))
 
 
 def obfuscate_forecast(forecast, start_date):
@@ -137,15 +259,22 @@ def make_json_of_forecast(forecast, means, stds, source_strt, start_date):
     return json
 
 
-def return_json_of_forecast(source, mtype):
+def return_json_of_forecast(source, mtype, location=models.DEFAULT_LOCATION):
     """Main function to return a JSON object containing the dates, forecast temp
          points and the statistical spread.
+
+    The spread comes from the error histograms of the measurement location.
+    Both come from today's snapshot, if there is one (see snapshot.py).
     """
-    location = 'PDX'
     start_date = datetime.date.today()
-    forecast = data_loader.get_forecast(source, mtype, start_date)
+    current = snapshot.get_snapshot(today=start_date)
+    if current is None:
+        forecast = forecasts.get_forecast(source, mtype, start_date)
+        means, stds = get_statistics(source, location, mtype)
+    else:
+        forecast = current.get_forecast(source, mtype)
+        means, stds = current.get_statistics(source, location, mtype)
     forecast = obfuscate_forecast(forecast, start_date)
-    means, stds = get_statistics(source, location, mtype)
     json = make_json_of_forecast(forecast, means, stds, source, start_date)
     return json
 
@@ -161,6 +290,8 @@ def get_start_bin_date(ebins, start_date):
     datetime.date(2016, 6, 1)
     """
     bin_start = ebins.aggregate(Min('start_date'))['start_date__min']
+    if bin_start is None:
+        return start_date
     return min([bin_start, start_date])
 
 
@@ -175,6 +306,8 @@ def get_end_bin_date(ebins, end_date):
     datetime.date(2016, 8, 1)
     """
     bin_end = ebins.aggregate(Max('end_date'))['end_date__max']
+    if bin_end is None:
+        return end_date
     return max([bin_end, end_date])
 
 
@@ -186,72 +319,162 @@ def find_max_error(ebins):
     >>> ebins = histogram.get_all_bins('api', 'PDX', 'min', 2)
     >>> find_max_error(ebins)
     3.0
+    >>> find_max_error(histogram.get_all_bins('api', 'TRO', 'min', 2))
+    0
     """
     max_pos_error = ebins.aggregate(Max('error'))['error__max']
     max_neg_error = ebins.aggregate(Min('error'))['error__min']
+    if max_pos_error is None:
+        return 0
     return utilities.find_abs_largest([max_pos_error, max_neg_error])
 
 
-def make_stats_json(source_str, mtype):
-    """Get the stats JSON
+def make_stats_json(source_str, mtype, location=models.DEFAULT_LOCATION):
+    """Get the stats JSON for a source, measured at a location.
 
     >>> from . import load_test_records
     >>> load_test_records.histo_loader()
+    >>> models.ActualDayRecord(date_meas=datetime.date(2016, 7, 5),
+    ... location='PDX', max_temp=76, min_temp=55).save()
+    >>> models.DayRecord(date_reference=datetime.date(2016, 7, 5),
+    ... day_in_advance=1, source='api', max_temp=78, min_temp=55).save()
     >>> json = make_stats_json('api', 'max')
     >>> sorted(json.items())
     ...   # doctest: +ELLIPSIS, +NORMALIZE_WHITESPACE
-    [('end_date', datetime.date(2016, 8, 1)), ('mtype', 'max'),
-    ('source', 'Service B'), ('start_date', datetime.date(2016, 6, 1)),
-    ('stats_by_day', [...])]
+    [('end_date', datetime.date(2016, 8, 1)), ('location', 'PDX'),
+     ('mtype', 'max'), ('source', 'Service B'),
+     ('start_date', datetime.date(2016, 6, 1)), ('stats_by_day', [...])]
     >>> for day in json['stats_by_day']:
-    ...   sorted(day.items())
+    ...   sorted((k, v) for k, v in day.items() if k != 'worst')
+    ...   # doctest: +NORMALIZE_WHITESPACE
     [('day', 0), ('max', 3.0), ('mean', 2.0), ('std', 0.6324555320336759)]
     [('day', 1), ('max', 3.0), ('mean', 2.0), ('std', 0.6324555320336759)]
     [('day', 2), ('max', 3.0), ('mean', 2.0), ('std', 0.6324555320336759)]
     [('day', 3), ('max', 3.0), ('mean', 2.0), ('std', 0.6324555320336759)]
     [('day', 4), ('max', 3.0), ('mean', 2.0), ('std', 0.6324555320336759)]
+    >>> for day in json['stats_by_day']:
+    ...   print(day['day'], [sorted(rec.items()) for rec in day['worst']])
+    ...   # doctest: +NORMALIZE_WHITESPACE
+    0 []
+    1 [[('actual', 76), ('date', datetime.date(2016, 7, 5)), ('error', 2),
+        ('forecast', 78), ('predict_date', datetime.date(2016, 7, 4))]]
+    2 []
+    3 []
+    4 []
     """
     end_date = datetime.date(2016, 5, 1)
     start_date = datetime.date(2116, 6, 1)
     stats_by_day = []
-    mean, std = get_statistics(source_str, 'PDX', mtype)
+    mean, std = get_statistics(source_str, location, mtype)
+    worst = get_worst_predictions(source_str, location, mtype)
     for day in range(models.SOURCES[source_str]['length']):
-        ebins = histogram.get_all_bins(source_str, 'PDX', mtype, day)
+        ebins = histogram.get_all_bins(source_str, location, mtype, day)
         start_date = get_start_bin_date(ebins, start_date)
         end_date = get_end_bin_date(ebins, end_date)
         record_by_day = {
             'day': day,
             'mean': mean[day],
             'std': std[day],
-            'max': find_max_error(ebins)
+            'max': find_max_error(ebins),
+            'worst': worst.get(day, [])
         }
         stats_by_day.append(record_by_day)
     return {
         'source': models.SOURCES[source_str]['alias'],
         'mtype': mtype,
+        'location': location,
         'stats_by_day': stats_by_day,
         'start_date': start_date,
         'end_date': end_date
         }
 
 
-def make_graph_json(mtype):
-    """Return the json item for all forecasts."""
-    start_date = datetime.date.today()
-    forecast = {}
-    for source in ['html', 'api', 'jpeg', 'jpeg3']:
-        forecast[source] = data_loader.get_forecast(source, mtype, start_date)
+def make_graph_rows(forecast, start_date):
+    """Make the graph's rows, a day's forecasts (by source alias) each, from
+          {source: forecast}.
+
+    >>> make_graph_rows({'api': {0: 83, 1: 81}}, datetime.date(2016, 8, 1)
+    ...                 )[:3]   # doctest: +NORMALIZE_WHITESPACE
+    [{'date': '2016-08-01', 'Service_B': 83},
+     {'date': '2016-08-02', 'Service_B': 81}, {'date': '2016-08-03'}]
+    """
     json = []
     for ddate in range(7):
         day_record = {'date': str(start_date + datetime.timedelta(ddate))[:10]}
-        for source in ['html', 'api', 'jpeg', 'jpeg3']:
-            if ddate in forecast[source]:
+        for source in PAGE_SOURCES:
+            if ddate in forecast.get(source, {}):
                 source_name = models.SOURCES[source]['alias'].replace(' ','_')
                 day_record[source_name] = forecast[source][ddate]
         json.append(day_record)
     return json
 
 
+def make_graph_json(mtype):
+    """Return the json item for all forecasts."""
+    start_date = datetime.date.today()
+    current = snapshot.get_snapshot(today=start_date)
+    forecast = {}
+    for source in PAGE_SOURCES:
+        if current is None:
+            forecast[source] = forecasts.get_forecast(source, mtype,
+                                                      start_date)
+        else:
+            forecast[source] = current.get_forecast(source, mtype)
+    return make_graph_rows(forecast, start_date)
+
+
+def make_bundle_json(location=models.DEFAULT_LOCATION):
+    """Return every forecast on the pages in one JSON object:
+          {'forecasts': {source: {mtype: rows}}, 'graph': {mtype: rows}},
+          the rows being those of return_json_of_forecast() and
+          make_graph_json().
+
+    The forecasts and statistics come from today's snapshot, if there is
+      one, or else from one read each of the forecasts and the bins (see
+      forecasts.get_forecasts() and get_bulk_statistics()).
+
+    >>> from . import load_test_records
+    >>> load_test_records.histo_loader()
+    >>> today = datetime.date.today()
+    >>> for source in PAGE_SOURCES:
+    ...   for day in range(models.SOURCES[source]['length']):
+    ...     models.DayRecord(date_reference=today + datetime.timedelta(day),
+    ...     day_in_advance=day, source=source, max_temp=80, min_temp=50
+    ...     ).save()
+    >>> bundle = make_bundle_json()
+    >>> bundle['forecasts']['api']['min'] == return_json_of_forecast('api',
+    ...                                                              'min')
+    True
+    >>> bundle['graph']['max'] == make_graph_json('max')
+    True
+    """
+    start_date = datetime.date.today()
+    current = snapshot.get_snapshot(today=start_date)
+    if current is None:
+        forecast = forecasts.get_forecasts(PAGE_SOURCES, start_date)
+        stats = get_bulk_statistics(PAGE_SOURCES, location)
+    else:
+        forecast = {source: {mtype: current.get_forecast(source, mtype)
+                             for mtype in models.TYPES}
+                    for source in PAGE_SOURCES}
+        stats = {(source, mtype): current.get_statistics(source, location,
+                                                         mtype)
+                 for source in PAGE_SOURCES for mtype in models.TYPES}
+    bundle = {'forecasts': {source: {} for source in PAGE_SOURCES},
+              'graph': {}}
+    for mtype in models.TYPES:
+        for source in PAGE_SOURCES:
+            means, stds = stats[source, mtype]
+            obfuscated = obfuscate_forecast(dict(forecast[source][mtype]),
+                                            start_date)
+            bundle['forecasts'][source][mtype] = make_json_of_forecast(
+                obfuscated, means, stds, source, start_date)
+        bundle['graph'][mtype] = make_graph_rows(
+            {source: forecast[source][mtype] for source in PAGE_SOURCES},
+            start_date)
+    return bundle
+
+
 def main():
     source_str = 'api'
     for day_in_adv in range(models.SOURCES[source_str]['length']):
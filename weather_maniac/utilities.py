@@ -1,8 +1,16 @@
 #!/usr/bin/env python
 
+import bisect
 import datetime
 import math
 
+import pytz
+
+from . import settings
+
+# Days of local midnights worked out at a time when retiming
+RETIME_DAYS = 16
+
 
 def round_down_day(ref_day):
     """Returns day, resetting time to midnight.
@@ -12,18 +20,87 @@ def round_down_day(ref_day):
     return ref_day.replace(hour=0, minute=0, second=0, microsecond=0)
 
 
-def calc_days_in_adv(predict_date, forecast_utc):
+def calc_days_in_adv(predict_date, forecast_utc, time_zone=None):
     """Returns calendar days in advance, converting second argument from UTC.
 
+    The calendar is that of time_zone (by default settings.TIME_ZONE, where
+      the forecasts are for), not that of the server.
+
     >>> calc_days_in_adv(datetime.date(2016, 6, 11), 1466553600 )
     10
+    >>> calc_days_in_adv(datetime.date(2016, 6, 11), 1466553600, 'UTC')
+    11
     """
-    # predict_date = predict_date
-    forcst_date = datetime.datetime.fromtimestamp(forecast_utc).date()
-    # forcst_date = round_down_day(forcst_date)
+    local_zone = pytz.timezone(time_zone or settings.TIME_ZONE)
+    forcst_date = datetime.datetime.fromtimestamp(forecast_utc,
+                                                  local_zone).date()
     return (forcst_date - predict_date).days
 
 
+def get_midnights(first_date, days, time_zone=None):
+    """Returns the epoch time of each local midnight, from first_date's on.
+
+    There are days + 1 of them, bounding days whole days.  Days are not all
+      24 hours long where daylight saving time starts or ends.
+
+    >>> midnights = get_midnights(datetime.date(2016, 11, 5), 3)
+    >>> [(end - start) // 3600 for start, end in zip(midnights, midnights[1:])]
+    [24, 25, 24]
+    """
+    local_zone = pytz.timezone(time_zone or settings.TIME_ZONE)
+    midnight = datetime.time()
+    return [int(local_zone.localize(datetime.datetime.combine(
+                first_date + datetime.timedelta(day), midnight)).timestamp())
+            for day in range(days + 1)]
+
+
+def retime_max_min(points, predict_date, time_zone=None):
+    """Reduce a series of point temperatures to each day's (max, min).
+
+    points are (epoch seconds, temperature) pairs, in any order, and are
+      consumed as they come, so they can be streamed.  Returns a dict with
+      keys as calendar days in advance of predict_date, in time_zone (by
+      default settings.TIME_ZONE).
+    The local midnights are worked out once for a window of days, and each
+      time is put in its day by a binary search of them, rather than
+      converting every time to a local date.  The window is only widened
+      for a time outside it.
+
+    >>> times_utc = [1478329200 + hour * 3600 for hour in range(0, 72, 6)]
+    >>> temps = [50, 45, 60, 52, 48, 44, 58, 50, 41, 43, 55, 49]
+    >>> retime_max_min(zip(times_utc, temps), datetime.date(2016, 11, 5))
+    {0: (60, 45), 1: (58, 41), 2: (55, 43)}
+    >>> retime_max_min([], datetime.date(2016, 11, 5))
+    {}
+    """
+    local_zone = pytz.timezone(time_zone or settings.TIME_ZONE)
+    midnights = []
+    first_date = last_date = None
+    days_to_max_min = {}
+    for time_utc, temp in points:
+        if not midnights or not midnights[0] <= time_utc < midnights[-1]:
+            point_date = datetime.datetime.fromtimestamp(time_utc,
+                                                         local_zone).date()
+            if midnights:
+                first_date = min(first_date, point_date)
+                last_date = max(last_date, point_date)
+            else:
+                first_date = last_date = point_date
+            midnights = get_midnights(
+                first_date, (last_date - first_date).days + RETIME_DAYS,
+                time_zone)
+            offset = (first_date - predict_date).days - 1
+        day = bisect.bisect_right(midnights, time_utc) + offset
+        max_min = days_to_max_min.get(day)
+        if max_min is None:
+            days_to_max_min[day] = [temp, temp]
+        elif temp > max_min[0]:
+            max_min[0] = temp
+        elif temp < max_min[1]:
+            max_min[1] = temp
+    return {day: tuple(max_min) for day, max_min in days_to_max_min.items()}
+
+
 def temp_f(temp_k):
     """Kelvin to Fahrenheit converter.
 
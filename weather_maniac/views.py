@@ -1,11 +1,21 @@
 """weather_maniac Views."""
 
+import datetime
+
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from . import statistics
 from . import models
 
 
+def _get_location(request):
+    """Return the requested measurement location, PDX if none is given."""
+    location = request.GET.get('location', models.DEFAULT_LOCATION)
+    if location not in models.LOCATIONS.values():
+        raise Http404('Unknown location: {}'.format(location))
+    return location
+
+
 def render_index(request):
     """Render the index (landing) page."""
     return render(request, 'weather_maniac/index.html')
@@ -18,23 +28,31 @@ def render_faq(request):
 
 def render_statistics(request):
     """Render the statistics (analysis) page."""
+    location = _get_location(request)
     template_stats = []
     for source in ['html', 'api', 'jpeg', 'jpeg3']:  # TODO: Expand to cover other JPEG's
         for mtype in models.TYPES:
-            record = statistics.make_stats_json(source, mtype)
+            record = statistics.make_stats_json(source, mtype, location)
             template_stats.append(record)
-    template_list = {'stats': template_stats}
+    template_list = {'stats': template_stats, 'location': location}
     return render(request, 'weather_maniac/statistics.html', template_list)
 
 
+def _get_page_context():
+    """Return the context of the pages loading published payloads:  the
+          server's date, which the published manifest must match."""
+    return {'today': datetime.date.today().isoformat()}
+
+
 def render_prediction(request):
     """Render the prediction page."""
-    return render(request, 'weather_maniac/prediction.html')
+    return render(request, 'weather_maniac/prediction.html',
+                  _get_page_context())
 
 
 def render_graph(request):
     """Render the comparison page."""
-    return render(request, 'weather_maniac/graph.html')
+    return render(request, 'weather_maniac/graph.html', _get_page_context())
 
 
 def return_graph_json(request):
@@ -47,5 +65,15 @@ def return_json(request):
     """Return the JSON data for a forecast."""
     fcst_source = request.GET.get('forecaster')
     fcst_type = request.GET.get('mtype')
-    json_data = statistics.return_json_of_forecast(fcst_source, fcst_type)
+    location = _get_location(request)
+    json_data = statistics.return_json_of_forecast(fcst_source, fcst_type,
+                                                   location)
     return JsonResponse(json_data, safe=False)
+
+
+def return_bundle_json(request):
+    """Return the JSON data for every forecast on the pages, in one
+          response."""
+    location = _get_location(request)
+    json_data = statistics.make_bundle_json(location)
+    return JsonResponse(json_data)
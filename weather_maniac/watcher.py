@@ -0,0 +1,207 @@
+"""Weather Maniac data directory watcher.
+
+Rather than waiting for a batch run of file_processor, watch() follows the
+  Data/ drop directories and hands each new file to its ingest function as
+  soon as it has finished being written.
+Changes are followed with Linux inotify (through libc, so nothing needs to be
+  installed); where that is not available the directories are polled.
+A file counts as finished once its size and modification time have stayed
+  the same for `settle` seconds (debouncing), which replaces the batch run's
+  minimum size checks.  With inotify, a file must also have been closed by
+  its writer (or moved into place).
+Files already in the manifest are left alone, so files dropped while the
+  watcher was not running are picked up on start.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+
+from . import file_processor
+from . import manifest
+from . import models
+
+SETTLE_SECONDS = 2.0
+POLL_SECONDS = 5.0
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+logger = logging.getLogger(__name__)
+
+
+def get_ingesters():
+    """Map each Data/ directory to its (file name regex, ingest function)."""
+    return {
+        models.SOURCES['html']['data_path']: (file_processor.DATA_RE,
+                                              file_processor.ingest_html_file),
+        models.SOURCES['api']['data_path']: (file_processor.DATA_RE,
+                                             file_processor.ingest_api_file),
+        models.SOURCES['jpeg']['data_path']: (file_processor.DATA_RE,
+                                              file_processor.ingest_jpeg_file),
+        models.ACTUAL['data_path']: (None, file_processor.ingest_actual_file)
+    }
+
+
+def settle(pending, now, seconds=SETTLE_SECONDS, busy=()):
+    """Return the pending files that have not changed for the given seconds.
+
+    pending maps file name to (size, mtime, time first seen so); it is updated
+      in place, and the settled (or vanished) files are removed from it.
+    Files in busy (still open for writing) are never settled.
+
+    >>> import tempfile
+    >>> file_name = os.path.join(tempfile.mkdtemp(), 'api_1.json')
+    >>> with open(file_name, 'w') as f:
+    ...   _ = f.write('{"list": ')
+    >>> pending = {file_name: None}
+    >>> settle(pending, now=100.0)
+    []
+    >>> with open(file_name, 'a') as f:
+    ...   _ = f.write('[]}')
+    >>> settle(pending, now=101.0)
+    []
+    >>> settle(pending, now=102.5)
+    []
+    >>> settle(pending, now=103.0) == [file_name], pending
+    (True, {})
+    """
+    settled = []
+    for file_name, seen in list(pending.items()):
+        try:
+            stat = os.stat(file_name)
+        except FileNotFoundError:
+            del pending[file_name]
+            continue
+        state = (stat.st_size, stat.st_mtime_ns)
+        if seen is None or seen[:2] != state:
+            pending[file_name] = state + (now,)
+        elif now - seen[2] >= seconds and file_name not in busy:
+            settled.append(file_name)
+            del pending[file_name]
+    return sorted(settled)
+
+
+def _open_inotify(directories):
+    """Start inotify watches, returning (fd, watch descriptor to directory),
+          or None where inotify is not available."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init()
+        if fd < 0:
+            return None
+        watches = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                os.close(fd)
+                return None
+            watches[wd] = directory
+    except (OSError, AttributeError, TypeError):
+        return None
+    return fd, watches
+
+
+def parse_events(buffer, watches):
+    """Convert a read of inotify events to (directory, name, mask).
+
+    A queue overflow is reported as (None, None, mask):  events were lost.
+
+    >>> name = b'api_1.json\\0\\0'
+    >>> buffer = (EVENT_HEADER.pack(1, IN_CLOSE_WRITE, 0, len(name)) + name +
+    ...           EVENT_HEADER.pack(-1, IN_Q_OVERFLOW, 0, 0))
+    >>> events = parse_events(buffer, {1: '/data'})
+    >>> events == [('/data', 'api_1.json', IN_CLOSE_WRITE),
+    ...            (None, None, IN_Q_OVERFLOW)]
+    True
+    """
+    events = []
+    offset = 0
+    while offset + EVENT_HEADER.size <= len(buffer):
+        wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+        offset += EVENT_HEADER.size
+        name = buffer[offset:offset + length].rstrip(b'\0')
+        offset += length
+        if mask & IN_Q_OVERFLOW:
+            events.append((None, None, mask))
+        elif wd in watches and name:
+            events.append((watches[wd], os.fsdecode(name), mask))
+    return events
+
+
+def _queue_new_files(pending, ingesters):
+    """Add every new or changed file in the watched directories to pending."""
+    for directory, (pattern, _) in ingesters.items():
+        for f in manifest.scan_new_files(directory, pattern):
+            pending.setdefault(os.path.join(directory, f), None)
+
+
+def dispatch(file_name, ingesters):
+    """Hand a settled file to its directory's ingest function."""
+    directory, f = os.path.split(file_name)
+    pattern, ingest = ingesters[directory]
+    if (pattern and not pattern.search(f)) or \
+            not manifest.is_new_file(directory, f):
+        return
+    logger.info('ingesting %s', file_name)
+    try:
+        ingest(f)
+    except Exception:
+        # Keep watching; the file is retried if it changes.
+        logger.exception('%s not ingested', file_name)
+
+
+def watch(settle_seconds=SETTLE_SECONDS, poll_seconds=POLL_SECONDS,
+          use_inotify=True, ingesters=None):
+    """Ingest new data files until interrupted."""
+    ingesters = {directory: ingester for directory, ingester
+                 in (ingesters or get_ingesters()).items()
+                 if os.path.isdir(directory)}
+    inotify = _open_inotify(ingesters) if use_inotify else None
+    logger.info('watching %s with %s', ', '.join(sorted(ingesters)),
+                'inotify' if inotify else 'polling')
+    pending = {}
+    writing = set()
+    _queue_new_files(pending, ingesters)
+    last_scan = time.time()
+    try:
+        while True:
+            wait = min(settle_seconds / 2, poll_seconds) if pending \
+                else poll_seconds
+            if inotify:
+                ready, _, _ = select.select([inotify[0]], [], [], wait)
+                if ready:
+                    events = parse_events(os.read(inotify[0], 65536),
+                                          inotify[1])
+                    for directory, f, mask in events:
+                        if directory is None:
+                            _queue_new_files(pending, ingesters)
+                            continue
+                        file_name = os.path.join(directory, f)
+                        pending.setdefault(file_name, None)
+                        if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                            writing.discard(file_name)
+                        else:
+                            writing.add(file_name)
+            else:
+                time.sleep(wait)
+                if time.time() - last_scan >= poll_seconds:
+                    _queue_new_files(pending, ingesters)
+                    last_scan = time.time()
+            writing.intersection_update(pending)
+            for file_name in settle(pending, time.time(), settle_seconds,
+                                    writing):
+                dispatch(file_name, ingesters)
+    finally:
+        if inotify:
+            os.close(inotify[0])